@@ -26,6 +26,13 @@ from app.models.fx_rate import FXRate  # noqa: F401,E402
 from app.models.tag import Tag  # noqa: F401,E402
 from app.models.position_snapshot import PositionSnapshot  # noqa: F401,E402
 from app.models.tax_lot import TaxLot  # noqa: F401,E402
+from app.models.position_state import PositionState  # noqa: F401,E402
+from app.models.latest_price import LatestPrice  # noqa: F401,E402
+from app.models.tax_lot_checkpoint import TaxLotCheckpoint  # noqa: F401,E402
+from app.models.cash_balance import CashBalance  # noqa: F401,E402
+from app.models.share_balance import ShareBalance  # noqa: F401,E402
+from app.models.asset_adjustment_factor import AssetAdjustmentFactor  # noqa: F401,E402
+from app.models.snapshot_watermark import SnapshotWatermark  # noqa: F401,E402
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
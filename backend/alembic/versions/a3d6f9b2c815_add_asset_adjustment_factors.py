@@ -0,0 +1,83 @@
+"""add asset adjustment factors
+
+Revision ID: a3d6f9b2c815
+Revises: f2c7d9a1e456
+Create Date: 2026-10-18 15:00:00.000000
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "a3d6f9b2c815"
+down_revision = "f2c7d9a1e456"
+branch_labels = None
+depends_on = None
+
+_FACTOR = Decimal("0.0000000001")
+
+
+def _as_date(value) -> date:
+    # Raw SELECTs return ISO strings on SQLite.
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _backfill() -> None:
+    bind = op.get_bind()
+    # Processed splits were rescaled into the ledger by the old processor.
+    bind.execute(
+        sa.text(
+            "UPDATE corporate_actions SET history_rewritten = :rewritten "
+            "WHERE processed_at IS NOT NULL AND type != 'DRIP'"
+        ),
+        {"rewritten": True},
+    )
+    actions = bind.execute(
+        sa.text(
+            "SELECT asset_id, date, numerator, denominator FROM corporate_actions "
+            "WHERE processed_at IS NULL AND numerator > 0 AND denominator > 0 ORDER BY asset_id, date, id"
+        )
+    )
+    steps: dict[int, dict[date, Decimal]] = defaultdict(dict)
+    factors: dict[int, Decimal] = defaultdict(lambda: Decimal(1))
+    for asset_id, on, numerator, denominator in actions:
+        factors[asset_id] *= Decimal(numerator) / Decimal(denominator)
+        steps[asset_id][_as_date(on)] = factors[asset_id]
+
+    rows = [
+        {"asset_id": asset_id, "date": on, "factor": factor.quantize(_FACTOR, ROUND_HALF_UP)}
+        for asset_id, by_date in steps.items()
+        for on, factor in by_date.items()
+    ]
+    if rows:
+        table = sa.table(
+            "asset_adjustment_factors",
+            sa.column("asset_id", sa.Integer()),
+            sa.column("date", sa.Date()),
+            sa.column("factor", sa.Numeric(24, 10)),
+        )
+        op.bulk_insert(table, rows)
+
+
+def upgrade() -> None:
+    op.add_column(
+        "corporate_actions",
+        sa.Column("history_rewritten", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.create_table(
+        "asset_adjustment_factors",
+        sa.Column("asset_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("factor", sa.Numeric(24, 10), nullable=False),
+        sa.ForeignKeyConstraint(["asset_id"], ["assets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("asset_id", "date"),
+    )
+    _backfill()
+
+
+def downgrade() -> None:
+    op.drop_table("asset_adjustment_factors")
+    op.drop_column("corporate_actions", "history_rewritten")
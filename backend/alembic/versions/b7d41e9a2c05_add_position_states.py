@@ -0,0 +1,40 @@
+"""add position states
+
+Revision ID: b7d41e9a2c05
+Revises: ab31c1f5d6e2
+Create Date: 2026-10-18 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "b7d41e9a2c05"
+down_revision = "ab31c1f5d6e2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "position_states",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("asset_id", sa.Integer(), nullable=False),
+        sa.Column("shares", sa.Numeric(precision=18, scale=6), nullable=False, server_default="0"),
+        sa.Column("cost_basis", sa.Numeric(precision=18, scale=6), nullable=False, server_default="0"),
+        sa.Column("realized_pnl", sa.Numeric(precision=18, scale=6), nullable=False, server_default="0"),
+        sa.Column("last_event_date", sa.Date(), nullable=False),
+        sa.Column("last_event_rank", sa.Integer(), nullable=False),
+        sa.Column("last_event_id", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.ForeignKeyConstraint(["asset_id"], ["assets.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["portfolio_id"], ["portfolios.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("portfolio_id", "asset_id", name="uq_position_state_portfolio_asset"),
+    )
+    op.create_index("ix_position_state_asset", "position_states", ["asset_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_position_state_asset", table_name="position_states")
+    op.drop_table("position_states")
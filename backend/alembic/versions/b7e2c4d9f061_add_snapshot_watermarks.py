@@ -0,0 +1,29 @@
+"""add snapshot watermarks
+
+Revision ID: b7e2c4d9f061
+Revises: a3d6f9b2c815
+Create Date: 2026-10-18 16:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "b7e2c4d9f061"
+down_revision = "a3d6f9b2c815"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "snapshot_watermarks",
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("dirty_from", sa.Date(), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["portfolio_id"], ["portfolios.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("portfolio_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("snapshot_watermarks")
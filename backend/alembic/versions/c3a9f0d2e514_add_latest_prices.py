@@ -0,0 +1,40 @@
+"""add latest prices
+
+Revision ID: c3a9f0d2e514
+Revises: b7d41e9a2c05
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "c3a9f0d2e514"
+down_revision = "b7d41e9a2c05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "latest_prices",
+        sa.Column("asset_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("close", sa.Numeric(precision=18, scale=6), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.ForeignKeyConstraint(["asset_id"], ["assets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("asset_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO latest_prices (asset_id, date, close)
+        SELECT ph.asset_id, ph.date, ph.close
+        FROM price_history ph
+        JOIN (
+            SELECT asset_id, MAX(date) AS max_date FROM price_history GROUP BY asset_id
+        ) latest ON latest.asset_id = ph.asset_id AND latest.max_date = ph.date
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("latest_prices")
@@ -0,0 +1,30 @@
+"""delta-encode position snapshots between keyframes
+
+Revision ID: c4e8a1f7d293
+Revises: b7e2c4d9f061
+Create Date: 2026-10-18 18:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "c4e8a1f7d293"
+down_revision = "b7e2c4d9f061"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing snapshots hold every position, so they all become keyframes.
+    op.add_column(
+        "position_snapshots",
+        sa.Column("is_keyframe", sa.Boolean(), nullable=False, server_default=sa.true()),
+    )
+
+
+def downgrade() -> None:
+    # Delta dates cannot be read without their keyframe; only the full snapshots are kept.
+    op.get_bind().execute(
+        sa.text("DELETE FROM position_snapshots WHERE is_keyframe = :keyframe"), {"keyframe": False}
+    )
+    op.drop_column("position_snapshots", "is_keyframe")
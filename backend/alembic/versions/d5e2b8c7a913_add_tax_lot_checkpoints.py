@@ -0,0 +1,34 @@
+"""add tax lot checkpoints
+
+Revision ID: d5e2b8c7a913
+Revises: c3a9f0d2e514
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "d5e2b8c7a913"
+down_revision = "c3a9f0d2e514"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tax_lot_checkpoints",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("asset_id", sa.Integer(), nullable=False),
+        sa.Column("checkpoint_date", sa.Date(), nullable=False),
+        sa.Column("open_lots", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.ForeignKeyConstraint(["asset_id"], ["assets.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["portfolio_id"], ["portfolios.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("portfolio_id", "asset_id", "checkpoint_date", name="uq_tax_lot_checkpoint_date"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("tax_lot_checkpoints")
@@ -0,0 +1,25 @@
+"""add portfolio ledger revision
+
+Revision ID: e1b6c3d8f420
+Revises: c4e8a1f7d293
+Create Date: 2026-10-19 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "e1b6c3d8f420"
+down_revision = "c4e8a1f7d293"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "portfolios",
+        sa.Column("ledger_revision", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("portfolios", "ledger_revision")
@@ -0,0 +1,42 @@
+"""add cash balances
+
+Revision ID: e8f1a4c6b302
+Revises: d5e2b8c7a913
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "e8f1a4c6b302"
+down_revision = "d5e2b8c7a913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_cashtxn_account_date", "cash_transactions", ["account_id", "date"], unique=False)
+    op.create_table(
+        "cash_balances",
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("balance", sa.Numeric(18, 6), nullable=False),
+        sa.ForeignKeyConstraint(["account_id"], ["accounts.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("account_id", "date"),
+    )
+    op.execute(
+        """
+        INSERT INTO cash_balances (account_id, date, balance)
+        SELECT account_id, date, SUM(day_total) OVER (PARTITION BY account_id ORDER BY date)
+        FROM (
+            SELECT account_id, date, SUM(amount) AS day_total
+            FROM cash_transactions
+            GROUP BY account_id, date
+        ) AS daily
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cash_balances")
+    op.drop_index("ix_cashtxn_account_date", table_name="cash_transactions")
@@ -0,0 +1,99 @@
+"""add share balances
+
+Revision ID: f2c7d9a1e456
+Revises: e8f1a4c6b302
+Create Date: 2026-10-18 13:00:00.000000
+"""
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f2c7d9a1e456"
+down_revision = "e8f1a4c6b302"
+branch_labels = None
+depends_on = None
+
+_UNITS = Decimal("0.0000000001")
+
+
+def _as_date(value) -> date:
+    # Raw SELECTs return ISO strings on SQLite.
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _backfill() -> None:
+    bind = op.get_bind()
+    factors: dict[int, list[tuple]] = defaultdict(list)
+    actions = bind.execute(
+        sa.text(
+            "SELECT asset_id, date, numerator, denominator FROM corporate_actions "
+            "WHERE processed_at IS NULL AND numerator > 0 AND denominator > 0 ORDER BY asset_id, date, id"
+        )
+    )
+    for asset_id, on, numerator, denominator in actions:
+        series = factors[asset_id]
+        factor = (series[-1][1] if series else Decimal(1)) * Decimal(numerator) / Decimal(denominator)
+        series.append((_as_date(on), factor))
+
+    moves: dict[tuple[int, int], dict] = defaultdict(lambda: defaultdict(Decimal))
+    trades = bind.execute(
+        sa.text(
+            "SELECT portfolio_id, asset_id, trade_date, side, SUM(quantity) FROM trades "
+            "GROUP BY portfolio_id, asset_id, trade_date, side"
+        )
+    )
+    for portfolio_id, asset_id, on, side, quantity in trades:
+        shares = Decimal(str(quantity))
+        moves[(portfolio_id, asset_id)][_as_date(on)] += shares if side == "BUY" else -shares
+    divs = bind.execute(
+        sa.text(
+            "SELECT portfolio_id, asset_id, date, SUM(shares) FROM cash_transactions "
+            "WHERE type = 'DIVIDEND_STOCK' AND asset_id IS NOT NULL AND shares IS NOT NULL "
+            "GROUP BY portfolio_id, asset_id, date"
+        )
+    )
+    for portfolio_id, asset_id, on, shares in divs:
+        moves[(portfolio_id, asset_id)][_as_date(on)] += Decimal(str(shares))
+
+    rows = []
+    for (portfolio_id, asset_id), by_date in moves.items():
+        units = Decimal(0)
+        for on in sorted(by_date):
+            factor = Decimal(1)
+            for action_date, cumulative in factors.get(asset_id, []):
+                if action_date > on:
+                    break
+                factor = cumulative
+            units += (by_date[on] / factor).quantize(_UNITS)
+            rows.append({"portfolio_id": portfolio_id, "asset_id": asset_id, "date": on, "units": units})
+    if rows:
+        table = sa.table(
+            "share_balances",
+            sa.column("portfolio_id", sa.Integer()),
+            sa.column("asset_id", sa.Integer()),
+            sa.column("date", sa.Date()),
+            sa.column("units", sa.Numeric(24, 10)),
+        )
+        op.bulk_insert(table, rows)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "share_balances",
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("asset_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("units", sa.Numeric(24, 10), nullable=False),
+        sa.ForeignKeyConstraint(["asset_id"], ["assets.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["portfolio_id"], ["portfolios.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("portfolio_id", "asset_id", "date"),
+    )
+    _backfill()
+
+
+def downgrade() -> None:
+    op.drop_table("share_balances")
@@ -0,0 +1,73 @@
+"""
+Command-line maintenance tasks.
+
+Usage::
+
+    python -m app.cli backfill-snapshots --from 2022-01-01 --to 2024-12-31 [--step day] [--every 1]
+        [--portfolio-id 1 ...] [--workers 4]
+    python -m app.cli compact-snapshots [--before 2024-01-01]
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import date
+
+import app.main  # noqa: F401  (registers every mapped class)
+from app.services.snapshot_backfill import backfill_all_snapshots
+from app.services.snapshot_rematerializer import compact_old_snapshots
+from app.services.snapshot_service import backfill_dates
+
+
+def _backfill_snapshots(args: argparse.Namespace) -> None:
+    if args.from_date > args.to_date:
+        raise SystemExit("--from must be on or before --to")
+    dates = backfill_dates(args.from_date, args.to_date, args.step, args.every)
+    result = backfill_all_snapshots(dates, args.portfolio_ids, args.workers)
+    print(
+        f"Backfilled {result['snapshots']} snapshots over {result['dates']} dates "
+        f"for {result['portfolios']} portfolios"
+    )
+    if result["skipped"]:
+        print(f"Skipped {result['skipped']} portfolios whose ledger changed during the replay; run again")
+
+
+def _compact_snapshots(args: argparse.Namespace) -> None:
+    removed = compact_old_snapshots(args.before)
+    print(f"Removed {removed} snapshot dates")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Investment tracker maintenance tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser(
+        "backfill-snapshots", help="Materialize position snapshots over a date range with one replay per portfolio"
+    )
+    backfill.add_argument("--from", dest="from_date", type=date.fromisoformat, required=True)
+    backfill.add_argument("--to", dest="to_date", type=date.fromisoformat, required=True)
+    backfill.add_argument("--step", choices=["day", "week", "month"], default="day")
+    backfill.add_argument("--every", type=int, default=1, help="Keep every N-th date of the step (default 1)")
+    backfill.add_argument(
+        "--portfolio-id", dest="portfolio_ids", type=int, action="append", help="Repeatable; all portfolios when omitted"
+    )
+    backfill.add_argument("--workers", type=int, default=None, help="Replay processes (default: CPU count)")
+    backfill.set_defaults(handler=_backfill_snapshots)
+
+    compact = commands.add_parser("compact-snapshots", help="Keep only month-end position snapshots before a date")
+    compact.add_argument(
+        "--before", type=date.fromisoformat, default=None, help="Default: snapshot_retention_days before today (nothing when retention is off)"
+    )
+    compact.set_defaults(handler=_compact_snapshots)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    if getattr(args, "every", 1) < 1:
+        raise SystemExit("--every must be at least 1")
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
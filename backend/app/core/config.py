@@ -14,7 +14,40 @@ class Settings(BaseSettings):
     database_url: str = f"sqlite:///{(BASE_DIR.parent / 'data' / 'app.db').as_posix()}"
     app_name: str = "Investment Tracker Backend"
     redis_url: str | None = "redis://localhost:6379/0"
-    cache_ttl_seconds: int = 600
+    # Keep Redis round trips short; a slow cache must never hold up a report.
+    redis_connect_timeout_seconds: float = 0.2
+    redis_socket_timeout_seconds: float = 0.5
+    redis_max_connections: int = 32
+    # Consecutive Redis errors before the cache stops calling it, and the probe interval while open.
+    cache_breaker_failure_threshold: int = 3
+    cache_breaker_cooldown_seconds: float = 30.0
+    # Reports are invalidated on every write they depend on, so the TTL only bounds memory.
+    cache_ttl_seconds: int = 14400
+    # In-process cache tier in front of Redis; its TTL bounds staleness across workers.
+    local_cache_max_bytes: int = 32 * 1024 * 1024
+    local_cache_ttl_seconds: int = 30
+    # How long concurrent misses wait for another worker to fill a key before computing it.
+    cache_lock_timeout_seconds: float = 10.0
+    # Cached payloads at least this large are zlib-compressed in Redis (0 disables).
+    cache_compress_min_bytes: int = 8192
+    cache_compress_level: int = 6
+    # Currency /reports/dashboard converts the cross-portfolio totals into, unless the request names one.
+    dashboard_currency: str = "TWD"
+    # Read current prices from latest_prices (always maintained by /prices/update).
+    use_latest_price_table: bool = True
+    # Events between stored FIFO lot checkpoints (0 disables checkpointing).
+    tax_lot_checkpoint_interval: int = 256
+    # Seconds between background passes rebuilding snapshots a backdated write made stale (0 disables).
+    snapshot_rematerialize_interval_seconds: float = 60.0
+    # Longest range POST /snapshots/backfill queues; longer backfills go through the CLI.
+    snapshot_backfill_max_days: int = 366
+    # Days between full keyframe snapshots; dates in between only store the positions that changed.
+    snapshot_keyframe_days: int = 30
+    # Snapshots older than this many days are thinned to one per month (0, the default, keeps every date).
+    snapshot_retention_days: int = 0
+    # Defaults of /reports/risk: trailing days per rolling volatility point, and the annual risk-free rate.
+    risk_rolling_window_days: int = 30
+    risk_free_rate: float = 0.0
 
     @staticmethod
     def _ensure_sqlite_dir(url: str) -> None:
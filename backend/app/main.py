@@ -1,10 +1,25 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.routers import api_router
+from app.services.cache import cache_health
+from app.services.snapshot_rematerializer import SnapshotRematerializer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rematerializer = SnapshotRematerializer()
+    rematerializer.start()
+    try:
+        yield
+    finally:
+        rematerializer.stop()
+
 
-app = FastAPI(title=settings.app_name)
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,8 +31,9 @@ app.add_middleware(
 
 
 @app.get("/health")
-def health_check() -> dict[str, str]:
-    return {"status": "ok"}
+def health_check() -> dict:
+    # Cache outages degrade to recomputing reports, so they do not fail the health check.
+    return {"status": "ok", "cache": cache_health()}
 
 
 app.include_router(api_router, prefix="/api/v1")
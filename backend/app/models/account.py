@@ -32,3 +32,6 @@ class Account(Base):
     cash_transactions: Mapped[List["CashTransaction"]] = relationship(
         "CashTransaction", back_populates="account"
     )
+    cash_balances: Mapped[List["CashBalance"]] = relationship(
+        "CashBalance", back_populates="account", cascade="all, delete-orphan"
+    )
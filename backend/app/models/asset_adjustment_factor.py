@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class AssetAdjustmentFactor(Base):
+    """
+    Cumulative corporate action factor of an asset, effective from ``date`` onwards.
+
+    ``factor`` is the product of the ratios of every action the replay applies (see
+    ``replay_engine.replayed_actions``) dated on or before ``date``; before the first
+    row the factor is 1. Rebuilt whenever one of the asset's actions changes.
+    """
+
+    __tablename__ = "asset_adjustment_factors"
+
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), primary_key=True)
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    factor: Mapped[Decimal] = mapped_column(Numeric(24, 10), nullable=False)
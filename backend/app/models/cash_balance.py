@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Numeric
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.db.base import Base
+
+
+class CashBalance(Base):
+    """
+    Running cash balance of an account at the end of each day with cash activity.
+
+    ``balance`` is the sum of every cash transaction of the account dated on or before
+    ``date``; it is maintained by the ledger writes, so balance-as-of is one indexed lookup.
+    """
+
+    __tablename__ = "cash_balances"
+
+    account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"), primary_key=True)
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    balance: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+
+    account = relationship("Account", back_populates="cash_balances")
@@ -26,7 +26,10 @@ class CashTxnType(str, Enum):
 
 class CashTransaction(Base):
     __tablename__ = "cash_transactions"
-    __table_args__ = (Index("ix_cashtxn_portfolio_date", "portfolio_id", "date"),)
+    __table_args__ = (
+        Index("ix_cashtxn_portfolio_date", "portfolio_id", "date"),
+        Index("ix_cashtxn_account_date", "account_id", "date"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False)
@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from enum import Enum
 from typing import List
 
-from sqlalchemy import DateTime, Enum as SQLEnum, String, UniqueConstraint
+from sqlalchemy import DateTime, Enum as SQLEnum, Integer, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -27,6 +27,8 @@ class Portfolio(Base):
         default=CostMethod.AVG,
         nullable=False,
     )
+    # Bumped by every ledger write that can change positions; see mark_snapshots_stale.
+    ledger_revision: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
     )
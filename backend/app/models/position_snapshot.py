@@ -3,14 +3,19 @@ from __future__ import annotations
 from datetime import date, datetime, timezone
 from decimal import Decimal
 
-from sqlalchemy import Date, DateTime, ForeignKey, Index, Numeric, UniqueConstraint
+from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Index, Numeric, UniqueConstraint, true
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
 
 
 class PositionSnapshot(Base):
-    """Daily snapshot of holdings used to avoid replaying all historical trades."""
+    """
+    Snapshot of holdings used to avoid replaying all historical trades.
+
+    A keyframe date stores a row for every position; the dates after it only store the
+    positions that changed since the previous snapshot date.
+    """
 
     __tablename__ = "position_snapshots"
     __table_args__ = (
@@ -25,6 +30,7 @@ class PositionSnapshot(Base):
     shares: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
     cost_basis: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
     realized_pnl: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False, default=Decimal("0"))
+    is_keyframe: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True, server_default=true())
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
     )
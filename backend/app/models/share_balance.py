@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class ShareBalance(Base):
+    """
+    Cumulative shares of a (portfolio, asset) at the end of each day with share activity.
+
+    ``units`` are split-normalized: every trade and stock dividend contributes its shares
+    divided by the product of the unprocessed corporate action ratios in effect on its
+    date, so an event shifts all later rows by the same amount. Actual shares on a date
+    are ``units`` times that date's factor (see share_index_service).
+    """
+
+    __tablename__ = "share_balances"
+
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), primary_key=True)
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), primary_key=True)
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    units: Mapped[Decimal] = mapped_column(Numeric(24, 10), nullable=False)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import Date, ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class SnapshotWatermark(Base):
+    """
+    Earliest position snapshot of a portfolio that a ledger write may have made stale.
+
+    Snapshots dated on or after ``dirty_from`` are ignored by reads until the
+    rematerializer rebuilds them and removes the row. ``revision`` is bumped by every
+    mark so the rematerializer only clears a watermark nobody moved while it worked.
+    """
+
+    __tablename__ = "snapshot_watermarks"
+
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), primary_key=True)
+    dirty_from: Mapped[date] = mapped_column(Date, nullable=False)
+    revision: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
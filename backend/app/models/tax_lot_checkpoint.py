@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+
+from sqlalchemy import Date, DateTime, ForeignKey, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class TaxLotCheckpoint(Base):
+    """Open FIFO lots of a (portfolio, asset) after every event up to ``checkpoint_date``."""
+
+    __tablename__ = "tax_lot_checkpoints"
+    __table_args__ = (
+        UniqueConstraint("portfolio_id", "asset_id", "checkpoint_date", name="uq_tax_lot_checkpoint_date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    portfolio_id: Mapped[int] = mapped_column(ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False)
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), nullable=False)
+    checkpoint_date: Mapped[date] = mapped_column(Date, nullable=False)
+    # JSON list of [source, source_id, original_shares, remaining_shares] in FIFO order.
+    open_lots: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
@@ -10,6 +10,7 @@ from app.routers.report import router as report_router
 from app.routers.fx_rate import router as fx_rate_router
 from app.routers.tag import router as tag_router
 from app.routers.corporate_action import router as corporate_action_router
+from app.routers.snapshot import router as snapshot_router
 
 # Root API router to plug future route modules into.
 api_router = APIRouter()
@@ -24,3 +25,4 @@ api_router.include_router(report_router)
 api_router.include_router(fx_rate_router)
 api_router.include_router(tag_router)
 api_router.include_router(corporate_action_router)
+api_router.include_router(snapshot_router)
@@ -10,6 +10,8 @@ from app.models.user import User
 from app.schemas.asset import AssetCreate, AssetRead, AssetUpdate
 from app.routers.utils import handle_integrity_error
 from app.models.tag import Tag
+from app.services.cache import bump_portfolio_generations
+from app.services.cache_invalidation import invalidate_asset, portfolios_holding_asset
 
 router = APIRouter(prefix="/assets", tags=["assets"])
 
@@ -96,6 +98,7 @@ def update_asset(
     except IntegrityError as exc:
         db.rollback()
         handle_integrity_error(exc, "Asset")
+    invalidate_asset(db, asset_id)
     db.refresh(asset)
     return asset
 
@@ -109,6 +112,8 @@ def delete_asset(
     asset = db.get(Asset, asset_id)
     if not asset:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
+    portfolio_ids = portfolios_holding_asset(db, asset_id)
     db.delete(asset)
     db.commit()
+    bump_portfolio_generations(portfolio_ids)
     return None
@@ -16,7 +16,12 @@ from app.schemas.cash_transaction import (
     CashTransactionUpdate,
 )
 from app.routers.utils import handle_integrity_error
-from app.services.cache import cache_delete_pattern
+from app.services.cache import bump_portfolio_generation
+from app.services.cash_ledger_service import adjust_cash_balance, adjust_cash_balances
+from app.services.position_state_service import record_stock_dividend, refresh_position_state
+from app.services.share_index_service import adjust_share_balances, reverse_movements, stock_dividend_movements
+from app.services.tax_lot_service import invalidate_lot_checkpoints
+from app.services.unit_of_work import UnitOfWork
 
 router = APIRouter(prefix="/cash-transactions", tags=["cash-transactions"])
 
@@ -30,6 +35,23 @@ def normalize_amount(txn_type: CashTxnType, amount: Decimal) -> Decimal:
     return amount
 
 
+def _refresh_stock_dividend_states(
+    db: Session, portfolio_id: int, versions: list[tuple[CashTxnType, int | None, date]]
+) -> None:
+    """
+    Replay position state for assets touched by the old/new versions of a stock dividend,
+    and drop FIFO lot checkpoints that no longer match the ledger.
+    """
+    from_dates: dict[int, date] = {}
+    for txn_type, asset_id, txn_date in versions:
+        if txn_type != CashTxnType.DIVIDEND_STOCK or asset_id is None:
+            continue
+        from_dates[asset_id] = min(txn_date, from_dates.get(asset_id, txn_date))
+    for asset_id, from_date in from_dates.items():
+        refresh_position_state(db, portfolio_id, asset_id, from_date)
+        invalidate_lot_checkpoints(db, asset_id, from_date, portfolio_id)
+
+
 @router.get("", response_model=list[CashTransactionRead])
 def list_cash_transactions(
     portfolio_id: int | None = Query(default=None),
@@ -67,14 +89,19 @@ def create_cash_transaction(
     data = payload.model_dump()
     data["amount"] = normalize_amount(payload.type, data["amount"])
     txn = CashTransaction(**data)
-    db.add(txn)
     try:
-        db.commit()
+        with UnitOfWork(db):
+            db.add(txn)
+            db.flush()
+            adjust_cash_balance(db, txn.account_id, txn.date, txn.amount)
+            adjust_share_balances(db, stock_dividend_movements(txn))
+            record_stock_dividend(db, txn)
+            if txn.type == CashTxnType.DIVIDEND_STOCK and txn.asset_id is not None:
+                invalidate_lot_checkpoints(db, txn.asset_id, txn.date, txn.portfolio_id)
     except IntegrityError as exc:
-        db.rollback()
         handle_integrity_error(exc, "CashTransaction")
     db.refresh(txn)
-    cache_delete_pattern(f"cache:portfolio:{txn.portfolio_id}:*")
+    bump_portfolio_generation(txn.portfolio_id)
     return txn
 
 
@@ -89,6 +116,9 @@ def update_cash_transaction(
     if not txn:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cash transaction not found")
 
+    previous = (txn.type, txn.asset_id, txn.date)
+    previous_movement = (txn.account_id, txn.date, txn.amount)
+    previous_shares = stock_dividend_movements(txn)
     updates = payload.model_dump(exclude_unset=True)
     if "amount" in updates or "type" in updates:
         txn_type = updates.get("type", txn.type)
@@ -99,12 +129,16 @@ def update_cash_transaction(
         setattr(txn, field, value)
 
     try:
-        db.commit()
+        with UnitOfWork(db):
+            db.flush()
+            account_id, txn_date, amount = previous_movement
+            adjust_cash_balances(db, [(account_id, txn_date, -amount), (txn.account_id, txn.date, txn.amount)])
+            adjust_share_balances(db, reverse_movements(previous_shares) + stock_dividend_movements(txn))
+            _refresh_stock_dividend_states(db, txn.portfolio_id, [previous, (txn.type, txn.asset_id, txn.date)])
     except IntegrityError as exc:
-        db.rollback()
         handle_integrity_error(exc, "CashTransaction")
     db.refresh(txn)
-    cache_delete_pattern(f"cache:portfolio:{txn.portfolio_id}:*")
+    bump_portfolio_generation(txn.portfolio_id)
     return txn
 
 
@@ -117,7 +151,11 @@ def delete_cash_transaction(
     txn = db.get(CashTransaction, txn_id)
     if not txn:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cash transaction not found")
-    db.delete(txn)
-    db.commit()
-    cache_delete_pattern(f"cache:portfolio:{txn.portfolio_id}:*")
+    with UnitOfWork(db):
+        db.delete(txn)
+        db.flush()
+        adjust_cash_balance(db, txn.account_id, txn.date, -txn.amount)
+        adjust_share_balances(db, reverse_movements(stock_dividend_movements(txn)))
+        _refresh_stock_dividend_states(db, txn.portfolio_id, [(txn.type, txn.asset_id, txn.date)])
+    bump_portfolio_generation(txn.portfolio_id)
     return None
@@ -9,10 +9,19 @@ from app.models.corporate_action import CorporateAction
 from app.models.user import User
 from app.schemas.corporate_action import (
     CorporateActionCreate,
+    CorporateActionProcessResult,
     CorporateActionRead,
     CorporateActionUpdate,
+    DripBatchResult,
 )
 from app.routers.utils import handle_integrity_error
+from app.services.adjustment_service import rebuild_adjustment_factors
+from app.services.cache_invalidation import invalidate_all_portfolios
+from app.services.corporate_action_processor import process_corporate_action, process_pending_drips
+from app.services.position_state_service import refresh_asset_states
+from app.services.share_index_service import rebuild_share_index
+from app.services.tax_lot_service import invalidate_lot_checkpoints
+from app.services.unit_of_work import UnitOfWork
 
 router = APIRouter(prefix="/corporate-actions", tags=["corporate-actions"])
 
@@ -37,16 +46,29 @@ def create_action(
     db: Session = Depends(get_db),
 ) -> CorporateAction:
     action = CorporateAction(**payload.model_dump())
-    db.add(action)
     try:
-        db.commit()
+        with UnitOfWork(db):
+            db.add(action)
+            db.flush()
+            refresh_asset_states(db, action.asset_id, action.date)
+            invalidate_lot_checkpoints(db, action.asset_id)
+            rebuild_adjustment_factors(db, action.asset_id)
+            rebuild_share_index(db, action.asset_id)
     except IntegrityError as exc:
-        db.rollback()
         handle_integrity_error(exc, "CorporateAction")
+    invalidate_all_portfolios(db)
     db.refresh(action)
     return action
 
 
+@router.post("/drip/process", response_model=DripBatchResult)
+def process_drips(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> dict:
+    return process_pending_drips(db)
+
+
 @router.get("/{action_id}", response_model=CorporateActionRead)
 def get_action(
     action_id: int,
@@ -69,13 +91,29 @@ def update_action(
     action = db.get(CorporateAction, action_id)
     if not action:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Corporate action not found")
+    if action.history_rewritten:
+        # Its ratio is already baked into the rescaled trades; editing it would corrupt them.
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Corporate action already applied to history"
+        )
+    previous_asset_id, previous_date = action.asset_id, action.date
     for field, value in payload.model_dump(exclude_unset=True).items():
         setattr(action, field, value)
     try:
-        db.commit()
+        with UnitOfWork(db):
+            db.flush()
+            if previous_asset_id != action.asset_id:
+                refresh_asset_states(db, previous_asset_id, previous_date)
+                invalidate_lot_checkpoints(db, previous_asset_id)
+                rebuild_adjustment_factors(db, previous_asset_id)
+                rebuild_share_index(db, previous_asset_id)
+            refresh_asset_states(db, action.asset_id, min(previous_date, action.date))
+            invalidate_lot_checkpoints(db, action.asset_id)
+            rebuild_adjustment_factors(db, action.asset_id)
+            rebuild_share_index(db, action.asset_id)
     except IntegrityError as exc:
-        db.rollback()
         handle_integrity_error(exc, "CorporateAction")
+    invalidate_all_portfolios(db)
     db.refresh(action)
     return action
 
@@ -89,6 +127,27 @@ def delete_action(
     action = db.get(CorporateAction, action_id)
     if not action:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Corporate action not found")
-    db.delete(action)
-    db.commit()
+    with UnitOfWork(db):
+        db.delete(action)
+        db.flush()
+        refresh_asset_states(db, action.asset_id, action.date)
+        invalidate_lot_checkpoints(db, action.asset_id)
+        rebuild_adjustment_factors(db, action.asset_id)
+        rebuild_share_index(db, action.asset_id)
+    invalidate_all_portfolios(db)
     return None
+
+
+@router.post("/{action_id}/process", response_model=CorporateActionProcessResult)
+def process_action(
+    action_id: int,
+    rewrite_history: bool = Query(default=False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> dict:
+    if not db.get(CorporateAction, action_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Corporate action not found")
+    try:
+        return process_corporate_action(db, action_id, rewrite_history)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
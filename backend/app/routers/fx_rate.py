@@ -9,6 +9,8 @@ from app.models.fx_rate import FXRate
 from app.models.user import User
 from app.schemas.fx_rate import FXRateCreate, FXRateRead, FXRateUpdate
 from app.routers.utils import handle_integrity_error
+from app.services.cache_invalidation import invalidate_currencies
+from app.services.fx_service import invalidate_fx_rates
 
 router = APIRouter(prefix="/fx-rates", tags=["fx-rates"])
 
@@ -42,6 +44,8 @@ def create_fx_rate(
     except IntegrityError as exc:
         db.rollback()
         handle_integrity_error(exc, "FXRate")
+    invalidate_fx_rates(db)
+    invalidate_currencies(db, {fx.from_currency, fx.to_currency})
     db.refresh(fx)
     return fx
 
@@ -68,6 +72,7 @@ def update_fx_rate(
     fx = db.get(FXRate, fx_id)
     if not fx:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FX rate not found")
+    currencies = {fx.from_currency, fx.to_currency}
     for field, value in payload.model_dump(exclude_unset=True).items():
         setattr(fx, field, value)
     try:
@@ -75,6 +80,8 @@ def update_fx_rate(
     except IntegrityError as exc:
         db.rollback()
         handle_integrity_error(exc, "FXRate")
+    invalidate_fx_rates(db)
+    invalidate_currencies(db, currencies | {fx.from_currency, fx.to_currency})
     db.refresh(fx)
     return fx
 
@@ -90,4 +97,6 @@ def delete_fx_rate(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FX rate not found")
     db.delete(fx)
     db.commit()
+    invalidate_fx_rates(db)
+    invalidate_currencies(db, {fx.from_currency, fx.to_currency})
     return None
@@ -9,6 +9,7 @@ from app.models.portfolio import Portfolio
 from app.models.user import User
 from app.schemas.portfolio import PortfolioCreate, PortfolioRead, PortfolioUpdate
 from app.routers.utils import handle_integrity_error
+from app.services.cache import bump_portfolio_generation
 
 router = APIRouter(prefix="/portfolios", tags=["portfolios"])
 
@@ -70,6 +71,7 @@ def update_portfolio(
     except IntegrityError as exc:
         db.rollback()
         handle_integrity_error(exc, "Portfolio")
+    bump_portfolio_generation(portfolio_id)
     db.refresh(portfolio)
     return portfolio
 
@@ -85,4 +87,5 @@ def delete_portfolio(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
     db.delete(portfolio)
     db.commit()
+    bump_portfolio_generation(portfolio_id)
     return None
@@ -1,6 +1,6 @@
 from datetime import date
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy import and_, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
@@ -11,8 +11,10 @@ from app.models.asset import Asset
 from app.models.price_history import PriceHistory
 from app.models.user import User
 from app.schemas.price import PricePoint, PriceUpdateResult
+from app.services.cache_invalidation import invalidate_asset
+from app.services.price_service import get_latest_price_points, get_price_history, refresh_latest_price
 from app.services.pricing import fetch_daily_close
-from app.services.cache import cache_get, cache_set, cache_delete
+from app.services.cache import bump_price_data_version, cache_get_or_compute_body, price_data_version
 from app.core.config import settings
 from app.routers.utils import handle_integrity_error
 
@@ -69,35 +71,51 @@ def update_prices(
             inserted += 1
 
     try:
+        if inserted or updated:
+            db.flush()
+            refresh_latest_price(db, asset_id)
         db.commit()
     except IntegrityError as exc:
         db.rollback()
         handle_integrity_error(exc, "PriceHistory")
 
-    cache_delete(f"cache:price:latest:{asset_id}")
+    if inserted or updated:
+        invalidate_asset(db, asset_id)
+        bump_price_data_version()
     return PriceUpdateResult(inserted=inserted, updated=updated)
 
 
+@router.get("/history", response_model=list[PricePoint])
+def price_history(
+    asset_id: int = Query(...),
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    adjusted: bool = Query(default=False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> list[PricePoint]:
+    if not db.get(Asset, asset_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
+    return [
+        PricePoint(date=price_date, close=close)
+        for price_date, close in get_price_history(db, asset_id, start, end, adjusted)
+    ]
+
+
 @router.get("/latest", response_model=PricePoint)
 def latest_price(
     asset_id: int = Query(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> PricePoint:
-    cache_key = f"cache:price:latest:{asset_id}"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return PricePoint.model_validate(cached)
-
-    stmt = (
-        select(PriceHistory)
-        .where(PriceHistory.asset_id == asset_id)
-        .order_by(PriceHistory.date.desc())
-        .limit(1)
-    )
-    ph = db.execute(stmt).scalars().first()
-    if not ph:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No price data found")
-    result = PricePoint.model_validate(ph)
-    cache_set(cache_key, result.model_dump(mode="json"), ttl_seconds=settings.cache_ttl_seconds)
-    return result
+) -> Response:
+    def _load() -> dict:
+        point = get_latest_price_points(db, [asset_id]).get(asset_id)
+        if point is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No price data found")
+        price_date, close = point
+        return PricePoint(date=price_date, close=close).model_dump(mode="json")
+
+    # Versioned so a price write in any worker makes every worker's cached close unreachable.
+    cache_key = f"cache:price:latest:{asset_id}:{price_data_version()}"
+    body = cache_get_or_compute_body(cache_key, _load, ttl_seconds=settings.cache_ttl_seconds)
+    return Response(content=body, media_type="application/json")
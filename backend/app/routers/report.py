@@ -1,20 +1,51 @@
-from datetime import date
+from datetime import date, datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app.deps import get_current_user
 from app.db.session import get_db
 from app.models.user import User
-from app.schemas.report import PositionOut, PnLSummaryOut
+from app.models.account import Account
+from app.schemas.report import (
+    CashBalancePointOut,
+    DashboardOut,
+    PerformanceOut,
+    PnLSummaryOut,
+    PnLWindowOut,
+    PositionOut,
+    PositionSeriesPointOut,
+    RiskOut,
+    SeriesStep,
+)
+from app.services.cash_ledger_service import get_cash_balance_series
+from app.services.dashboard_service import get_dashboard
+from app.services.performance_service import compute_performance
 from app.services.position_service import get_positions
-from app.services.pnl_service import compute_pnl_summary
-from app.services.cache import cache_get, cache_set
+from app.services.risk_service import compute_risk
+from app.services.timeseries_service import cut_dates, get_position_timeseries
+from app.services.pnl_service import PNL_WINDOWS, compute_pnl_summary, compute_pnl_windows
+from app.services.cache import cache_get_or_compute_body, portfolio_cache_key, price_data_version
 from app.core.config import settings
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
+def _on_or_today(day: date | None) -> date:
+    # Cache keys must name the day a result is for; "today" changes at midnight.
+    return day if day is not None else datetime.now(timezone.utc).date()
+
+
+@router.get("/dashboard", response_model=DashboardOut)
+def dashboard(
+    as_of: date | None = Query(default=None),
+    currency: str | None = Query(default=None, description="Reporting currency of the totals"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> dict:
+    return get_dashboard(db, as_of, currency)
+
+
 @router.get("/positions", response_model=list[PositionOut])
 def positions_report(
     portfolio_id: int = Query(...),
@@ -22,19 +53,41 @@ def positions_report(
     in_base_currency: bool = Query(default=False, description="Convert values to portfolio base currency when possible"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> list[PositionOut]:
-    cache_key = f"cache:portfolio:{portfolio_id}:positions:{as_of}:{int(in_base_currency)}"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return [PositionOut.model_validate(p) for p in cached]
+) -> Response:
+    as_of = _on_or_today(as_of)
+    cache_key = portfolio_cache_key(portfolio_id, "positions", as_of, int(in_base_currency))
+    body = cache_get_or_compute_body(
+        cache_key,
+        lambda: [
+            PositionOut.model_validate(p).model_dump(mode="json")
+            for p in get_positions(db, portfolio_id, as_of, in_base_currency=in_base_currency)
+        ],
+        ttl_seconds=settings.cache_ttl_seconds,
+    )
+    return Response(content=body, media_type="application/json")
 
-    results = [PositionOut.model_validate(p) for p in get_positions(db, portfolio_id, as_of, in_base_currency=in_base_currency)]
-    cache_set(
+
+@router.get("/positions/timeseries", response_model=list[PositionSeriesPointOut])
+def positions_timeseries(
+    portfolio_id: int = Query(...),
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    step: SeriesStep = Query(default=SeriesStep.DAY),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Response:
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from must be on or before to")
+    cache_key = portfolio_cache_key(portfolio_id, "positions_series", from_date, to_date, step.value)
+    body = cache_get_or_compute_body(
         cache_key,
-        [r.model_dump(mode="json") for r in results],
+        lambda: [
+            PositionSeriesPointOut.model_validate(p).model_dump(mode="json")
+            for p in get_position_timeseries(db, portfolio_id, from_date, to_date, step.value)
+        ],
         ttl_seconds=settings.cache_ttl_seconds,
     )
-    return results
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/pnl/summary", response_model=PnLSummaryOut)
@@ -45,15 +98,110 @@ def pnl_summary(
     as_of: date | None = Query(default=None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
-) -> PnLSummaryOut:
+) -> Response:
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from must be on or before to")
+    as_of = _on_or_today(as_of)
+    cache_key = portfolio_cache_key(portfolio_id, "pnl_summary", from_date, to_date, as_of)
+    body = cache_get_or_compute_body(
+        cache_key,
+        lambda: PnLSummaryOut.model_validate(
+            compute_pnl_summary(db, portfolio_id, from_date, to_date, as_of)
+        ).model_dump(mode="json"),
+        ttl_seconds=settings.cache_ttl_seconds,
+    )
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/pnl/windows", response_model=list[PnLWindowOut])
+def pnl_windows(
+    portfolio_id: int = Query(...),
+    windows: str = Query(default=",".join(PNL_WINDOWS), description="Comma-separated: MTD, QTD, YTD, 1Y, ITD"),
+    as_of: date | None = Query(default=None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Response:
+    names = list(dict.fromkeys(name.strip().upper() for name in windows.split(",") if name.strip()))
+    unknown = [name for name in names if name not in PNL_WINDOWS]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"windows must be a list of {', '.join(PNL_WINDOWS)}")
+    as_of = _on_or_today(as_of)
+    cache_key = portfolio_cache_key(portfolio_id, "pnl_windows", ",".join(names), as_of)
+    body = cache_get_or_compute_body(
+        cache_key,
+        lambda: [
+            PnLWindowOut.model_validate(w).model_dump(mode="json")
+            for w in compute_pnl_windows(db, portfolio_id, names, as_of)
+        ],
+        ttl_seconds=settings.cache_ttl_seconds,
+    )
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/performance", response_model=PerformanceOut)
+def performance(
+    portfolio_id: int = Query(...),
+    from_date: date | None = Query(default=None, alias="from"),
+    to_date: date | None = Query(default=None, alias="to"),
+    step: SeriesStep = Query(default=SeriesStep.DAY),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Response:
+    to_date = _on_or_today(to_date)
+    cache_key = portfolio_cache_key(portfolio_id, "performance", from_date, to_date, step.value)
+    try:
+        body = cache_get_or_compute_body(
+            cache_key,
+            lambda: PerformanceOut.model_validate(
+                compute_performance(db, portfolio_id, from_date, to_date, step.value)
+            ).model_dump(mode="json"),
+            ttl_seconds=settings.cache_ttl_seconds,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/risk", response_model=RiskOut)
+def risk(
+    portfolio_id: int = Query(...),
+    from_date: date | None = Query(default=None, alias="from"),
+    to_date: date | None = Query(default=None, alias="to"),
+    window: int = Query(default=settings.risk_rolling_window_days, ge=2),
+    risk_free_rate: float = Query(default=settings.risk_free_rate, gt=-1),
+    step: SeriesStep = Query(default=SeriesStep.DAY),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Response:
+    to_date = _on_or_today(to_date)
+    cache_key = portfolio_cache_key(
+        portfolio_id, "risk", price_data_version(), from_date, to_date, window, risk_free_rate, step.value
+    )
+    try:
+        body = cache_get_or_compute_body(
+            cache_key,
+            lambda: RiskOut.model_validate(
+                compute_risk(db, portfolio_id, from_date, to_date, window, risk_free_rate, step.value)
+            ).model_dump(mode="json"),
+            ttl_seconds=settings.cache_ttl_seconds,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/cash/balances", response_model=list[CashBalancePointOut])
+def cash_balance_series(
+    account_id: int = Query(...),
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    step: SeriesStep = Query(default=SeriesStep.DAY),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> list[dict]:
     if from_date > to_date:
         raise HTTPException(status_code=400, detail="from must be on or before to")
-    cache_key = f"cache:portfolio:{portfolio_id}:pnl_summary:{from_date}:{to_date}:{as_of}"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return PnLSummaryOut.model_validate(cached)
-
-    data = compute_pnl_summary(db, portfolio_id, from_date, to_date, as_of)
-    result = PnLSummaryOut.model_validate(data)
-    cache_set(cache_key, result.model_dump(mode="json"), ttl_seconds=settings.cache_ttl_seconds)
-    return result
+    if db.get(Account, account_id) is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    cuts = cut_dates(from_date, to_date, step.value)
+    return [{"date": cut, "balance": balance} for cut, balance in get_cash_balance_series(db, account_id, cuts)]
@@ -0,0 +1,48 @@
+from datetime import date
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.deps import get_current_user
+from app.db.session import get_db
+from app.models.portfolio import Portfolio
+from app.models.user import User
+from app.schemas.report import SeriesStep
+from app.schemas.snapshot import SnapshotBackfillQueued
+from app.services.snapshot_backfill import backfill_all_snapshots
+from app.services.snapshot_service import backfill_dates
+
+router = APIRouter(prefix="/snapshots", tags=["snapshots"])
+
+
+@router.post("/backfill", response_model=SnapshotBackfillQueued, status_code=status.HTTP_202_ACCEPTED)
+def backfill(
+    background_tasks: BackgroundTasks,
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    step: SeriesStep = Query(default=SeriesStep.DAY),
+    every: int = Query(default=1, ge=1),
+    portfolio_id: int | None = Query(default=None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> dict:
+    if from_date > to_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must be on or before to")
+    if (to_date - from_date).days >= settings.snapshot_backfill_max_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range exceeds {settings.snapshot_backfill_max_days} days; use the backfill-snapshots CLI",
+        )
+    portfolio_ids = None
+    if portfolio_id is not None:
+        if not db.get(Portfolio, portfolio_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+        portfolio_ids = [portfolio_id]
+    dates = backfill_dates(from_date, to_date, step.value, every)
+    # Replays run in this worker after the response, one portfolio at a time; the CLI
+    # is the place for process-pool backfills.
+    background_tasks.add_task(backfill_all_snapshots, dates, portfolio_ids, 1)
+    portfolios = 1 if portfolio_ids else db.execute(select(func.count(Portfolio.id))).scalar()
+    return {"portfolios": portfolios, "dates": len(dates)}
@@ -1,7 +1,12 @@
+import codecs
+import csv
+import json
 from datetime import date
-from decimal import Decimal
+from typing import AsyncIterator
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy import and_, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
@@ -10,19 +15,40 @@ from app.deps import get_current_user
 from app.db.session import get_db
 from app.models.trade import Trade
 from app.models.user import User
-from app.schemas.trade import TradeCreate, TradeRead, TradeUpdate
+from app.schemas.trade import TradeBulkResult, TradeCreate, TradeRead, TradeUpdate
 from app.routers.utils import handle_integrity_error
 from app.models.tag import Tag
 from app.models.asset import Asset
 from app.models.account import Account
-from app.models.fx_rate import FXRate
-from app.services.cash_ledger_service import build_trade_expense_txn, get_cash_balance, trade_total_cost
-from app.services.cache import cache_delete_pattern
+from app.models.portfolio import Portfolio
+from app.services.cash_ledger_service import (
+    adjust_cash_balance,
+    build_trade_expense_txn,
+    get_cash_balance,
+    trade_total_cost,
+)
+from app.services.cache import bump_portfolio_generation, bump_portfolio_generations
+from app.services.fx_service import get_fx_index
+from app.services.position_state_service import record_trade, refresh_position_state
+from app.services.share_index_service import (
+    adjust_share_balances,
+    available_shares,
+    reverse_movements,
+    trade_movement,
+)
 from app.services.tax_lot_service import rebuild_tax_lots
+from app.services.trade_import_service import ImportRow, import_trades
 from app.services.unit_of_work import UnitOfWork
 
 router = APIRouter(prefix="/trades", tags=["trades"])
 
+_BULK_MEDIA_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
 
 def _upsert_tags(db: Session, tag_names: list[str]) -> list[Tag]:
     tags: list[Tag] = []
@@ -37,24 +63,6 @@ def _upsert_tags(db: Session, tag_names: list[str]) -> list[Tag]:
     return tags
 
 
-def _resolve_fx_rate(db: Session, from_currency: str, to_currency: str, as_of: date) -> Decimal | None:
-    fx = (
-        db.execute(
-            select(FXRate)
-            .where(
-                FXRate.from_currency == from_currency,
-                FXRate.to_currency == to_currency,
-                FXRate.date <= as_of,
-            )
-            .order_by(FXRate.date.desc(), FXRate.id.desc())
-            .limit(1)
-        )
-        .scalars()
-        .first()
-    )
-    return fx.rate if fx else None
-
-
 def _normalize_trade_currencies(db: Session, data: dict) -> None:
     asset = db.get(Asset, data["asset_id"])
     account = db.get(Account, data["account_id"])
@@ -78,72 +86,117 @@ def _normalize_trade_currencies(db: Session, data: dict) -> None:
     settle_ccy = data.get("settlement_currency")
     if asset_ccy and settle_ccy and asset_ccy != settle_ccy:
         if data.get("fx_rate") is None:
-            rate = _resolve_fx_rate(db, asset_ccy, settle_ccy, data["trade_date"])
+            rate = get_fx_index(db, {asset_ccy, settle_ccy}).rate(asset_ccy, settle_ccy, data["trade_date"])
             if rate is None:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="FX rate required for settlement")
             data["fx_rate"] = rate
 
 
-def _available_shares(db: Session, portfolio_id: int, asset_id: int, up_to: date, exclude_trade_id: int | None = None) -> Decimal:
-    from app.models.corporate_action import CorporateAction
-    from app.models.cash_transaction import CashTransaction, CashTxnType
-    from app.models.trade import Trade, TradeSide
-    from app.models.asset import Asset
-
-    # Collect events up to (and including) up_to
-    trades = db.execute(
-        select(Trade)
-        .where(Trade.portfolio_id == portfolio_id, Trade.asset_id == asset_id, Trade.trade_date <= up_to)
-        .order_by(Trade.trade_date, Trade.id)
-    ).scalars().all()
-    actions = db.execute(
-        select(CorporateAction)
-        .where(
-            CorporateAction.asset_id == asset_id,
-            CorporateAction.processed_at.is_(None),
-            CorporateAction.date <= up_to,
-        )
-        .order_by(CorporateAction.date, CorporateAction.id)
-    ).scalars().all()
-    stock_divs = db.execute(
-        select(CashTransaction)
-        .where(
-            CashTransaction.portfolio_id == portfolio_id,
-            CashTransaction.asset_id == asset_id,
-            CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
-            CashTransaction.date <= up_to,
-        )
-        .order_by(CashTransaction.date, CashTransaction.id)
-    ).scalars().all()
-
-    timeline = []
-    for act in actions:
-        timeline.append((act.date, 0, "action", act))
-    for div in stock_divs:
-        timeline.append((div.date, 1, "stock_div", div))
-    for tr in trades:
-        if exclude_trade_id is not None and tr.id == exclude_trade_id:
+async def _iter_records(request: Request, is_csv: bool) -> AsyncIterator[str]:
+    """Yield complete records from the request body as it streams in (a CSV record may span lines)."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    record = ""
+    quotes = 0
+
+    def complete(line: str) -> str | None:
+        nonlocal record, quotes
+        if not is_csv:
+            return line
+        record += line + "\n"
+        quotes += line.count('"')
+        # Quotes inside a field are doubled, so an odd count means the record continues.
+        if quotes % 2:
+            return None
+        done, record, quotes = record, "", 0
+        return done
+
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            done = complete(line)
+            if done is not None:
+                yield done
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        done = complete(buffer)
+        if done is not None:
+            yield done
+    if record:
+        yield record
+
+
+def _parse_record(record: str, header: list[str] | None) -> dict:
+    if header is None:
+        data = json.loads(record)
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        return data
+    values = next(csv.reader([record]))
+    if len(values) > len(header):
+        raise ValueError("More values than header columns")
+    data = {name: value for name, value in zip(header, values) if value != ""}
+    if "tags" in data:
+        data["tags"] = [tag.strip() for tag in data["tags"].split(";") if tag.strip()]
+    return data
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in exc.errors()
+    )
+
+
+def _prepare_bulk_rows(db: Session, raw_rows: list[tuple[int, dict | str]]) -> tuple[list[ImportRow], list[dict]]:
+    rows: list[ImportRow] = []
+    errors: list[dict] = []
+    for row_number, raw in raw_rows:
+        if isinstance(raw, str):
+            errors.append({"row": row_number, "error": raw})
             continue
-        timeline.append((tr.trade_date, 2, "trade", tr))
-    timeline.sort(key=lambda x: (x[0], x[1]))
-
-    shares = Decimal("0")
-    for _, _, kind, obj in timeline:
-        if kind == "action":
-            act = obj
-            ratio = Decimal(act.numerator) / Decimal(act.denominator)
-            shares *= ratio
-        elif kind == "stock_div":
-            div = obj
-            if div.shares:
-                shares += div.shares
-        else:
-            tr = obj
-            if tr.side == TradeSide.BUY:
-                shares += tr.quantity
-            else:
-                shares -= tr.quantity
-    return shares
+        try:
+            data = TradeCreate.model_validate(raw).model_dump()
+        except ValidationError as exc:
+            errors.append({"row": row_number, "error": _format_validation_error(exc)})
+            continue
+        tag_names = data.pop("tags", None) or []
+        if db.get(Portfolio, data["portfolio_id"]) is None:
+            errors.append({"row": row_number, "error": "Portfolio not found"})
+            continue
+        if db.get(Account, data["account_id"]) is None:
+            errors.append({"row": row_number, "error": "Account not found"})
+            continue
+        if db.get(Asset, data["asset_id"]) is None:
+            errors.append({"row": row_number, "error": "Asset not found"})
+            continue
+        try:
+            _normalize_trade_currencies(db, data)
+        except HTTPException as exc:
+            errors.append({"row": row_number, "error": exc.detail})
+            continue
+        rows.append(ImportRow(row_number, data, tag_names))
+    return rows, errors
+
+
+def _bulk_import(db: Session, raw_rows: list[tuple[int, dict | str]], atomic: bool) -> tuple[dict, set[int]]:
+    rows, errors = _prepare_bulk_rows(db, raw_rows)
+    if atomic and errors:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={"inserted": 0, "errors": errors})
+    try:
+        with UnitOfWork(db):
+            result = import_trades(db, rows, atomic=atomic)
+            if atomic and result.errors:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail={"inserted": 0, "errors": result.errors}
+                )
+    except IntegrityError as exc:
+        handle_integrity_error(exc, "Trade")
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    errors = sorted(errors + result.errors, key=lambda err: err["row"])
+    return {"inserted": result.inserted, "errors": errors}, result.portfolio_ids
 
 
 @router.get("", response_model=list[TradeRead])
@@ -187,7 +240,7 @@ def create_trade(
     if tag_names:
         trade.tags = _upsert_tags(db, tag_names)
     if trade.side == trade.side.SELL:
-        available = _available_shares(db, trade.portfolio_id, trade.asset_id, trade.trade_date)
+        available = available_shares(db, trade.portfolio_id, trade.asset_id, trade.trade_date)
         if trade.quantity > available:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sell quantity exceeds available shares")
     if trade.side == trade.side.BUY:
@@ -199,18 +252,55 @@ def create_trade(
         with UnitOfWork(db):
             db.add(trade)
             db.flush()
+            adjust_share_balances(db, [trade_movement(trade)])
             if trade.side == trade.side.BUY:
-                db.add(build_trade_expense_txn(trade))
-            rebuild_tax_lots(db, trade.portfolio_id, trade.asset_id)
+                expense = build_trade_expense_txn(trade)
+                db.add(expense)
+                adjust_cash_balance(db, expense.account_id, expense.date, expense.amount)
+            rebuild_tax_lots(db, trade.portfolio_id, trade.asset_id, trade.trade_date)
+            record_trade(db, trade)
     except IntegrityError as exc:
         handle_integrity_error(exc, "Trade")
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-    cache_delete_pattern(f"cache:portfolio:{trade.portfolio_id}:*")
+    bump_portfolio_generation(trade.portfolio_id)
     db.refresh(trade)
     return trade
 
 
+@router.post("/bulk", response_model=TradeBulkResult)
+async def bulk_create_trades(
+    request: Request,
+    atomic: bool = Query(default=False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> dict:
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = _BULK_MEDIA_TYPES.get(media_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Expected text/csv or application/x-ndjson"
+        )
+
+    header: list[str] | None = None
+    raw_rows: list[tuple[int, dict | str]] = []
+    async for record in _iter_records(request, fmt == "csv"):
+        if not record.strip():
+            continue
+        if fmt == "csv" and header is None:
+            header = [name.strip() for name in next(csv.reader([record]))]
+            continue
+        row_number = len(raw_rows) + 1
+        try:
+            raw_rows.append((row_number, _parse_record(record, header)))
+        except (ValueError, csv.Error) as exc:
+            raw_rows.append((row_number, f"Malformed row: {exc}"))
+
+    result, portfolio_ids = await run_in_threadpool(_bulk_import, db, raw_rows, atomic)
+    bump_portfolio_generations(portfolio_ids)
+    return result
+
+
 @router.put("/{trade_id}", response_model=TradeRead)
 def update_trade(
     trade_id: int,
@@ -222,6 +312,8 @@ def update_trade(
     if not trade:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trade not found")
 
+    previous_date = trade.trade_date
+    previous_movement = trade_movement(trade)
     data = payload.model_dump(exclude_unset=True)
     tag_names = data.pop("tags", None)
     for field, value in data.items():
@@ -257,19 +349,23 @@ def update_trade(
         trade.currency = normalized.get("currency")
 
     if trade.side == trade.side.SELL:
-        available = _available_shares(db, trade.portfolio_id, trade.asset_id, trade.trade_date, exclude_trade_id=trade.id)
+        available = available_shares(
+            db, trade.portfolio_id, trade.asset_id, trade.trade_date, exclude=previous_movement
+        )
         if trade.quantity > available:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sell quantity exceeds available shares")
 
     try:
         with UnitOfWork(db):
             db.flush()
-            rebuild_tax_lots(db, trade.portfolio_id, trade.asset_id)
+            adjust_share_balances(db, reverse_movements([previous_movement]) + [trade_movement(trade)])
+            rebuild_tax_lots(db, trade.portfolio_id, trade.asset_id, min(previous_date, trade.trade_date))
+            refresh_position_state(db, trade.portfolio_id, trade.asset_id, min(previous_date, trade.trade_date))
     except IntegrityError as exc:
         handle_integrity_error(exc, "Trade")
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-    cache_delete_pattern(f"cache:portfolio:{trade.portfolio_id}:*")
+    bump_portfolio_generation(trade.portfolio_id)
     db.refresh(trade)
     return trade
 
@@ -285,12 +381,16 @@ def delete_trade(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trade not found")
     portfolio_id = trade.portfolio_id
     asset_id = trade.asset_id
+    trade_date = trade.trade_date
+    movement = trade_movement(trade)
     try:
         with UnitOfWork(db):
             db.delete(trade)
             db.flush()
-            rebuild_tax_lots(db, portfolio_id, asset_id)
+            adjust_share_balances(db, reverse_movements([movement]))
+            rebuild_tax_lots(db, portfolio_id, asset_id, trade_date)
+            refresh_position_state(db, portfolio_id, asset_id, trade_date)
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-    cache_delete_pattern(f"cache:portfolio:{portfolio_id}:*")
+    bump_portfolio_generation(portfolio_id)
     return None
@@ -57,7 +57,31 @@ class CorporateActionUpdate(BaseModel):
 class CorporateActionRead(CorporateActionBase):
     id: int
     processed_at: Optional[datetime] = None
+    history_rewritten: bool = False
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class CorporateActionProcessResult(BaseModel):
+    action_id: int
+    type: CorporateActionType
+    history_rewritten: bool
+    trades_created: int
+    rows_updated: dict[str, int]
+    lots_rebuilt: dict[str, int]
+    timings_ms: dict[str, float]
+
+
+class DripBatchError(BaseModel):
+    action_id: int
+    error: str
+
+
+class DripBatchResult(BaseModel):
+    processed: list[int]
+    trades_created: int
+    errors: list[DripBatchError]
+    lots_rebuilt: int
+    timings_ms: dict[str, float]
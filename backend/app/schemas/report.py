@@ -1,5 +1,6 @@
 from datetime import date
 from decimal import Decimal
+from enum import Enum
 from typing import Optional
 
 from pydantic import BaseModel, ConfigDict
@@ -38,3 +39,128 @@ class PnLSummaryOut(BaseModel):
     invested_cashflow: Decimal
 
     model_config = ConfigDict(json_encoders={Decimal: _d})
+
+
+class PnLWindowOut(PnLSummaryOut):
+    window: str
+    from_date: date | None
+    to_date: date
+
+
+class DashboardPortfolioOut(BaseModel):
+    portfolio_id: int
+    name: str
+    base_currency: str
+    market_value: Decimal
+    previous_market_value: Decimal
+    day_change_amount: Decimal
+    cash_balance: Decimal
+    total_pnl: Decimal
+    unconverted_asset_ids: list[int]
+    unconverted_account_ids: list[int]
+
+    model_config = ConfigDict(json_encoders={Decimal: _d})
+
+
+class DashboardOut(BaseModel):
+    as_of: date
+    currency: str
+    total_net_worth: Decimal
+    market_value: Decimal
+    day_change_amount: Decimal
+    day_change_percent: Decimal
+    total_pnl: Decimal
+    cash_balance: Decimal
+    unconverted_portfolio_ids: list[int]
+    portfolios: list[DashboardPortfolioOut]
+
+    model_config = ConfigDict(json_encoders={Decimal: _d})
+
+
+class PerformancePointOut(BaseModel):
+    date: date
+    value: float
+    net_flow: float
+    daily_return: float
+    cumulative_twr: float
+
+
+class PerformanceOut(BaseModel):
+    portfolio_id: int
+    from_date: date
+    to_date: date
+    start_value: float
+    end_value: float
+    net_flows: float
+    twr: float
+    twr_annualized: float | None
+    xirr: float | None
+    series: list[PerformancePointOut]
+
+
+class RiskPointOut(BaseModel):
+    date: date
+    drawdown: float
+    rolling_volatility: float | None
+
+
+class RiskHoldingOut(BaseModel):
+    asset_id: int
+    symbol: str | None
+    weight: float | None
+    volatility: float | None
+
+
+class RiskOut(BaseModel):
+    portfolio_id: int
+    from_date: date
+    to_date: date
+    window: int
+    risk_free_rate: float
+    volatility: float | None
+    max_drawdown: float
+    max_drawdown_peak: date | None
+    max_drawdown_trough: date | None
+    sharpe: float | None
+    sortino: float | None
+    holdings: list[RiskHoldingOut]
+    correlation: list[list[float | None]]
+    covariance: list[list[float | None]]
+    series: list[RiskPointOut]
+
+
+class SeriesStep(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class SeriesHoldingOut(BaseModel):
+    asset_id: int
+    shares: Decimal
+    last_price: Decimal | None
+    market_value: Decimal | None
+    fx_rate_used: Decimal | None
+    market_value_base: Decimal | None
+
+    model_config = ConfigDict(json_encoders={Decimal: _d})
+
+
+class PositionSeriesPointOut(BaseModel):
+    date: date
+    currency: str
+    market_value: Decimal
+    cost_basis: Decimal
+    cash_balance: Decimal
+    unconverted_asset_ids: list[int]
+    unconverted_account_ids: list[int]
+    holdings: list[SeriesHoldingOut]
+
+    model_config = ConfigDict(json_encoders={Decimal: _d})
+
+
+class CashBalancePointOut(BaseModel):
+    date: date
+    balance: Decimal
+
+    model_config = ConfigDict(json_encoders={Decimal: _d})
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+
+class SnapshotBackfillResult(BaseModel):
+    portfolios: int
+    dates: int
+    snapshots: int
+    skipped: int
+
+
+class SnapshotBackfillQueued(BaseModel):
+    portfolios: int
+    dates: int
@@ -86,3 +86,13 @@ class TradeRead(TradeBase):
         from_attributes=True,
         json_encoders={Decimal: _decimal_to_str},
     )
+
+
+class TradeBulkError(BaseModel):
+    row: int
+    error: str
+
+
+class TradeBulkResult(BaseModel):
+    inserted: int
+    errors: list[TradeBulkError]
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.asset_adjustment_factor import AssetAdjustmentFactor
+from app.models.corporate_action import CorporateAction
+from app.services.replay_engine import replayed_actions
+
+_FACTOR = Decimal("0.0000000001")
+_UNITS = Decimal("0.0000000001")
+
+
+class AdjustmentFactors:
+    """Step series of an asset's cumulative adjustment factor, as stored in ``asset_adjustment_factors``."""
+
+    def __init__(self, steps: Iterable[tuple[date, Decimal]] = ()):
+        self.dates: list[date] = []
+        self.values: list[Decimal] = []
+        for on, factor in steps:
+            self.dates.append(on)
+            self.values.append(Decimal(factor))
+
+    def on(self, day: date) -> Decimal:
+        # Actions sort before trades of the same day, so an action dated ``day`` applies.
+        idx = bisect_right(self.dates, day)
+        return self.values[idx - 1] if idx else Decimal("1")
+
+    @property
+    def latest(self) -> Decimal:
+        return self.values[-1] if self.values else Decimal("1")
+
+    def units(self, day: date, shares: Decimal) -> Decimal:
+        """Shares held on ``day`` expressed in the asset's pre-action units."""
+        return (Decimal(shares) / self.on(day)).quantize(_UNITS, ROUND_HALF_UP)
+
+    def adjust_shares(self, shares: Decimal, from_day: date, to_day: date) -> Decimal:
+        return Decimal(shares) * self.on(to_day) / self.on(from_day)
+
+    def adjust_price(self, price: Decimal, from_day: date, to_day: date) -> Decimal:
+        return Decimal(price) * self.on(from_day) / self.on(to_day)
+
+
+def load_adjustment_factors(db: Session, asset_ids: Iterable[int]) -> dict[int, AdjustmentFactors]:
+    """Factor series of each asset, from one indexed range read; assets without actions get the identity."""
+    asset_ids = list(dict.fromkeys(asset_ids))
+    steps: dict[int, list[tuple[date, Decimal]]] = defaultdict(list)
+    if asset_ids:
+        rows = db.execute(
+            select(AssetAdjustmentFactor.asset_id, AssetAdjustmentFactor.date, AssetAdjustmentFactor.factor)
+            .where(AssetAdjustmentFactor.asset_id.in_(asset_ids))
+            .order_by(AssetAdjustmentFactor.asset_id, AssetAdjustmentFactor.date)
+        ).all()
+        for asset_id, on, factor in rows:
+            steps[asset_id].append((on, factor))
+    return {asset_id: AdjustmentFactors(steps[asset_id]) for asset_id in asset_ids}
+
+
+def get_adjustment_factors(db: Session, asset_id: int) -> AdjustmentFactors:
+    return load_adjustment_factors(db, [asset_id])[asset_id]
+
+
+def rebuild_adjustment_factors(db: Session, asset_id: int) -> None:
+    """
+    Recompute an asset's factor series from its replayed corporate actions.
+
+    Call it whenever an action of the asset is created, edited, removed or processed;
+    it is one small delete and insert, however many trades the asset has.
+    """
+    db.execute(delete(AssetAdjustmentFactor).where(AssetAdjustmentFactor.asset_id == asset_id))
+    actions = db.execute(
+        select(CorporateAction.date, CorporateAction.numerator, CorporateAction.denominator)
+        .where(CorporateAction.asset_id == asset_id, replayed_actions())
+        .order_by(CorporateAction.date, CorporateAction.id)
+    ).all()
+
+    factor = Decimal("1")
+    steps: dict[date, Decimal] = {}
+    for on, numerator, denominator in actions:
+        if numerator <= 0 or denominator <= 0:
+            continue
+        factor *= Decimal(numerator) / Decimal(denominator)
+        steps[on] = factor
+    if steps:
+        db.execute(
+            insert(AssetAdjustmentFactor),
+            [
+                {"asset_id": asset_id, "date": on, "factor": value.quantize(_FACTOR, ROUND_HALF_UP)}
+                for on, value in steps.items()
+            ],
+        )
@@ -1,69 +1,452 @@
 from __future__ import annotations
 
-import json
-from typing import Any
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
 
 from redis import Redis
 from redis.exceptions import RedisError
 
 from app.core.config import settings
+from app.services.cache_codec import dumps, loads, pack, unpack
 
 _client: Redis | None = None
 
+# Counters for both tiers; read them with cache_stats().
+_stats_lock = threading.Lock()
+_stats: dict[str, int] = {
+    "local_hits": 0,
+    "redis_hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "computes": 0,
+    "lock_waits": 0,
+}
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats() -> dict[str, int]:
+    """Snapshot of cache counters plus the current size of the in-process tier."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["local_entries"], stats["local_bytes"] = _local.usage()
+    return stats
+
+
+class _LocalCache:
+    """
+    Bounded in-process LRU tier in front of Redis.
+
+    Entries expire after their TTL and the least recently used ones are evicted once the
+    summed size of their encoded payloads exceeds ``max_bytes``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, int, bytes]] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, size: int, ttl_seconds: float) -> None:
+        max_bytes = settings.local_cache_max_bytes
+        if ttl_seconds <= 0 or size > max_bytes:
+            self.delete(key)
+            return
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + ttl_seconds, size, value)
+            self._bytes += size
+            while self._bytes > max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted += 1
+        for _ in range(evicted):
+            _count("evictions")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def usage(self) -> tuple[int, int]:
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+_local = _LocalCache()
+
+
+def _local_ttl(ttl_seconds: int | None) -> float:
+    # The local tier cannot see deletes made by other processes, so keep it short-lived.
+    if ttl_seconds is None:
+        return settings.local_cache_ttl_seconds
+    return min(ttl_seconds, settings.local_cache_ttl_seconds)
+
+
+class _CircuitBreaker:
+    """
+    Stops talking to Redis after repeated failures so an outage adds no latency.
+
+    After ``cache_breaker_failure_threshold`` consecutive errors the breaker opens and
+    every cache call skips Redis. A background thread pings Redis every
+    ``cache_breaker_cooldown_seconds`` and closes the breaker once it answers.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe: threading.Thread | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def record_success(self) -> None:
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures < settings.cache_breaker_failure_threshold:
+                return
+            self.opened_at = time.monotonic()
+            if self._probe is None or not self._probe.is_alive():
+                self._probe = threading.Thread(target=self._run_probe, name="redis-breaker-probe", daemon=True)
+                self._probe.start()
+
+    def _run_probe(self) -> None:
+        while True:
+            time.sleep(settings.cache_breaker_cooldown_seconds)
+            client = _client
+            if client is None:
+                return
+            try:
+                client.ping()
+            except RedisError:
+                continue
+            with self._lock:
+                self.failures = 0
+                self.opened_at = None
+            _flush_pending_bumps()
+            return
+
+    def state(self) -> dict[str, Any]:
+        if settings.redis_url is None:
+            return {"state": "disabled"}
+        with self._lock:
+            state = {"state": "open" if self.opened_at is not None else "closed", "failures": self.failures}
+            if self.opened_at is not None:
+                state["open_seconds"] = round(time.monotonic() - self.opened_at, 1)
+        return state
+
+
+_breaker = _CircuitBreaker()
+
 
 def _get_client() -> Redis | None:
     global _client
-    if settings.redis_url is None:
+    if settings.redis_url is None or _breaker.is_open:
         return None
     if _client is None:
-        _client = Redis.from_url(settings.redis_url, decode_responses=True)
+        _client = Redis.from_url(
+            settings.redis_url,
+            socket_connect_timeout=settings.redis_connect_timeout_seconds,
+            socket_timeout=settings.redis_socket_timeout_seconds,
+            max_connections=settings.redis_max_connections,
+        )
     return _client
 
 
-def cache_get(key: str) -> Any | None:
+def cache_health() -> dict[str, Any]:
+    """Circuit breaker state and cache counters, for the health endpoint."""
+    return {"redis": _breaker.state(), **cache_stats()}
+
+
+def _get_body(key: str) -> bytes | None:
+    body = _local.get(key)
+    if body is not None:
+        _count("local_hits")
+        return body
+
     client = _get_client()
     if client is None:
         return None
     try:
-        raw = client.get(key)
+        payload = client.get(key)
     except RedisError:
+        _breaker.record_failure()
         return None
-    if raw is None:
+    _breaker.record_success()
+    if payload is None:
         return None
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
+    body = unpack(payload)
+    if body is None:
         return None
+    _count("redis_hits")
+    _local.set(key, body, len(body), _local_ttl(None))
+    return body
 
 
-def cache_set(key: str, value: Any, ttl_seconds: int | None = None) -> None:
+def _set_body(key: str, body: bytes, ttl_seconds: int | None) -> None:
+    _local.set(key, body, len(body), _local_ttl(ttl_seconds))
     client = _get_client()
     if client is None:
         return
     try:
-        payload = json.dumps(value, ensure_ascii=True)
-        client.set(key, payload, ex=ttl_seconds)
-    except (TypeError, RedisError):
+        client.set(key, pack(body), ex=ttl_seconds)
+    except RedisError:
+        _breaker.record_failure()
         return
+    _breaker.record_success()
+
+
+def cache_get(key: str) -> Any | None:
+    body = _get_body(key)
+    if body is None:
+        _count("misses")
+        return None
+    return loads(body)
+
+
+def cache_set(key: str, value: Any, ttl_seconds: int | None = None) -> None:
+    try:
+        body = dumps(value)
+    except (TypeError, ValueError):
+        return
+    _set_body(key, body, ttl_seconds)
 
 
 def cache_delete(key: str) -> None:
+    _local.delete(key)
     client = _get_client()
     if client is None:
         return
     try:
         client.delete(key)
     except RedisError:
+        _breaker.record_failure()
+        return
+    _breaker.record_success()
+
+
+# Fallback generations used while Redis is unavailable, by generation key; only this
+# process sees them.
+_local_generations: dict[str, int] = {}
+# Generation keys whose Redis INCR failed; replayed once Redis is reachable again so
+# other processes stop serving entries cached before the write.
+_pending_bumps: set[str] = set()
+_generations_lock = threading.Lock()
+
+_PRICE_VERSION_KEY = "cache:prices:gen"
+
+
+def _generation_key(portfolio_id: int) -> str:
+    return f"cache:portfolio:{portfolio_id}:gen"
+
+
+def _generation(key: str) -> str:
+    client = _get_client()
+    if client is not None:
+        try:
+            generation = client.get(key)
+        except RedisError:
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+            return f"g{int(generation or 0)}"
+    with _generations_lock:
+        return f"l{_local_generations.get(key, 0)}"
+
+
+def _bump_generations(keys: set[str]) -> None:
+    if not keys:
+        return
+    with _generations_lock:
+        for key in keys:
+            _local_generations[key] = _local_generations.get(key, 0) + 1
+        _pending_bumps.update(keys)
+    _flush_pending_bumps()
+
+
+def portfolio_generation(portfolio_id: int) -> str:
+    """Current cache generation of a portfolio, embedded in every key cached for it."""
+    return _generation(_generation_key(portfolio_id))
+
+
+def bump_portfolio_generation(portfolio_id: int) -> None:
+    """
+    Invalidate everything cached for a portfolio with a single INCR.
+
+    Keys built from the previous generation become unreachable and age out by TTL.
+    """
+    bump_portfolio_generations([portfolio_id])
+
+
+def bump_portfolio_generations(portfolio_ids: Iterable[int]) -> None:
+    """Bump several portfolio generations in one Redis round trip."""
+    _bump_generations({_generation_key(portfolio_id) for portfolio_id in portfolio_ids})
+
+
+def price_data_version() -> str:
+    """Generation of the stored price history, for reports that read closes beyond the latest ones."""
+    return _generation(_PRICE_VERSION_KEY)
+
+
+def bump_price_data_version() -> None:
+    _bump_generations({_PRICE_VERSION_KEY})
+
+
+def _flush_pending_bumps() -> None:
+    with _generations_lock:
+        keys = sorted(_pending_bumps)
+        _pending_bumps.clear()
+    if not keys:
         return
+    client = _get_client()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.incr(key)
+            pipe.execute()
+        except RedisError:
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+            return
+    with _generations_lock:
+        _pending_bumps.update(keys)
+
+
+def portfolio_cache_key(portfolio_id: int, *parts: object) -> str:
+    """Cache key for a portfolio report, scoped to the portfolio's current generation."""
+    suffix = ":".join(str(part) for part in parts)
+    return f"cache:portfolio:{portfolio_id}:{portfolio_generation(portfolio_id)}:{suffix}"
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.users = 0
+
 
+_flights_lock = threading.Lock()
+_flights: dict[str, _Flight] = {}
 
-def cache_delete_pattern(pattern: str) -> None:
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _acquire_redis_lock(key: str) -> str | None:
+    """Try to take the cross-process compute lock; returns its token, or None if held elsewhere."""
     client = _get_client()
     if client is None:
+        return ""
+    token = uuid.uuid4().hex
+    try:
+        acquired = client.set(f"lock:{key}", token, nx=True, px=int(settings.cache_lock_timeout_seconds * 1000))
+    except RedisError:
+        _breaker.record_failure()
+        return ""
+    _breaker.record_success()
+    return token if acquired else None
+
+
+def _release_redis_lock(key: str, token: str) -> None:
+    client = _get_client()
+    if client is None or not token:
         return
     try:
-        keys = list(client.scan_iter(match=pattern))
-        if keys:
-            client.delete(*keys)
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", token)
     except RedisError:
+        _breaker.record_failure()
         return
+    _breaker.record_success()
+
+
+def _wait_for_body(key: str) -> bytes | None:
+    _count("lock_waits")
+    deadline = time.monotonic() + settings.cache_lock_timeout_seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        body = _get_body(key)
+        if body is not None:
+            return body
+    return None
+
+
+def cache_get_or_compute_body(key: str, compute: Callable[[], Any], ttl_seconds: int | None = None) -> bytes:
+    """
+    Return the cached JSON body for ``key``, computing and caching it on a miss.
+
+    Hits are returned exactly as stored, so callers can send them as the HTTP response
+    without decoding. Concurrent misses on the same key are collapsed: threads in this
+    process queue on a per-key lock, and other processes wait on a short-lived Redis lock
+    until the value appears (or the lock times out, in which case they compute it).
+    """
+    body = _get_body(key)
+    if body is not None:
+        return body
+    _count("misses")
+
+    with _flights_lock:
+        flight = _flights.setdefault(key, _Flight())
+        flight.users += 1
+    try:
+        with flight.lock:
+            body = _get_body(key)
+            if body is not None:
+                return body
+
+            token = _acquire_redis_lock(key)
+            if token is None:
+                body = _wait_for_body(key)
+                if body is not None:
+                    return body
+            try:
+                _count("computes")
+                body = dumps(compute())
+                _set_body(key, body, ttl_seconds)
+                return body
+            finally:
+                if token:
+                    _release_redis_lock(key, token)
+    finally:
+        with _flights_lock:
+            flight.users -= 1
+            if flight.users == 0:
+                _flights.pop(key, None)
+
+
+def cache_get_or_compute(key: str, compute: Callable[[], Any], ttl_seconds: int | None = None) -> Any:
+    """Decoded form of ``cache_get_or_compute_body``."""
+    return loads(cache_get_or_compute_body(key, compute, ttl_seconds))
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+import zlib
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from app.core.config import settings
+
+# First byte of every payload stored in Redis; it names how the rest is encoded.
+FORMAT_JSON = b"J"
+FORMAT_JSON_ZLIB = b"Z"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        # Same text as the API schemas emit, so no precision is lost in the cache.
+        return format(value, "f")
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not cacheable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value as the JSON body FastAPI would send for it."""
+    return json.dumps(
+        value,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def loads(body: bytes) -> Any:
+    return json.loads(body)
+
+
+def pack(body: bytes) -> bytes:
+    """Frame a JSON body for Redis, compressing it once it reaches the configured size."""
+    threshold = settings.cache_compress_min_bytes
+    if threshold and len(body) >= threshold:
+        compressed = zlib.compress(body, settings.cache_compress_level)
+        if len(compressed) < len(body):
+            return FORMAT_JSON_ZLIB + compressed
+    return FORMAT_JSON + body
+
+
+def unpack(payload: bytes) -> bytes | None:
+    """JSON body of a framed payload, or None when it is unreadable (e.g. written by an older release)."""
+    header, data = payload[:1], payload[1:]
+    if header == FORMAT_JSON:
+        return data
+    if header == FORMAT_JSON_ZLIB:
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return None
+    return None
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy import select, union
+from sqlalchemy.orm import Session
+
+from app.models.account import Account
+from app.models.asset import Asset
+from app.models.cash_transaction import CashTransaction, CashTxnType
+from app.models.portfolio import Portfolio
+from app.models.position_state import PositionState
+from app.models.trade import Trade
+from app.services.cache import bump_portfolio_generations
+
+
+def portfolios_holding_asset(db: Session, asset_id: int) -> set[int]:
+    """
+    Portfolios whose reports depend on ``asset_id``.
+
+    ``position_states`` is the dependency index; trades and stock dividends cover
+    portfolios whose state has not been built yet.
+    """
+    portfolio_ids = set(
+        db.execute(select(PositionState.portfolio_id).where(PositionState.asset_id == asset_id)).scalars()
+    )
+    portfolio_ids.update(db.execute(select(Trade.portfolio_id).where(Trade.asset_id == asset_id).distinct()).scalars())
+    portfolio_ids.update(
+        db.execute(
+            select(CashTransaction.portfolio_id)
+            .where(CashTransaction.asset_id == asset_id, CashTransaction.type == CashTxnType.DIVIDEND_STOCK)
+            .distinct()
+        ).scalars()
+    )
+    return portfolio_ids
+
+
+def portfolios_exposed_to_currencies(db: Session, currencies: Iterable[str]) -> set[int]:
+    """
+    Portfolios whose base-currency conversions can use a rate involving ``currencies``.
+
+    That is every portfolio based in one of them, holding an asset quoted in one or with an
+    account held in one; this also covers conversions triangulated through one of the currencies.
+    """
+    currencies = set(currencies)
+    if not currencies:
+        return set()
+    quoted = select(Asset.id).where(Asset.currency.in_(currencies))
+    exposed = union(
+        select(Portfolio.id.label("portfolio_id")).where(Portfolio.base_currency.in_(currencies)),
+        select(Account.portfolio_id).where(Account.currency.in_(currencies)),
+        select(PositionState.portfolio_id).where(PositionState.asset_id.in_(quoted)),
+        select(Trade.portfolio_id).where(Trade.asset_id.in_(quoted)),
+        select(CashTransaction.portfolio_id).where(
+            CashTransaction.asset_id.in_(quoted), CashTransaction.type == CashTxnType.DIVIDEND_STOCK
+        ),
+    )
+    return set(db.execute(exposed).scalars())
+
+
+def invalidate_asset(db: Session, asset_id: int) -> None:
+    """Drop cached reports of portfolios holding an asset (price or asset data changed)."""
+    bump_portfolio_generations(portfolios_holding_asset(db, asset_id))
+
+
+def invalidate_currencies(db: Session, currencies: Iterable[str]) -> None:
+    """Drop cached reports of portfolios exposed to an FX rate change."""
+    bump_portfolio_generations(portfolios_exposed_to_currencies(db, currencies))
+
+
+def invalidate_all_portfolios(db: Session) -> None:
+    """
+    Drop every portfolio's cached reports.
+
+    Used for corporate actions, which are not portfolio-scoped: an unprocessed action
+    shows up in the positions of every portfolio.
+    """
+    bump_portfolio_generations(db.execute(select(Portfolio.id)).scalars())
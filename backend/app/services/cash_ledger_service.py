@@ -1,31 +1,126 @@
 from __future__ import annotations
 
+from collections import defaultdict
 from datetime import date
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable
 
-from sqlalchemy import func, select
+from sqlalchemy import and_, func, insert, select, update
 from sqlalchemy.orm import Session
 
+from app.models.account import Account
+from app.models.cash_balance import CashBalance
 from app.models.cash_transaction import CashTransaction, CashTxnType
 from app.models.trade import Trade
 
 
+_STORED = Decimal("0.000001")
+
+
 def get_cash_balance(db: Session, account_id: int, as_of: date) -> Decimal:
-    total = (
+    """Cash balance of an account after every transaction dated on or before ``as_of``."""
+    balance = (
         db.execute(
-            select(func.coalesce(func.sum(CashTransaction.amount), 0)).where(
-                CashTransaction.account_id == account_id,
-                CashTransaction.date <= as_of,
-            )
+            select(CashBalance.balance)
+            .where(CashBalance.account_id == account_id, CashBalance.date <= as_of)
+            .order_by(CashBalance.date.desc())
+            .limit(1)
         )
         .scalars()
         .first()
     )
-    if total is None:
-        return Decimal("0")
-    if isinstance(total, Decimal):
-        return total
-    return Decimal(str(total))
+    return balance if balance is not None else Decimal("0")
+
+
+def get_portfolio_cash_balance(db: Session, portfolio_id: int, as_of: date) -> Decimal:
+    """Sum of the cash balances of a portfolio's accounts on ``as_of``, in one query."""
+    latest = (
+        select(CashBalance.account_id, func.max(CashBalance.date).label("date"))
+        .join(Account, Account.id == CashBalance.account_id)
+        .where(Account.portfolio_id == portfolio_id, CashBalance.date <= as_of)
+        .group_by(CashBalance.account_id)
+        .subquery()
+    )
+    total = db.execute(
+        select(func.sum(CashBalance.balance)).join(
+            latest, and_(CashBalance.account_id == latest.c.account_id, CashBalance.date == latest.c.date)
+        )
+    ).scalar()
+    return Decimal(str(total)) if total is not None else Decimal("0")
+
+
+def get_account_cash_balances(db: Session, portfolio_id: int, as_of: date) -> list[tuple[int, str, Decimal]]:
+    """(account id, currency, balance) of each of a portfolio's accounts with cash rows by ``as_of``."""
+    latest = (
+        select(CashBalance.account_id, func.max(CashBalance.date).label("date"))
+        .join(Account, Account.id == CashBalance.account_id)
+        .where(Account.portfolio_id == portfolio_id, CashBalance.date <= as_of)
+        .group_by(CashBalance.account_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(CashBalance.account_id, Account.currency, CashBalance.balance)
+        .join(latest, and_(CashBalance.account_id == latest.c.account_id, CashBalance.date == latest.c.date))
+        .join(Account, Account.id == CashBalance.account_id)
+        .order_by(CashBalance.account_id)
+    ).all()
+    return [(account_id, currency, Decimal(str(balance))) for account_id, currency, balance in rows]
+
+
+def get_cash_balance_series(db: Session, account_id: int, cuts: list[date]) -> list[tuple[date, Decimal]]:
+    """Balance of an account at each cut date (ascending), from its running-balance rows."""
+    if not cuts:
+        return []
+    rows = db.execute(
+        select(CashBalance.date, CashBalance.balance)
+        .where(CashBalance.account_id == account_id, CashBalance.date > cuts[0], CashBalance.date <= cuts[-1])
+        .order_by(CashBalance.date)
+    ).all()
+    balance = get_cash_balance(db, account_id, cuts[0])
+    series: list[tuple[date, Decimal]] = []
+    idx = 0
+    for cut in cuts:
+        while idx < len(rows) and rows[idx][0] <= cut:
+            balance = rows[idx][1]
+            idx += 1
+        series.append((cut, balance))
+    return series
+
+
+def adjust_cash_balance(db: Session, account_id: int, on: date, delta: Decimal) -> None:
+    """
+    Apply a cash movement of ``delta`` dated ``on`` to the account's running balances.
+
+    Adds a row for ``on`` carrying the previous balance if the day had none, then shifts
+    that row and every later one. Call it for each cash transaction written, with the
+    negated amount when one is removed.
+    """
+    delta = Decimal(delta).quantize(_STORED, ROUND_HALF_UP)
+    if delta == 0:
+        return
+    exists = db.execute(
+        select(CashBalance.date).where(CashBalance.account_id == account_id, CashBalance.date == on)
+    ).first()
+    if exists is None:
+        db.execute(
+            insert(CashBalance).values(
+                account_id=account_id, date=on, balance=get_cash_balance(db, account_id, on)
+            )
+        )
+    db.execute(
+        update(CashBalance)
+        .where(CashBalance.account_id == account_id, CashBalance.date >= on)
+        .values(balance=CashBalance.balance + delta)
+    )
+
+
+def adjust_cash_balances(db: Session, movements: Iterable[tuple[int, date, Decimal]]) -> None:
+    """``adjust_cash_balance`` for many (account_id, date, amount) movements, netted per day."""
+    totals: dict[tuple[int, date], Decimal] = defaultdict(Decimal)
+    for account_id, on, amount in movements:
+        totals[(account_id, on)] += Decimal(amount).quantize(_STORED, ROUND_HALF_UP)
+    for (account_id, on), delta in sorted(totals.items()):
+        adjust_cash_balance(db, account_id, on, delta)
 
 
 def trade_total_cost(trade: Trade) -> Decimal:
@@ -40,16 +135,20 @@ def trade_total_cost(trade: Trade) -> Decimal:
     return total
 
 
+def trade_expense_values(trade: Trade) -> dict:
+    """Column values of the TRADE_EXPENSE cash transaction booked for a BUY."""
+    return {
+        "portfolio_id": trade.portfolio_id,
+        "account_id": trade.account_id,
+        "asset_id": trade.asset_id,
+        "date": trade.trade_date,
+        "type": CashTxnType.TRADE_EXPENSE,
+        "amount": -trade_total_cost(trade),
+        "withholding_tax": Decimal("0"),
+        "shares": None,
+        "note": "Auto trade expense",
+    }
+
+
 def build_trade_expense_txn(trade: Trade) -> CashTransaction:
-    total_cost = trade_total_cost(trade)
-    return CashTransaction(
-        portfolio_id=trade.portfolio_id,
-        account_id=trade.account_id,
-        asset_id=trade.asset_id,
-        date=trade.trade_date,
-        type=CashTxnType.TRADE_EXPENSE,
-        amount=-total_cost,
-        withholding_tax=Decimal("0"),
-        shares=None,
-        note="Auto trade expense",
-    )
+    return CashTransaction(**trade_expense_values(trade))
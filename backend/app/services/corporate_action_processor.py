@@ -1,176 +1,351 @@
 from __future__ import annotations
 
+import time
+from collections import defaultdict
 from datetime import date, datetime, timezone
 from decimal import Decimal
+from typing import NamedTuple
 
-from sqlalchemy import select
+from sqlalchemy import and_, insert, select, update
 from sqlalchemy.orm import Session
 
+from app.models.asset import Asset
 from app.models.cash_transaction import CashTransaction, CashTxnType
 from app.models.corporate_action import CorporateAction, CorporateActionType
 from app.models.position_snapshot import PositionSnapshot
 from app.models.price_history import PriceHistory
 from app.models.trade import Trade, TradeSide
-from app.services.cash_ledger_service import build_trade_expense_txn, get_cash_balance
-from app.services.tax_lot_service import rebuild_tax_lots
+from app.services.adjustment_service import rebuild_adjustment_factors
+from app.services.cache_invalidation import invalidate_all_portfolios
+from app.services.cash_ledger_service import (
+    adjust_cash_balances,
+    get_cash_balance_series,
+    trade_expense_values,
+    trade_total_cost,
+)
+from app.services.position_state_service import refresh_asset_states, refresh_position_state
+from app.services.share_index_service import rebuild_share_index
+from app.services.tax_lot_service import rebuild_asset_tax_lots, rebuild_tax_lots
 from app.services.unit_of_work import UnitOfWork
 
 
-def process_corporate_action(db: Session, action_id: int) -> dict:
+def process_corporate_action(db: Session, action_id: int, rewrite_history: bool = False) -> dict:
+    """
+    Mark a corporate action processed, booking whatever it implies.
+
+    A DRIP books its reinvestment trades. A split-like action stays a replayed event
+    read through the asset's adjustment factors, so processing it writes nothing but
+    ``processed_at``; ``rewrite_history`` instead rescales the pre-action ledger rows
+    in place, as processing used to, and drops the action from the factor series.
+    """
     action = db.get(CorporateAction, action_id)
     if not action:
         raise ValueError("Corporate action not found")
     if action.processed_at is not None:
         raise ValueError("Corporate action already processed")
 
+    timings: dict[str, float] = {}
+    rows_updated: dict[str, int] = {}
+    trades_created = 0
+    lots: dict[str, int] = {"portfolios": 0, "lots": 0}
+    started = time.perf_counter()
     with UnitOfWork(db):
-        if action.type == CorporateActionType.DRIP:
-            trades_created = _apply_drip(db, action)
-        else:
-            trades_created = _apply_split_like(db, action)
         action.processed_at = datetime.now(timezone.utc)
-        _rebuild_lots_for_asset(db, action.asset_id)
+        if action.type != CorporateActionType.DRIP and not rewrite_history:
+            # The replay still applies the action, so every derived table stays valid.
+            timings["apply_ms"] = _elapsed_ms(started)
+        else:
+            if action.type == CorporateActionType.DRIP:
+                trades_created = _apply_drip(db, action)
+            else:
+                rows_updated = _apply_split_like(db, action)
+                action.history_rewritten = True
+            # Lot and state rebuilds query the ledger; make the rewritten rows visible first.
+            db.flush()
+            timings["apply_ms"] = _elapsed_ms(started)
+
+            started = time.perf_counter()
+            rebuild_adjustment_factors(db, action.asset_id)
+            rebuild_share_index(db, action.asset_id)
+            lots = rebuild_asset_tax_lots(db, action.asset_id)
+            timings["lots_ms"] = _elapsed_ms(started)
+
+            started = time.perf_counter()
+            # A split rewrites history before its date, so replay those states from scratch.
+            refresh_asset_states(
+                db, action.asset_id, action.date if action.type == CorporateActionType.DRIP else None
+            )
+            timings["states_ms"] = _elapsed_ms(started)
+    invalidate_all_portfolios(db)
 
     return {
         "action_id": action.id,
         "type": action.type.value,
+        "history_rewritten": action.history_rewritten,
         "trades_created": trades_created,
+        "rows_updated": rows_updated,
+        "lots_rebuilt": lots,
+        "timings_ms": timings,
     }
 
 
-def _rebuild_lots_for_asset(db: Session, asset_id: int) -> None:
-    portfolio_ids = set()
-    trades = db.execute(select(Trade.portfolio_id).where(Trade.asset_id == asset_id)).scalars().all()
-    cash_divs = (
-        db.execute(
-            select(CashTransaction.portfolio_id).where(
-                CashTransaction.asset_id == asset_id,
-                CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
-            )
-        )
-        .scalars()
-        .all()
-    )
-    portfolio_ids.update(trades)
-    portfolio_ids.update(cash_divs)
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
 
-    for pid in portfolio_ids:
-        rebuild_tax_lots(db, pid, asset_id)
 
+def _apply_split_like(db: Session, action: CorporateAction) -> dict[str, int]:
+    """
+    Rescale every pre-action trade, stock dividend and snapshot with one UPDATE per table.
 
-def _apply_split_like(db: Session, action: CorporateAction) -> int:
+    Nothing is loaded into the session; returns the number of rows each statement changed.
+    """
     ratio = Decimal(action.numerator) / Decimal(action.denominator)
     if ratio <= 0:
         raise ValueError("Split ratio must be positive")
 
-    trades = (
-        db.execute(
-            select(Trade)
-            .where(
-                Trade.asset_id == action.asset_id,
-                Trade.trade_date < action.date,
-            )
-            .order_by(Trade.trade_date, Trade.id)
-        )
-        .scalars()
-        .all()
+    bulk = {"synchronize_session": False}
+    trades = db.execute(
+        update(Trade)
+        .where(Trade.asset_id == action.asset_id, Trade.trade_date < action.date)
+        .values(quantity=Trade.quantity * ratio, price=Trade.price / ratio),
+        execution_options=bulk,
     )
-    for trade in trades:
-        trade.quantity *= ratio
-        trade.price /= ratio
-
-    stock_divs = (
-        db.execute(
-            select(CashTransaction).where(
-                CashTransaction.asset_id == action.asset_id,
-                CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
-                CashTransaction.date < action.date,
-            )
+    stock_divs = db.execute(
+        update(CashTransaction)
+        .where(
+            CashTransaction.asset_id == action.asset_id,
+            CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
+            CashTransaction.date < action.date,
+            CashTransaction.shares.is_not(None),
         )
-        .scalars()
-        .all()
+        .values(shares=CashTransaction.shares * ratio),
+        execution_options=bulk,
     )
-    for div in stock_divs:
-        if div.shares is not None:
-            div.shares *= ratio
-
-    snapshots = (
-        db.execute(
-            select(PositionSnapshot).where(
-                PositionSnapshot.asset_id == action.asset_id,
-                PositionSnapshot.snapshot_date < action.date,
-            )
-        )
-        .scalars()
-        .all()
+    snapshots = db.execute(
+        update(PositionSnapshot)
+        .where(PositionSnapshot.asset_id == action.asset_id, PositionSnapshot.snapshot_date < action.date)
+        .values(shares=PositionSnapshot.shares * ratio),
+        execution_options=bulk,
     )
-    for snap in snapshots:
-        snap.shares *= ratio
+    # The statements bypassed the identity map; drop any copies loaded before them.
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, (Trade, CashTransaction, PositionSnapshot)):
+            db.expire(obj)
+    return {
+        "trades": trades.rowcount,
+        "stock_dividends": stock_divs.rowcount,
+        "snapshots": snapshots.rowcount,
+    }
 
-    return 0
 
+class _DripAction(NamedTuple):
+    id: int
+    asset_id: int
+    date: date
+    ratio: Decimal
+    price: Decimal | None
 
-def _apply_drip(db: Session, action: CorporateAction) -> int:
-    price = _get_price_on_or_before(db, action.asset_id, action.date)
-    if price is None:
-        raise ValueError("No price history found for DRIP date")
-
-    cash_divs = (
-        db.execute(
-            select(CashTransaction).where(
-                CashTransaction.asset_id == action.asset_id,
-                CashTransaction.type == CashTxnType.DIVIDEND_CASH,
-                CashTransaction.date == action.date,
-            )
-        )
-        .scalars()
-        .all()
+
+def _drip_actions(db: Session, action_ids: list[int] | None = None) -> list[_DripAction]:
+    """DRIP actions with the latest close on or before each one's date, from one statement."""
+    price = (
+        select(PriceHistory.close)
+        .where(PriceHistory.asset_id == CorporateAction.asset_id, PriceHistory.date <= CorporateAction.date)
+        .order_by(PriceHistory.date.desc())
+        .limit(1)
+        .scalar_subquery()
     )
+    filters = [CorporateAction.type == CorporateActionType.DRIP]
+    if action_ids is None:
+        filters.append(CorporateAction.processed_at.is_(None))
+    else:
+        filters.append(CorporateAction.id.in_(action_ids))
+    rows = db.execute(
+        select(
+            CorporateAction.id,
+            CorporateAction.asset_id,
+            CorporateAction.date,
+            CorporateAction.numerator,
+            CorporateAction.denominator,
+            price,
+        )
+        .where(*filters)
+        .order_by(CorporateAction.date, CorporateAction.id)
+    ).all()
+    return [
+        _DripAction(action_id, asset_id, on, Decimal(numerator) / Decimal(denominator), close)
+        for action_id, asset_id, on, numerator, denominator, close in rows
+    ]
 
-    trades_created = 0
-    for div in cash_divs:
-        if div.asset_id is None:
-            continue
-        reinvest_amount = div.amount - div.withholding_tax
-        if reinvest_amount <= 0:
-            continue
 
-        balance = get_cash_balance(db, div.account_id, div.date)
-        if balance < reinvest_amount:
-            raise ValueError("Insufficient cash balance for DRIP")
-
-        quantity = reinvest_amount / price
-        trade = Trade(
-            portfolio_id=div.portfolio_id,
-            account_id=div.account_id,
-            asset_id=div.asset_id,
-            trade_date=div.date,
-            side=TradeSide.BUY,
-            quantity=quantity,
-            price=price,
-            fee=Decimal("0"),
-            tax=Decimal("0"),
-            currency=div.asset.currency if div.asset else None,
-            note=f"DRIP from cash txn {div.id}",
+def _plan_drips(db: Session, actions: list[_DripAction]) -> tuple[dict[int, list[dict]], list[dict]]:
+    """
+    Build the reinvestment trades of each action, in date order, without writing anything.
+
+    Every cash dividend of the actions is read with one query and each account's balances
+    at the dividend dates with one series read; trades accepted earlier in the batch are
+    deducted from their account, so each check sees what processing the actions one by one
+    would have seen. An action with a missing price or a dividend the account cannot cover
+    is reported in the errors and books nothing. Returns the trade values per action.
+    """
+    if not actions:
+        return {}, []
+    divs = db.execute(
+        select(
+            CorporateAction.id,
+            CashTransaction.id,
+            CashTransaction.portfolio_id,
+            CashTransaction.account_id,
+            CashTransaction.asset_id,
+            CashTransaction.date,
+            CashTransaction.amount - CashTransaction.withholding_tax,
+            Asset.currency,
         )
-        db.add(trade)
-        db.add(build_trade_expense_txn(trade))
-        trades_created += 1
+        .join(
+            CashTransaction,
+            and_(CashTransaction.asset_id == CorporateAction.asset_id, CashTransaction.date == CorporateAction.date),
+        )
+        .join(Asset, Asset.id == CashTransaction.asset_id)
+        .where(
+            CorporateAction.id.in_([action.id for action in actions]),
+            CashTransaction.type == CashTxnType.DIVIDEND_CASH,
+        )
+        .order_by(CashTransaction.id)
+    ).all()
+    by_action: dict[int, list] = defaultdict(list)
+    cuts: dict[int, set[date]] = defaultdict(set)
+    for row in divs:
+        by_action[row[0]].append(row)
+        cuts[row[3]].add(row[5])
+    balances = {
+        account_id: dict(get_cash_balance_series(db, account_id, sorted(days))) for account_id, days in cuts.items()
+    }
 
-    return trades_created
+    spent: dict[int, Decimal] = defaultdict(Decimal)
+    planned: dict[int, list[dict]] = {}
+    errors: list[dict] = []
+    for action in actions:
+        if action.price is None:
+            errors.append({"action_id": action.id, "error": "No price history found for DRIP date"})
+            continue
+        trades: list[dict] = []
+        pending: dict[int, Decimal] = defaultdict(Decimal)
+        for _, div_id, portfolio_id, account_id, asset_id, on, reinvest_amount, currency in by_action[action.id]:
+            if reinvest_amount <= 0:
+                continue
+            if balances[account_id][on] - spent[account_id] - pending[account_id] < reinvest_amount:
+                errors.append({"action_id": action.id, "error": "Insufficient cash balance for DRIP"})
+                break
+            data = {
+                "portfolio_id": portfolio_id,
+                "account_id": account_id,
+                "asset_id": asset_id,
+                "trade_date": on,
+                "side": TradeSide.BUY,
+                "quantity": reinvest_amount / action.price,
+                "price": action.price,
+                "fee": Decimal("0"),
+                "tax": Decimal("0"),
+                "currency": currency,
+                "note": f"DRIP from cash txn {div_id}",
+            }
+            pending[account_id] += trade_total_cost(Trade(**data))
+            trades.append(data)
+        else:
+            for account_id, amount in pending.items():
+                spent[account_id] += amount
+            planned[action.id] = trades
+    return planned, errors
 
 
-def _get_price_on_or_before(db: Session, asset_id: int, as_of: date | None) -> Decimal | None:
-    if as_of is None:
-        return None
-    price = (
-        db.execute(
-            select(PriceHistory)
-            .where(PriceHistory.asset_id == asset_id, PriceHistory.date <= as_of)
-            .order_by(PriceHistory.date.desc(), PriceHistory.id.desc())
-            .limit(1)
-        )
-        .scalars()
-        .first()
+def _insert_drip_trades(db: Session, trades: list[dict]) -> list[int]:
+    """Insert planned DRIP trades and their TRADE_EXPENSE rows with executemany; returns the trade ids."""
+    if not trades:
+        return []
+    trade_ids = list(
+        db.execute(insert(Trade).returning(Trade.id, sort_by_parameter_order=True), trades).scalars()
     )
-    return price.close if price else None
+    expenses = [trade_expense_values(Trade(id=trade_id, **data)) for trade_id, data in zip(trade_ids, trades)]
+    db.execute(insert(CashTransaction), expenses)
+    adjust_cash_balances(db, [(e["account_id"], e["date"], e["amount"]) for e in expenses])
+    return trade_ids
+
+
+def _apply_drip(db: Session, action: CorporateAction) -> int:
+    planned, errors = _plan_drips(db, _drip_actions(db, [action.id]))
+    if errors:
+        raise ValueError(errors[0]["error"])
+    trades = planned[action.id]
+    _insert_drip_trades(db, trades)
+    return len(trades)
+
+
+def process_pending_drips(db: Session) -> dict:
+    """
+    Process every unprocessed DRIP action in date order, in one transaction.
+
+    Prices, dividends and cash balances are prefetched in bulk, the trades of all actions
+    are inserted together, and lots and position state are rebuilt once per affected
+    (portfolio, asset) rather than once per action. Actions that cannot be booked stay
+    pending and are listed in ``errors``.
+    """
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    with UnitOfWork(db):
+        actions = _drip_actions(db)
+        planned, errors = _plan_drips(db, actions)
+        trades = [data for action in actions for data in planned.get(action.id, [])]
+        _insert_drip_trades(db, trades)
+        processed = [action for action in actions if action.id in planned]
+        if processed:
+            db.execute(
+                update(CorporateAction)
+                .where(CorporateAction.id.in_([action.id for action in processed]))
+                .values(processed_at=datetime.now(timezone.utc)),
+                execution_options={"synchronize_session": False},
+            )
+        timings["apply_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        # A DRIP leaves the replay once processed; unless its ratio is 1 that rescales
+        # every holder of the asset, not only the portfolios that reinvested.
+        rescaled: dict[int, date] = {}
+        for action in processed:
+            if action.ratio != 1:
+                rescaled[action.asset_id] = min(action.date, rescaled.get(action.asset_id, action.date))
+        touched: dict[tuple[int, int], date] = {}
+        for data in trades:
+            key = (data["portfolio_id"], data["asset_id"])
+            touched[key] = min(data["trade_date"], touched.get(key, data["trade_date"]))
+
+        # One aggregate rebuild per asset also keeps the index on the stored, rounded quantities.
+        for asset_id in sorted({action.asset_id for action in processed}):
+            rebuild_adjustment_factors(db, asset_id)
+            rebuild_share_index(db, asset_id)
+        lots = 0
+        for asset_id in sorted(rescaled):
+            lots += rebuild_asset_tax_lots(db, asset_id)["portfolios"]
+        for (portfolio_id, asset_id), from_date in sorted(touched.items()):
+            if asset_id not in rescaled:
+                rebuild_tax_lots(db, portfolio_id, asset_id, from_date)
+                lots += 1
+        timings["lots_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        for asset_id, from_date in sorted(rescaled.items()):
+            refresh_asset_states(db, asset_id, from_date)
+        for (portfolio_id, asset_id), from_date in sorted(touched.items()):
+            if asset_id not in rescaled:
+                refresh_position_state(db, portfolio_id, asset_id, from_date)
+        timings["states_ms"] = _elapsed_ms(started)
+    if processed:
+        invalidate_all_portfolios(db)
+
+    errors.sort(key=lambda err: err["action_id"])
+    return {
+        "processed": [action.id for action in processed],
+        "trades_created": len(trades),
+        "errors": errors,
+        "lots_rebuilt": lots,
+        "timings_ms": timings,
+    }
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.portfolio import Portfolio
+from app.services.cache import cache_get_or_compute, portfolio_cache_key
+from app.services.cash_ledger_service import get_account_cash_balances
+from app.services.fx_service import FxRateIndex, get_fx_index
+from app.services.pnl_service import pnl_cash_totals
+from app.services.position_service import _initial_positions_from_snapshot
+from app.services.price_service import get_latest_prices
+from app.services.replay_engine import AvgCostHoldings, apply_event, load_events, replay
+
+
+def _valuation(
+    db: Session, holdings: AvgCostHoldings, on: date, base_currency: str, fx: FxRateIndex
+) -> tuple[Decimal, Decimal, set[int]]:
+    """
+    Market value and unrealized P&L of ``holdings`` at the latest prices on or before ``on``.
+
+    Both are in ``base_currency``, each position converted at the ``on`` rate as
+    ``get_positions(in_base_currency=True)`` does; positions with no rate are left out
+    and their asset ids returned.
+    """
+    last_prices = get_latest_prices(db, list(holdings.positions.keys()), on)
+    market_value = Decimal("0")
+    unrealized = Decimal("0")
+    unconverted: set[int] = set()
+    for asset_id, pos in holdings.positions.items():
+        lp = last_prices.get(asset_id)
+        if lp is None or pos.shares <= 0:
+            continue
+        rate = fx.rate(pos.asset.currency, base_currency, on)
+        if rate is None:
+            unconverted.add(asset_id)
+            continue
+        market_value += pos.shares * lp * rate
+        unrealized += (pos.shares * lp - pos.cost_basis) * rate
+    return market_value, unrealized, unconverted
+
+
+def compute_portfolio_dashboard(db: Session, portfolio: Portfolio, as_of: date) -> dict:
+    """
+    One portfolio's dashboard figures on ``as_of``, with the day before from the same replay.
+
+    The replay is seeded from the latest valid snapshot before ``as_of``, valued once it
+    has passed the previous day and again at ``as_of``. Total P&L is the inception-to-date
+    ``total_return`` of ``/reports/pnl/summary``. Every amount is converted into the
+    portfolio's base currency: positions at the rate of the day they are valued,
+    realized P&L, income and cash balances at the ``as_of`` rate of their asset or
+    account currency. Positions and accounts with no rate are left out and listed in
+    ``unconverted_asset_ids`` and ``unconverted_account_ids``.
+    """
+    base = portfolio.base_currency
+    previous = as_of - timedelta(days=1)
+    positions, start_date = _initial_positions_from_snapshot(db, portfolio.id, previous)
+    events = load_events(db, portfolio.id, up_to=as_of, after=start_date)
+    accounts = get_account_cash_balances(db, portfolio.id, as_of)
+    currencies = {base, *(pos.asset.currency for pos in positions.values())}
+    currencies.update(ev.obj.asset.currency for ev in events if ev.obj.asset is not None)
+    currencies.update(currency for _, currency, _ in accounts)
+    fx = get_fx_index(db, currencies)
+    holdings = AvgCostHoldings(positions)
+
+    idx = 0
+    while idx < len(events) and events[idx].date <= previous:
+        apply_event(events[idx], holdings)
+        idx += 1
+    previous_value, _, previous_unconverted = _valuation(db, holdings, previous, base, fx)
+    replay(events[idx:], holdings)
+    market_value, unrealized, unconverted_assets = _valuation(db, holdings, as_of, base, fx)
+    unconverted_assets |= previous_unconverted
+
+    realized = Decimal("0")
+    for asset_id, pos in holdings.positions.items():
+        if pos.realized_pnl:
+            rate = fx.rate(pos.asset.currency, base, as_of)
+            if rate is None:
+                unconverted_assets.add(asset_id)
+            else:
+                realized += pos.realized_pnl * rate
+
+    cash_balance = Decimal("0")
+    income = Decimal("0")
+    unconverted_accounts: list[int] = []
+    for currency in sorted({currency for _, currency, _ in accounts}):
+        rate = fx.rate(currency, base, as_of)
+        if rate is None:
+            unconverted_accounts.extend(account_id for account_id, ccy, _ in accounts if ccy == currency)
+            continue
+        cash_balance += sum((balance for _, ccy, balance in accounts if ccy == currency), Decimal("0")) * rate
+        cash = pnl_cash_totals(db, portfolio.id, {"ITD": None}, as_of, currency=currency)["ITD"]
+        income += (cash.dividend + cash.reward + cash.other) * rate
+
+    return {
+        "portfolio_id": portfolio.id,
+        "name": portfolio.name,
+        "base_currency": base,
+        "market_value": market_value,
+        "previous_market_value": previous_value,
+        "day_change_amount": market_value - previous_value,
+        "cash_balance": cash_balance,
+        "total_pnl": realized + unrealized + income,
+        "unconverted_asset_ids": sorted(unconverted_assets),
+        "unconverted_account_ids": sorted(unconverted_accounts),
+    }
+
+
+def get_dashboard(db: Session, as_of: date | None = None, currency: str | None = None) -> dict:
+    """
+    Dashboard totals across every portfolio, in one reporting currency.
+
+    Each portfolio's figures are cached under its generation, so a write only recomputes
+    the portfolio it touched. The per-portfolio figures are in the portfolio's base
+    currency; the totals convert them at the ``as_of`` rate into ``currency`` (default
+    ``settings.dashboard_currency``). Portfolios with no rate to it are left out of the
+    totals and listed in ``unconverted_portfolio_ids``.
+    """
+    if as_of is None:
+        as_of = datetime.now(timezone.utc).date()
+    currency = currency or settings.dashboard_currency
+    portfolios = db.execute(select(Portfolio).order_by(Portfolio.id)).scalars().all()
+
+    items: list[dict] = []
+    for portfolio in portfolios:
+        items.append(
+            cache_get_or_compute(
+                portfolio_cache_key(portfolio.id, "dashboard", as_of),
+                lambda portfolio=portfolio: compute_portfolio_dashboard(db, portfolio, as_of),
+                ttl_seconds=settings.cache_ttl_seconds,
+            )
+        )
+
+    fx = get_fx_index(db, {currency, *(item["base_currency"] for item in items)})
+    converted: list[tuple[dict, Decimal]] = []
+    unconverted: list[int] = []
+    for item in items:
+        rate = fx.rate(item["base_currency"], currency, as_of)
+        if rate is None:
+            unconverted.append(item["portfolio_id"])
+        else:
+            converted.append((item, rate))
+
+    def total(field: str) -> Decimal:
+        return sum((Decimal(item[field]) * rate for item, rate in converted), Decimal("0"))
+
+    market_value = total("market_value")
+    previous_value = total("previous_market_value")
+    cash_balance = total("cash_balance")
+    day_change = market_value - previous_value
+    return {
+        "as_of": as_of,
+        "currency": currency,
+        "total_net_worth": market_value + cash_balance,
+        "market_value": market_value,
+        "day_change_amount": day_change,
+        "day_change_percent": day_change / previous_value * 100 if previous_value else Decimal("0"),
+        "total_pnl": total("total_pnl"),
+        "cash_balance": cash_balance,
+        "unconverted_portfolio_ids": unconverted,
+        "portfolios": items,
+    }
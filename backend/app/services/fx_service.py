@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal
+from typing import Iterable
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.models.fx_rate import FXRate
+
+
+class FxRateIndex:
+    """
+    As-of FX lookups over rate series held in memory.
+
+    Each (from, to) pair keeps parallel, date-sorted lists so a lookup is a bisect.
+    Pairs missing from the table are derived from the inverse rate, or triangulated
+    through a currency both sides have a rate against.
+    """
+
+    def __init__(self, rows: Iterable[tuple[date, str, str, Decimal]]):
+        self._dates: dict[tuple[str, str], list[date]] = {}
+        self._rates: dict[tuple[str, str], list[Decimal]] = {}
+        self._neighbours: dict[str, set[str]] = {}
+        # Rows must arrive sorted by date so each series is appended in order.
+        for fx_date, from_ccy, to_ccy, rate in rows:
+            pair = (from_ccy, to_ccy)
+            self._dates.setdefault(pair, []).append(fx_date)
+            self._rates.setdefault(pair, []).append(rate)
+            self._neighbours.setdefault(from_ccy, set()).add(to_ccy)
+            self._neighbours.setdefault(to_ccy, set()).add(from_ccy)
+
+    def _direct(self, from_ccy: str, to_ccy: str, as_of: date) -> tuple[date, Decimal] | None:
+        dates = self._dates.get((from_ccy, to_ccy))
+        if not dates:
+            return None
+        idx = bisect_right(dates, as_of) - 1
+        if idx < 0:
+            return None
+        return dates[idx], self._rates[(from_ccy, to_ccy)][idx]
+
+    def _leg(self, from_ccy: str, to_ccy: str, as_of: date) -> tuple[date, Decimal] | None:
+        direct = self._direct(from_ccy, to_ccy, as_of)
+        if direct is not None:
+            return direct
+        inverse = self._direct(to_ccy, from_ccy, as_of)
+        if inverse is not None and inverse[1] != 0:
+            return inverse[0], Decimal("1") / inverse[1]
+        return None
+
+    def rate(self, from_ccy: str, to_ccy: str, as_of: date) -> Decimal | None:
+        """Rate converting ``from_ccy`` into ``to_ccy`` on or before ``as_of``."""
+        if from_ccy == to_ccy:
+            return Decimal("1")
+        leg = self._leg(from_ccy, to_ccy, as_of)
+        if leg is not None:
+            return leg[1]
+
+        # Triangulate through the intermediate whose older leg is the most recent.
+        best: tuple[date, str, Decimal] | None = None
+        shared = self._neighbours.get(from_ccy, set()) & self._neighbours.get(to_ccy, set())
+        for via in sorted(shared):
+            first = self._leg(from_ccy, via, as_of)
+            second = self._leg(via, to_ccy, as_of)
+            if first is None or second is None:
+                continue
+            stale = min(first[0], second[0])
+            if best is None or stale > best[0]:
+                best = (stale, via, first[1] * second[1])
+        return best[2] if best is not None else None
+
+
+# Session.info key of the indexes loaded by one session, by currency set.
+_SESSION_INDEXES = "fx_indexes"
+
+
+def _load_index(db: Session, currencies: frozenset[str]) -> FxRateIndex:
+    # A rate touching any requested currency can be a direct, inverse or triangulation leg.
+    rows = db.execute(
+        select(FXRate.date, FXRate.from_currency, FXRate.to_currency, FXRate.rate)
+        .where(or_(FXRate.from_currency.in_(currencies), FXRate.to_currency.in_(currencies)))
+        .order_by(FXRate.date, FXRate.id)
+    ).all()
+    return FxRateIndex(rows)
+
+
+def get_fx_index(db: Session, currencies: Iterable[str]) -> FxRateIndex:
+    """
+    Index covering every rate that touches one of ``currencies``, loaded in one query.
+
+    Indexes are memoized on the session, so a request loads each currency set once.
+    Nothing outlives the session, so an FX write made through another worker cannot
+    leave a stale index behind.
+    """
+    key = frozenset(ccy for ccy in currencies if ccy)
+    indexes = db.info.setdefault(_SESSION_INDEXES, {})
+    index = indexes.get(key)
+    if index is None:
+        index = indexes[key] = _load_index(db, key)
+    return index
+
+
+def invalidate_fx_rates(db: Session) -> None:
+    """Drop the session's FX indexes after it changed the fx_rates table."""
+    db.info.pop(_SESSION_INDEXES, None)
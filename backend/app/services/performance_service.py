@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.models.account import Account
+from app.models.asset import Asset
+from app.models.cash_transaction import CashTransaction, CashTxnType
+from app.models.portfolio import Portfolio
+from app.models.price_history import PriceHistory
+from app.models.trade import Trade, TradeSide
+from app.services.cash_ledger_service import get_account_cash_balances
+from app.services.fx_service import FxRateIndex, get_fx_index
+from app.services.position_service import _initial_positions_from_snapshot
+from app.services.price_service import get_latest_prices
+from app.services.replay_engine import AvgCostHoldings, apply_event, load_events
+from app.services.timeseries_service import cut_dates
+
+_FLOW_TYPES = (CashTxnType.DEPOSIT, CashTxnType.WITHDRAW)
+_XIRR_TOLERANCE = 1e-10
+_XIRR_MAX_ITERATIONS = 100
+
+
+def _forward_fill(values: np.ndarray, known: np.ndarray) -> np.ndarray:
+    """Carry each column's last known value down the rows; rows before the first stay 0."""
+    rows = np.where(known, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = np.take_along_axis(values, rows, axis=0)
+    seen = np.maximum.accumulate(known, axis=0)
+    return np.where(seen, filled, 0.0)
+
+
+def _day_offsets(dates, days: np.ndarray) -> np.ndarray:
+    """Row of each date in ``days``; ordinals are much cheaper than converting dates to datetime64."""
+    first = days[0].item().toordinal()
+    return np.fromiter((on.toordinal() - first for on in dates), dtype=np.int64, count=len(dates))
+
+
+def _first_ledger_date(db: Session, portfolio_id: int) -> date | None:
+    firsts = [
+        db.execute(select(func.min(Trade.trade_date)).where(Trade.portfolio_id == portfolio_id)).scalar(),
+        db.execute(
+            select(func.min(CashTransaction.date)).where(CashTransaction.portfolio_id == portfolio_id)
+        ).scalar(),
+    ]
+    firsts = [first for first in firsts if first is not None]
+    return min(firsts) if firsts else None
+
+
+def _share_matrix(db: Session, portfolio_id: int, days: np.ndarray) -> tuple[list[int], np.ndarray]:
+    """Shares of every asset at the end of each of ``days``, from one replay seeded by a snapshot."""
+    positions, seeded_at = _initial_positions_from_snapshot(db, portfolio_id, days[0].item())
+    events = load_events(db, portfolio_id, up_to=days[-1].item(), after=seeded_at)
+    holdings = AvgCostHoldings(positions)
+
+    # Shares after the last event of each (day, asset); the seed counts as the first row.
+    changes: dict[tuple[int, int], float] = {(0, asset_id): float(pos.shares) for asset_id, pos in positions.items()}
+    first_day = days[0]
+    for event in events:
+        apply_event(event, holdings)
+        row = max(int((np.datetime64(event.date) - first_day).astype(int)), 0)
+        pos = holdings.positions.get(event.obj.asset_id)
+        if pos is not None:
+            changes[(row, event.obj.asset_id)] = float(pos.shares)
+
+    asset_ids = sorted(holdings.positions)
+    columns = {asset_id: col for col, asset_id in enumerate(asset_ids)}
+    values = np.zeros((len(days), len(asset_ids)))
+    known = np.zeros((len(days), len(asset_ids)), dtype=bool)
+    if changes:
+        rows = np.fromiter((row for row, _ in changes), dtype=np.int64, count=len(changes))
+        cols = np.fromiter((columns[asset_id] for _, asset_id in changes), dtype=np.int64, count=len(changes))
+        values[rows, cols] = np.fromiter(changes.values(), dtype=float, count=len(changes))
+        known[rows, cols] = True
+    return asset_ids, _forward_fill(values, known)
+
+
+def _price_matrix(db: Session, asset_ids: list[int], days: np.ndarray) -> np.ndarray:
+    """Latest close on or before each day for each asset (0 before its first price), from one range query."""
+    values = np.zeros((len(days), len(asset_ids)))
+    known = np.zeros((len(days), len(asset_ids)), dtype=bool)
+    if not asset_ids:
+        return values
+    first, last = days[0].item(), days[-1].item()
+    columns = {asset_id: col for col, asset_id in enumerate(asset_ids)}
+    for asset_id, close in get_latest_prices(db, asset_ids, first).items():
+        values[0, columns[asset_id]] = float(close)
+        known[0, columns[asset_id]] = True
+    rows = db.execute(
+        select(PriceHistory.asset_id, PriceHistory.date, PriceHistory.close).where(
+            PriceHistory.asset_id.in_(asset_ids), PriceHistory.date > first, PriceHistory.date <= last
+        )
+    ).all()
+    if rows:
+        cols = np.fromiter((columns[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        offsets = _day_offsets([row[1] for row in rows], days)
+        values[offsets, cols] = np.fromiter((float(row[2]) for row in rows), dtype=float, count=len(rows))
+        known[offsets, cols] = True
+    return _forward_fill(values, known)
+
+
+def _daily_sums(db: Session, stmt, days: np.ndarray) -> dict[str, np.ndarray]:
+    """Scatter (currency, date, amount) rows of a GROUP BY into a per-day array per currency."""
+    sums: dict[str, np.ndarray] = {}
+    rows = db.execute(stmt).all()
+    if rows:
+        offsets = _day_offsets([row[1] for row in rows], days)
+        for offset, (currency, _, amount) in zip(offsets, rows):
+            sums.setdefault(currency, np.zeros(len(days)))[offset] += float(amount)
+    return sums
+
+
+def _rate_matrix(fx: FxRateIndex, currencies: list[str], base: str, days: np.ndarray) -> np.ndarray:
+    """Rate from each of ``currencies`` (columns) into ``base`` on each day; NaN where there is none."""
+    dates = [day.item() for day in days]
+    by_currency: dict[str, np.ndarray] = {}
+    for currency in currencies:
+        if currency not in by_currency:
+            rates = (fx.rate(currency, base, on) for on in dates)
+            by_currency[currency] = np.fromiter(
+                (np.nan if rate is None else float(rate) for rate in rates), dtype=float, count=len(dates)
+            )
+    matrix = np.ones((len(days), len(currencies)))
+    for col, currency in enumerate(currencies):
+        matrix[:, col] = by_currency[currency]
+    return matrix
+
+
+def _to_base(
+    values: np.ndarray, rates: np.ndarray, needed: np.ndarray, currencies: list[str], base: str, days: np.ndarray
+) -> np.ndarray:
+    """``values`` (day x column) times ``rates``; ValueError on the first ``needed`` cell without a rate."""
+    missing = np.isnan(rates) & needed
+    if missing.any():
+        row, col = np.argwhere(missing)[0]
+        raise ValueError(f"No FX rate from {currencies[col]} to {base} on {days[row].item()}")
+    return np.where(np.isnan(rates), 0.0, values * np.nan_to_num(rates))
+
+
+def _cash_series(
+    db: Session, portfolio_id: int, days: np.ndarray, base: str, fx: FxRateIndex
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cash held at the end of each day, and the DEPOSIT/WITHDRAW flows booked on it, in ``base``.
+
+    Sale proceeds are not booked as cash transactions, so the net proceeds of SELLs
+    are added to the ledger balance; otherwise every sale would read as a loss. They
+    are converted into the settlement currency with the trade's ``fx_rate``, the same
+    way ``trade_total_cost`` converts the TRADE_EXPENSE of a BUY. Each account
+    currency is summed on its own and converted into ``base`` at that day's rate.
+    """
+    first, last = days[0].item(), days[-1].item()
+    in_portfolio = Account.portfolio_id == portfolio_id
+    converted = (
+        Trade.fx_rate.is_not(None)
+        & (Trade.asset_currency != "")
+        & (Trade.settlement_currency != "")
+        & (Trade.asset_currency != Trade.settlement_currency)
+    )
+    proceeds = (Trade.quantity * Trade.price - Trade.fee - Trade.tax) * case((converted, Trade.fx_rate), else_=1)
+    sells = [Trade.portfolio_id == portfolio_id, Trade.side == TradeSide.SELL]
+
+    opening: dict[str, float] = {}
+    for _, currency, balance in get_account_cash_balances(db, portfolio_id, first):
+        opening[currency] = opening.get(currency, 0.0) + float(balance)
+    opening_sales = db.execute(
+        select(Account.currency, func.sum(proceeds))
+        .join(Account, Account.id == Trade.account_id)
+        .where(*sells, Trade.trade_date <= first)
+        .group_by(Account.currency)
+    ).all()
+    for currency, amount in opening_sales:
+        opening[currency] = opening.get(currency, 0.0) + float(amount or 0)
+    ledger = _daily_sums(
+        db,
+        select(Account.currency, CashTransaction.date, func.sum(CashTransaction.amount))
+        .join(Account, Account.id == CashTransaction.account_id)
+        .where(in_portfolio, CashTransaction.date > first, CashTransaction.date <= last)
+        .group_by(Account.currency, CashTransaction.date),
+        days,
+    )
+    sales = _daily_sums(
+        db,
+        select(Account.currency, Trade.trade_date, func.sum(proceeds))
+        .join(Account, Account.id == Trade.account_id)
+        .where(*sells, Trade.trade_date > first, Trade.trade_date <= last)
+        .group_by(Account.currency, Trade.trade_date),
+        days,
+    )
+    flows = _daily_sums(
+        db,
+        select(Account.currency, CashTransaction.date, func.sum(CashTransaction.amount))
+        .join(Account, Account.id == CashTransaction.account_id)
+        .where(
+            in_portfolio,
+            CashTransaction.type.in_(_FLOW_TYPES),
+            CashTransaction.date > first,
+            CashTransaction.date <= last,
+        )
+        .group_by(Account.currency, CashTransaction.date),
+        days,
+    )
+
+    currencies = sorted(set(opening) | set(ledger) | set(sales) | set(flows))
+    zeros = np.zeros(len(days))
+    held = np.zeros((len(days), len(currencies)))
+    booked = np.zeros((len(days), len(currencies)))
+    for col, currency in enumerate(currencies):
+        held[:, col] = opening.get(currency, 0.0) + np.cumsum(ledger.get(currency, zeros) + sales.get(currency, zeros))
+        booked[:, col] = flows.get(currency, zeros)
+    rates = _rate_matrix(fx, currencies, base, days)
+    cash = _to_base(held, rates, ~np.isclose(held, 0.0), currencies, base, days).sum(axis=1)
+    flows_base = _to_base(booked, rates, booked != 0, currencies, base, days).sum(axis=1)
+    return cash, flows_base
+
+
+def time_weighted_returns(values: np.ndarray, flows: np.ndarray) -> np.ndarray:
+    """
+    Daily returns chain-linked around external flows, which are taken at the start of the day.
+
+    ``values[0]`` is the opening value; the result has one return per later day, 0 on a
+    day that starts with nothing invested.
+    """
+    base = values[:-1] + flows[1:]
+    safe = np.where(base > 0, base, 1.0)
+    return np.where(base > 0, values[1:] / safe - 1.0, 0.0)
+
+
+def xirr(amounts: np.ndarray, years: np.ndarray) -> float | None:
+    """
+    Annual rate at which ``amounts`` dated ``years`` after the first one have a zero net present value.
+
+    Newton's method from 10%, falling back to bisection over (-99.99%, 1e6%) when it
+    leaves the domain or does not converge. None when the flows never change sign.
+    """
+    if not (np.any(amounts > 0) and np.any(amounts < 0)):
+        return None
+
+    def npv(rate: float) -> float:
+        return float(np.sum(amounts * np.power(1.0 + rate, -years)))
+
+    rate = 0.1
+    for _ in range(_XIRR_MAX_ITERATIONS):
+        growth = np.power(1.0 + rate, -years)
+        value = float(np.sum(amounts * growth))
+        slope = float(np.sum(-years * amounts * growth / (1.0 + rate)))
+        if slope == 0 or not np.isfinite(slope):
+            break
+        step = value / slope
+        rate -= step
+        if rate <= -1 or not np.isfinite(rate):
+            break
+        if abs(step) < _XIRR_TOLERANCE:
+            return rate
+
+    low, high = -0.9999, 1e4
+    npv_low, npv_high = npv(low), npv(high)
+    if np.sign(npv_low) == np.sign(npv_high):
+        return None
+    for _ in range(200):
+        mid = (low + high) / 2
+        npv_mid = npv(mid)
+        if abs(high - low) < _XIRR_TOLERANCE:
+            break
+        if np.sign(npv_mid) == np.sign(npv_low):
+            low, npv_low = mid, npv_mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def day_range(from_date: date, to_date: date) -> np.ndarray:
+    """Calendar days from the day before ``from_date`` (the opening day) through ``to_date``."""
+    return np.arange(
+        np.datetime64(from_date - timedelta(days=1)),
+        np.datetime64(to_date + timedelta(days=1)),
+        dtype="datetime64[D]",
+    )
+
+
+def daily_valuation(
+    db: Session, portfolio_id: int, days: np.ndarray
+) -> tuple[list[int], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Asset ids, share and close matrices (day x asset), portfolio values and external flows for ``days``.
+
+    The value of a day is its market value plus cash, from one replay, one price range
+    query and a few grouped cash queries. Closes, values and flows are in the portfolio's
+    base currency, converted at each day's rate; ValueError when an amount held or moved
+    has no rate into it that day, rather than summing currencies.
+    """
+    base = db.execute(select(Portfolio.base_currency).where(Portfolio.id == portfolio_id)).scalar_one()
+    asset_ids, shares = _share_matrix(db, portfolio_id, days)
+    prices = _price_matrix(db, asset_ids, days)
+    asset_currencies = dict(db.execute(select(Asset.id, Asset.currency).where(Asset.id.in_(asset_ids))).all())
+    account_currencies = db.execute(
+        select(Account.currency).where(Account.portfolio_id == portfolio_id).distinct()
+    ).scalars()
+    fx = get_fx_index(db, {base, *asset_currencies.values(), *account_currencies})
+
+    currencies = [asset_currencies[asset_id] for asset_id in asset_ids]
+    rates = _rate_matrix(fx, currencies, base, days)
+    prices = _to_base(prices, rates, (shares != 0) & (prices != 0), currencies, base, days)
+    cash, flows = _cash_series(db, portfolio_id, days, base, fx)
+    values = (shares * prices).sum(axis=1) + cash
+    return asset_ids, shares, prices, values, flows
+
+
+def report_range(db: Session, portfolio_id: int, from_date: date | None, to_date: date | None) -> tuple[date, date]:
+    """Default a report range to [first ledger date, today]; ValueError when it is reversed."""
+    if to_date is None:
+        to_date = datetime.now(timezone.utc).date()
+    if from_date is None:
+        from_date = min(_first_ledger_date(db, portfolio_id) or to_date, to_date)
+    if from_date > to_date:
+        raise ValueError("from must be on or before to")
+    return from_date, to_date
+
+
+def compute_performance(
+    db: Session,
+    portfolio_id: int,
+    from_date: date | None = None,
+    to_date: date | None = None,
+    step: str = "day",
+) -> dict:
+    """
+    Time-weighted and money-weighted return of a portfolio over [from_date, to_date].
+
+    The portfolio is valued every day by ``daily_valuation``, laid out as NumPy arrays.
+    TWR chain-links the daily returns around DEPOSIT/WITHDRAW flows; XIRR discounts
+    the opening value, those flows and the closing value, all in the portfolio's base
+    currency. ``step`` only thins the returned series.
+    """
+    from_date, to_date = report_range(db, portfolio_id, from_date, to_date)
+    opening_day = from_date - timedelta(days=1)
+    _, _, _, values, flows = daily_valuation(db, portfolio_id, day_range(from_date, to_date))
+
+    returns = time_weighted_returns(values, flows)
+    growth = np.cumprod(1.0 + returns)
+    twr = float(growth[-1] - 1.0) if len(growth) else 0.0
+    period_days = len(returns)
+    twr_annualized = (1.0 + twr) ** (365.0 / period_days) - 1.0 if period_days >= 365 and twr > -1 else None
+
+    # Investor view: money put in is negative, the closing value is returned at the end.
+    amounts = -flows.copy()
+    amounts[0] = -values[0]
+    amounts[-1] += values[-1]
+    dated = np.flatnonzero(amounts)
+    rate = xirr(amounts[dated], dated / 365.0) if len(dated) else None
+
+    series: list[dict] = []
+    offsets = {cut: (cut - opening_day).days for cut in cut_dates(from_date, to_date, step)}
+    for cut, idx in offsets.items():
+        series.append(
+            {
+                "date": cut,
+                "value": round(float(values[idx]), 6),
+                "net_flow": round(float(flows[idx]), 6),
+                "daily_return": float(returns[idx - 1]),
+                "cumulative_twr": float(growth[idx - 1] - 1.0),
+            }
+        )
+    return {
+        "portfolio_id": portfolio_id,
+        "from_date": from_date,
+        "to_date": to_date,
+        "start_value": round(float(values[0]), 6),
+        "end_value": round(float(values[-1]), 6),
+        "net_flows": round(float(flows[1:].sum()), 6),
+        "twr": twr,
+        "twr_annualized": twr_annualized,
+        "xirr": rate,
+        "series": series,
+    }
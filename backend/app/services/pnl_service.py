@@ -1,43 +1,69 @@
 from __future__ import annotations
 
-from datetime import date, datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
-from typing import Dict
 
-from sqlalchemy import select
+from sqlalchemy import case, func, literal, select
 from sqlalchemy.orm import Session
 
-from app.models.trade import Trade, TradeSide
+from app.models.account import Account
 from app.models.cash_transaction import CashTransaction, CashTxnType
-from app.models.price_history import PriceHistory
-from app.models.asset import Asset
-from app.models.corporate_action import CorporateAction
+from app.services.position_service import _initial_positions_from_snapshot
+from app.services.price_service import get_latest_prices
+from app.services.replay_engine import AvgCostHoldings, RealizedPnLCuts, RealizedPnLWindow, load_events, replay
 
+PNL_WINDOWS = ("MTD", "QTD", "YTD", "1Y", "ITD")
 
-class HoldingState:
-    def __init__(self, asset: Asset):
-        self.asset = asset
-        self.shares: Decimal = Decimal("0")
-        self.cost_basis: Decimal = Decimal("0")
+_INCOME_DIVIDEND = {CashTxnType.DIVIDEND_CASH}
+_INCOME_REWARD = {CashTxnType.REWARD, CashTxnType.FEE_REBATE, CashTxnType.TAX_REFUND}
+_INCOME_OTHER = {CashTxnType.INTEREST, CashTxnType.OTHER}
+_INVESTED = {CashTxnType.DEPOSIT, CashTxnType.WITHDRAW}
 
-    @property
-    def avg_cost(self) -> Decimal:
-        return self.cost_basis / self.shares if self.shares > 0 else Decimal("0")
 
+class _CashTotals:
+    """Income and invested cash flow of a window, summed by cash transaction type."""
 
-def _last_prices(db: Session, asset_ids: list[int], as_of: date) -> Dict[int, Decimal | None]:
-    if not asset_ids:
-        return {}
-    stmt = (
-        select(PriceHistory)
-        .where(PriceHistory.asset_id.in_(asset_ids), PriceHistory.date <= as_of)
-        .order_by(PriceHistory.asset_id, PriceHistory.date.desc())
-    )
-    prices: Dict[int, Decimal | None] = {}
-    for ph in db.execute(stmt).scalars():
-        if ph.asset_id not in prices:
-            prices[ph.asset_id] = ph.close
-    return prices
+    def __init__(self) -> None:
+        self.dividend = Decimal("0")
+        self.reward = Decimal("0")
+        self.other = Decimal("0")
+        self.invested = Decimal("0")
+
+    def add(self, tx_type: CashTxnType, amount: Decimal, withholding_tax: Decimal) -> None:
+        if tx_type in _INCOME_DIVIDEND:
+            self.dividend += amount - withholding_tax
+        elif tx_type in _INCOME_REWARD:
+            self.reward += amount
+        elif tx_type in _INCOME_OTHER:
+            self.other += amount
+        elif tx_type in _INVESTED:
+            self.invested += amount
+
+
+def _unrealized(db: Session, holdings: AvgCostHoldings, as_of: date) -> Decimal:
+    last_prices = get_latest_prices(db, list(holdings.positions.keys()), as_of)
+    unrealized = Decimal("0")
+    for asset_id, h in holdings.positions.items():
+        lp = last_prices.get(asset_id)
+        if lp is not None and h.shares > 0:
+            market_value = h.shares * lp
+            unrealized += market_value - h.cost_basis
+    return unrealized
+
+
+def _summary(realized: Decimal, unrealized: Decimal, cash: _CashTotals) -> dict:
+    income_total = cash.dividend + cash.reward + cash.other
+    price_return = realized + unrealized
+    return {
+        "realized_pnl": realized,
+        "income_total": income_total,
+        "income_dividend": cash.dividend,
+        "income_reward": cash.reward,
+        "unrealized_pnl": unrealized,
+        "price_return": price_return,
+        "total_return": price_return + income_total,
+        "invested_cashflow": cash.invested,
+    }
 
 
 def compute_pnl_summary(
@@ -50,104 +76,17 @@ def compute_pnl_summary(
     if as_of is None:
         as_of = datetime.now(timezone.utc).date()
 
-    trades: list[Trade] = db.execute(
-        select(Trade)
-        .where(Trade.portfolio_id == portfolio_id, Trade.trade_date <= as_of)
-        .order_by(Trade.trade_date, Trade.id)
-    ).scalars().all()
-
-    actions: list[CorporateAction] = db.execute(
-        select(CorporateAction)
-        .join(Asset)
-        .where(
-            Asset.id == CorporateAction.asset_id,
-            CorporateAction.processed_at.is_(None),
-            CorporateAction.date <= as_of,
-        )
-        .order_by(CorporateAction.date, CorporateAction.id)
-    ).scalars().all()
-
-    stock_dividends: list[CashTransaction] = db.execute(
-        select(CashTransaction)
-        .where(
-            CashTransaction.portfolio_id == portfolio_id,
-            CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
-            CashTransaction.date <= as_of,
-        )
-        .order_by(CashTransaction.date, CashTransaction.id)
-    ).scalars().all()
-
-    holdings: Dict[int, HoldingState] = {}
-    realized = Decimal("0")
-
-    timeline = []
-    for act in actions:
-        timeline.append((act.date, 0, "action", act))
-    for div in stock_dividends:
-        timeline.append((div.date, 1, "stock_div", div))
-    for tr in trades:
-        timeline.append((tr.trade_date, 2, "trade", tr))
-    timeline.sort(key=lambda x: (x[0], x[1]))
-
-    for _, _, kind, obj in timeline:
-        if kind == "action":
-            act: CorporateAction = obj
-            asset = act.asset
-            if asset.id not in holdings:
-                holdings[asset.id] = HoldingState(asset)
-            h = holdings[asset.id]
-            ratio = Decimal(act.numerator) / Decimal(act.denominator)
-            h.shares *= ratio
-            if h.shares <= 0:
-                h.cost_basis = Decimal("0")
-        elif kind == "stock_div":
-            div: CashTransaction = obj
-            if div.shares is None or div.shares <= 0:
-                continue
-            asset = div.asset
-            if asset is None:
-                continue
-            if asset.id not in holdings:
-                holdings[asset.id] = HoldingState(asset)
-            h = holdings[asset.id]
-            h.shares += div.shares
-            if h.shares <= 0:
-                h.cost_basis = Decimal("0")
-        else:
-            trade: Trade = obj
-            asset = trade.asset
-            if asset.id not in holdings:
-                holdings[asset.id] = HoldingState(asset)
-            h = holdings[asset.id]
-
-            if trade.side == TradeSide.BUY:
-                total_cost = trade.quantity * trade.price + trade.fee + trade.tax
-                h.cost_basis += total_cost
-                h.shares += trade.quantity
-            elif trade.side == TradeSide.SELL:
-                avg_cost_now = h.avg_cost
-                proceeds = trade.quantity * trade.price - trade.fee - trade.tax
-                if from_date <= trade.trade_date <= to_date:
-                    realized += proceeds - (avg_cost_now * trade.quantity)
-                h.cost_basis -= avg_cost_now * trade.quantity
-                h.shares -= trade.quantity
-                if h.shares <= 0:
-                    h.shares = Decimal("0")
-                    h.cost_basis = Decimal("0")
-
-    # Income
-    income_types = {
-        CashTxnType.DIVIDEND_CASH,
-        CashTxnType.REWARD,
-        CashTxnType.INTEREST,
-        CashTxnType.FEE_REBATE,
-        CashTxnType.TAX_REFUND,
-        CashTxnType.OTHER,
-    }
-    income_dividend = Decimal("0")
-    income_reward = Decimal("0")
-    income_other = Decimal("0")
+    # Sells before from_date are outside the window, so the replay can start from the
+    # latest valid snapshot before it instead of the first event.
+    positions, start_date = _initial_positions_from_snapshot(
+        db, portfolio_id, min(from_date - timedelta(days=1), as_of)
+    )
+    events = load_events(db, portfolio_id, up_to=as_of, after=start_date)
+    holdings = AvgCostHoldings(positions)
+    window = RealizedPnLWindow(holdings, from_date, to_date)
+    replay(events, holdings, window)
 
+    cash = _CashTotals()
     cash_txns: list[CashTransaction] = (
         db.execute(
             select(CashTransaction).where(
@@ -159,39 +98,103 @@ def compute_pnl_summary(
         .scalars()
         .all()
     )
-    invested_cashflow = Decimal("0")
     for tx in cash_txns:
-        if tx.type in income_types:
-            if tx.type == CashTxnType.DIVIDEND_CASH:
-                income_dividend += tx.amount - tx.withholding_tax
-            elif tx.type in {CashTxnType.REWARD, CashTxnType.FEE_REBATE, CashTxnType.TAX_REFUND}:
-                income_reward += tx.amount
-            else:
-                income_other += tx.amount
-        elif tx.type in {CashTxnType.DEPOSIT, CashTxnType.WITHDRAW}:
-            invested_cashflow += tx.amount
-
-    income_total = income_dividend + income_reward + income_other
-
-    # Unrealized as of
-    last_prices = _last_prices(db, list(holdings.keys()), as_of)
-    unrealized = Decimal("0")
-    for asset_id, h in holdings.items():
-        lp = last_prices.get(asset_id)
-        if lp is not None and h.shares > 0:
-            market_value = h.shares * lp
-            unrealized += market_value - h.cost_basis
-
-    price_return = realized + unrealized
-    total_return = price_return + income_total
-
-    return {
-        "realized_pnl": realized,
-        "income_total": income_total,
-        "income_dividend": income_dividend,
-        "income_reward": income_reward,
-        "unrealized_pnl": unrealized,
-        "price_return": price_return,
-        "total_return": total_return,
-        "invested_cashflow": invested_cashflow,
-    }
+        cash.add(tx.type, tx.amount, tx.withholding_tax)
+
+    return _summary(window.realized, _unrealized(db, holdings, as_of), cash)
+
+
+def pnl_window_start(window: str, as_of: date) -> date | None:
+    """First day of a named window ending on ``as_of``; None for inception (ITD)."""
+    if window == "MTD":
+        return as_of.replace(day=1)
+    if window == "QTD":
+        return as_of.replace(month=(as_of.month - 1) // 3 * 3 + 1, day=1)
+    if window == "YTD":
+        return as_of.replace(month=1, day=1)
+    if window == "1Y":
+        # The day after the same date a year earlier, so the window spans one year.
+        day = min(as_of.day, 28) if as_of.month == 2 else as_of.day
+        return as_of.replace(year=as_of.year - 1, day=day) + timedelta(days=1)
+    if window == "ITD":
+        return None
+    raise ValueError(f"Unknown P&L window: {window}")
+
+
+def pnl_cash_totals(
+    db: Session, portfolio_id: int, starts: dict[str, date | None], as_of: date, currency: str | None = None
+) -> dict[str, _CashTotals]:
+    """
+    Income and invested cash flow of each named window [start, ``as_of``] (None: since inception).
+
+    One GROUP BY over type and the date bucket between window starts serves every window.
+    Pass ``currency`` to sum only the transactions of accounts held in it.
+    """
+    bounds = sorted({start for start in starts.values() if start is not None})
+    # Bucket i holds [bounds[i], bounds[i + 1]); -1 is everything before the first start.
+    if bounds:
+        bucket = case(
+            *[(CashTransaction.date >= bound, idx) for idx, bound in reversed(list(enumerate(bounds)))],
+            else_=-1,
+        )
+    else:
+        bucket = literal(-1)
+    filters = [CashTransaction.portfolio_id == portfolio_id, CashTransaction.date <= as_of]
+    if None not in starts.values():
+        filters.append(CashTransaction.date >= bounds[0])
+    query = select(
+        CashTransaction.type,
+        bucket.label("bucket"),
+        func.sum(CashTransaction.amount),
+        func.sum(CashTransaction.withholding_tax),
+    )
+    if currency is not None:
+        query = query.join(Account, Account.id == CashTransaction.account_id)
+        filters.append(Account.currency == currency)
+    rows = db.execute(query.where(*filters).group_by(CashTransaction.type, bucket)).all()
+
+    totals: dict[str, _CashTotals] = {}
+    for window, start in starts.items():
+        first_bucket = -1 if start is None else bounds.index(start)
+        cash = totals[window] = _CashTotals()
+        for tx_type, idx, amount, withholding_tax in rows:
+            if idx >= first_bucket:
+                cash.add(CashTxnType(tx_type), Decimal(str(amount)), Decimal(str(withholding_tax)))
+    return totals
+
+
+def compute_pnl_windows(
+    db: Session, portfolio_id: int, windows: list[str], as_of: date | None = None
+) -> list[dict]:
+    """
+    P&L summaries of several windows ending on ``as_of``, from one replay and one cash query.
+
+    Each window equals ``compute_pnl_summary`` with ``from`` at its start and ``to`` at
+    ``as_of``. Realized P&L is cut as the timeline passes each window start, and cash is
+    summed with a single GROUP BY over type and the date bucket between window starts.
+    """
+    if as_of is None:
+        as_of = datetime.now(timezone.utc).date()
+    starts = {window: pnl_window_start(window, as_of) for window in windows}
+    bounds = sorted({start for start in starts.values() if start is not None})
+
+    seed_before = min(bounds[0] - timedelta(days=1), as_of) if bounds else as_of
+    positions, start_date = _initial_positions_from_snapshot(db, portfolio_id, seed_before)
+    events = load_events(db, portfolio_id, up_to=as_of, after=start_date)
+    holdings = AvgCostHoldings(positions)
+    cuts = RealizedPnLCuts(holdings, bounds)
+    replay(events, holdings, cuts)
+
+    cash = pnl_cash_totals(db, portfolio_id, starts, as_of)
+    unrealized = _unrealized(db, holdings, as_of)
+    results: list[dict] = []
+    for window, start in starts.items():
+        results.append(
+            {
+                "window": window,
+                "from_date": start,
+                "to_date": as_of,
+                **_summary(cuts.realized(start), unrealized, cash[window]),
+            }
+        )
+    return results
@@ -3,87 +3,49 @@ from __future__ import annotations
 from datetime import date, datetime, timezone
 from decimal import Decimal
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session, joinedload
 
-from app.models.trade import TradeSide, Trade
-from app.models.price_history import PriceHistory
 from app.models.asset import Asset
 from app.models.corporate_action import CorporateAction
-from app.models.cash_transaction import CashTransaction, CashTxnType
-from app.models.fx_rate import FXRate
 from app.models.portfolio import Portfolio
 from app.models.position_snapshot import PositionSnapshot
+from app.models.position_state import PositionState
+from app.services.fx_service import get_fx_index
+from app.services.price_service import get_latest_prices
+from app.services.replay_engine import AvgCostHoldings, Position, load_events, replay, replayed_actions
+from app.services.snapshot_invalidation import stale_from_subquery
 
 
-class Position:
-    def __init__(self, asset: Asset):
-        self.asset = asset
-        self.shares: Decimal = Decimal("0")
-        self.cost_basis: Decimal = Decimal("0")
-        self.realized_pnl: Decimal = Decimal("0")
-
-    @property
-    def avg_cost(self) -> Decimal:
-        return self.cost_basis / self.shares if self.shares > 0 else Decimal("0")
-
-    @classmethod
-    def from_snapshot(cls, snap: PositionSnapshot) -> "Position":
-        pos = cls(snap.asset)
-        pos.shares = snap.shares
-        pos.cost_basis = snap.cost_basis
-        pos.realized_pnl = snap.realized_pnl
-        return pos
-
-def _get_last_prices(db: Session, asset_ids: list[int], as_of: date) -> dict[int, Decimal | None]:
-    if not asset_ids:
-        return {}
-    stmt = (
-        select(PriceHistory)
-        .where(PriceHistory.asset_id.in_(asset_ids), PriceHistory.date <= as_of)
-        .order_by(PriceHistory.asset_id, PriceHistory.date.desc())
-    )
-    prices: dict[int, Decimal | None] = {}
-    for ph in db.execute(stmt).scalars():
-        if ph.asset_id not in prices:
-            prices[ph.asset_id] = ph.close
-    return prices
-
-
-def _get_fx_rate(db: Session, from_currency: str, to_currency: str, as_of: date) -> Decimal | None:
-    fx = (
+def _latest_snapshot_date(db: Session, portfolio_id: int, as_of: date) -> date | None:
+    """Latest snapshot on or before ``as_of`` that is older than the portfolio's stale watermark."""
+    stale_from = stale_from_subquery(portfolio_id)
+    return (
         db.execute(
-            select(FXRate)
+            select(PositionSnapshot.snapshot_date)
             .where(
-                FXRate.from_currency == from_currency,
-                FXRate.to_currency == to_currency,
-                FXRate.date <= as_of,
+                PositionSnapshot.portfolio_id == portfolio_id,
+                PositionSnapshot.snapshot_date <= as_of,
+                or_(stale_from.is_(None), PositionSnapshot.snapshot_date < stale_from),
             )
-            .order_by(FXRate.date.desc(), FXRate.id.desc())
+            .order_by(PositionSnapshot.snapshot_date.desc())
             .limit(1)
         )
         .scalars()
         .first()
     )
-    return fx.rate if fx else None
-
-
-def _apply_corporate_action(pos: Position, action: CorporateAction) -> None:
-    ratio = Decimal(action.numerator) / Decimal(action.denominator)
-    # cost_basis unchanged; redistribute over new share count.
-    pos.shares *= ratio
-    if pos.shares > 0:
-        # avg_cost recomputed through property when used; cost_basis unchanged.
-        pass
-    else:
-        pos.cost_basis = Decimal("0")
 
 
-def _latest_snapshot_date(db: Session, portfolio_id: int, as_of: date) -> date | None:
+def _keyframe_date(db: Session, portfolio_id: int, on: date) -> date | None:
+    """Latest keyframe snapshot date on or before ``on``."""
     return (
         db.execute(
             select(PositionSnapshot.snapshot_date)
-            .where(PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date <= as_of)
+            .where(
+                PositionSnapshot.portfolio_id == portfolio_id,
+                PositionSnapshot.snapshot_date <= on,
+                PositionSnapshot.is_keyframe.is_(True),
+            )
             .order_by(PositionSnapshot.snapshot_date.desc())
             .limit(1)
         )
@@ -92,27 +54,77 @@ def _latest_snapshot_date(db: Session, portfolio_id: int, as_of: date) -> date |
     )
 
 
+def _snapshot_rows(
+    db: Session, portfolio_id: int, snap_date: date, asset_id: int | None = None
+) -> list[PositionSnapshot]:
+    """
+    Rows making up the snapshot at ``snap_date``: the latest row per asset since its keyframe.
+
+    Only assets that changed are stored after a keyframe, so an asset's row is the last
+    one written between the keyframe and ``snap_date``; assets without one were not held.
+    """
+    filters = [PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date <= snap_date]
+    keyframe = _keyframe_date(db, portfolio_id, snap_date)
+    if keyframe is not None:
+        filters.append(PositionSnapshot.snapshot_date >= keyframe)
+    if asset_id is not None:
+        filters.append(PositionSnapshot.asset_id == asset_id)
+    latest: dict[int, PositionSnapshot] = {}
+    for snap in db.execute(select(PositionSnapshot).where(*filters).order_by(PositionSnapshot.snapshot_date)).scalars():
+        latest[snap.asset_id] = snap
+    return [latest[key] for key in sorted(latest)]
+
+
 def _initial_positions_from_snapshot(db: Session, portfolio_id: int, as_of: date) -> tuple[dict[int, Position], date | None]:
     snap_date = _latest_snapshot_date(db, portfolio_id, as_of)
     if snap_date is None:
         return {}, None
 
-    snapshots: list[PositionSnapshot] = (
+    positions: dict[int, Position] = {}
+    for snap in _snapshot_rows(db, portfolio_id, snap_date):
+        positions[snap.asset_id] = Position.from_snapshot(snap)
+    return positions, snap_date
+
+
+def _positions_from_state(db: Session, portfolio_id: int, as_of: date) -> dict[int, Position] | None:
+    """
+    Read current holdings from the maintained position state table.
+
+    Returns None when the portfolio has no state yet or when some state already includes
+    events dated after ``as_of``; callers then fall back to a replay.
+    """
+    states: list[PositionState] = (
         db.execute(
-            select(PositionSnapshot)
-            .where(
-                PositionSnapshot.portfolio_id == portfolio_id,
-                PositionSnapshot.snapshot_date == snap_date,
-            )
-            .order_by(PositionSnapshot.asset_id)
+            select(PositionState)
+            .options(joinedload(PositionState.asset))
+            .where(PositionState.portfolio_id == portfolio_id)
+            .order_by(PositionState.asset_id)
         )
         .scalars()
         .all()
     )
+    if not states or any(state.last_event_date > as_of for state in states):
+        return None
+
     positions: dict[int, Position] = {}
-    for snap in snapshots:
-        positions[snap.asset_id] = Position.from_snapshot(snap)
-    return positions, snap_date
+    for state in states:
+        pos = Position(state.asset)
+        pos.shares = state.shares
+        pos.cost_basis = state.cost_basis
+        pos.realized_pnl = state.realized_pnl
+        positions[state.asset_id] = pos
+
+    # A replay yields an empty position for every asset with a replayed corporate action.
+    action_assets = db.execute(
+        select(Asset)
+        .join(CorporateAction, CorporateAction.asset_id == Asset.id)
+        .where(replayed_actions(), CorporateAction.date <= as_of)
+        .distinct()
+    ).scalars()
+    for asset in action_assets:
+        if asset.id not in positions:
+            positions[asset.id] = Position(asset)
+    return positions
 
 
 def get_positions(
@@ -130,107 +142,27 @@ def get_positions(
     if not portfolio:
         return []
 
+    state_positions = None
+    if use_snapshots and as_of >= datetime.now(timezone.utc).date():
+        state_positions = _positions_from_state(db, portfolio_id, as_of)
+
     positions: dict[int, Position]
     start_date: date | None
-    if use_snapshots:
-        positions, start_date = _initial_positions_from_snapshot(db, portfolio_id, as_of)
+    if state_positions is not None:
+        positions = state_positions
     else:
-        positions, start_date = {}, None
-
-    trade_filters = [Trade.portfolio_id == portfolio_id, Trade.trade_date <= as_of]
-    if start_date:
-        trade_filters.append(Trade.trade_date > start_date)
-    trades: list[Trade] = (
-        db.execute(select(Trade).where(*trade_filters).order_by(Trade.trade_date, Trade.id)).scalars().all()
-    )
-
-    action_filters = [CorporateAction.date <= as_of]
-    if start_date:
-        action_filters.append(CorporateAction.date > start_date)
-    actions: list[CorporateAction] = (
-        db.execute(
-            select(CorporateAction)
-            .join(Asset)
-            .where(
-                Asset.id == CorporateAction.asset_id,
-                CorporateAction.processed_at.is_(None),
-                *action_filters,
-            )
-            .order_by(CorporateAction.date, CorporateAction.id)
-        )
-        .scalars()
-        .all()
-    )
-
-    stock_div_filters = [
-        CashTransaction.portfolio_id == portfolio_id,
-        CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
-        CashTransaction.date <= as_of,
-    ]
-    if start_date:
-        stock_div_filters.append(CashTransaction.date > start_date)
-    stock_dividends: list[CashTransaction] = (
-        db.execute(
-            select(CashTransaction)
-            .where(*stock_div_filters)
-            .order_by(CashTransaction.date, CashTransaction.id)
-        )
-        .scalars()
-        .all()
-    )
-
-    # merge timeline: corporate actions -> stock dividends -> trades (same day order fixed)
-    timeline = []
-    for act in actions:
-        timeline.append((act.date, 0, "action", act))
-    for div in stock_dividends:
-        timeline.append((div.date, 1, "stock_div", div))
-    for tr in trades:
-        timeline.append((tr.trade_date, 2, "trade", tr))
-    timeline.sort(key=lambda x: (x[0], x[1]))
-
-    for _, _, kind, obj in timeline:
-        if kind == "action":
-            action: CorporateAction = obj
-            asset = action.asset
-            if asset.id not in positions:
-                positions[asset.id] = Position(asset)
-            _apply_corporate_action(positions[asset.id], action)
-        elif kind == "stock_div":
-            div: CashTransaction = obj
-            if div.shares is None or div.shares <= 0:
-                continue
-            asset = div.asset
-            if asset is None:
-                continue
-            if asset.id not in positions:
-                positions[asset.id] = Position(asset)
-            pos = positions[asset.id]
-            pos.shares += div.shares
-            # cost_basis unchanged; avg_cost derived from property
+        if use_snapshots:
+            positions, start_date = _initial_positions_from_snapshot(db, portfolio_id, as_of)
         else:
-            trade: Trade = obj
-            asset = trade.asset
-            if asset.id not in positions:
-                positions[asset.id] = Position(asset)
-            pos = positions[asset.id]
+            positions, start_date = {}, None
 
-            if trade.side == TradeSide.BUY:
-                total_cost = trade.quantity * trade.price + trade.fee + trade.tax
-                pos.cost_basis += total_cost
-                pos.shares += trade.quantity
-            elif trade.side == TradeSide.SELL:
-                avg_cost_now = pos.avg_cost
-                proceeds = trade.quantity * trade.price - trade.fee - trade.tax
-                realized = proceeds - (avg_cost_now * trade.quantity)
-                pos.realized_pnl += realized
-                pos.cost_basis -= avg_cost_now * trade.quantity
-                pos.shares -= trade.quantity
-                if pos.shares <= 0:
-                    pos.shares = Decimal("0")
-                    pos.cost_basis = Decimal("0")
+        events = load_events(db, portfolio_id, up_to=as_of, after=start_date)
+        replay(events, AvgCostHoldings(positions))
 
-    last_prices = _get_last_prices(db, list(positions.keys()), as_of)
+    last_prices = get_latest_prices(db, list(positions.keys()), as_of)
+    fx_index = None
+    if in_base_currency:
+        fx_index = get_fx_index(db, {pos.asset.currency for pos in positions.values()} | {portfolio.base_currency})
 
     results: list[dict] = []
     for asset_id, pos in positions.items():
@@ -245,10 +177,7 @@ def get_positions(
         market_value_base = None
         unrealized_base = None
         if in_base_currency:
-            if pos.asset.currency == portfolio.base_currency:
-                fx_rate_used = Decimal("1")
-            else:
-                fx_rate_used = _get_fx_rate(db, pos.asset.currency, portfolio.base_currency, as_of)
+            fx_rate_used = fx_index.rate(pos.asset.currency, portfolio.base_currency, as_of)
             if fx_rate_used is not None and market_value is not None:
                 market_value_base = market_value * fx_rate_used
                 cost_basis_base = pos.cost_basis * fx_rate_used
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.models.asset import Asset
+from app.models.cash_transaction import CashTransaction, CashTxnType
+from app.models.position_state import PositionState
+from app.models.trade import Trade
+from app.services.cache_invalidation import portfolios_holding_asset
+from app.services.position_service import _latest_snapshot_date, _snapshot_rows
+from app.services.replay_engine import (
+    ACTION,
+    STOCK_DIV,
+    TRADE,
+    Accumulator,
+    AvgCostHoldings,
+    LedgerEvent,
+    Position,
+    load_events,
+    replay,
+)
+from app.services.snapshot_invalidation import mark_snapshots_stale
+
+# Sequence rank for state seeded from a snapshot: it already covers every event of that day.
+_END_OF_DAY = TRADE + 1
+
+EventKey = tuple[date, int, int]
+
+
+def _event_key(event: LedgerEvent) -> EventKey:
+    return (event.date, event.rank, event.obj.id)
+
+
+def _state_key(state: PositionState) -> EventKey:
+    return (state.last_event_date, state.last_event_rank, state.last_event_id)
+
+
+class _LastEventKeys(Accumulator):
+    """Track the last event key per asset and which assets have portfolio-owned events."""
+
+    def __init__(self) -> None:
+        self.keys: dict[int, EventKey] = {}
+        self.owned: set[int] = set()
+
+    def on_action(self, action) -> None:
+        self.keys[action.asset_id] = (action.date, ACTION, action.id)
+
+    def on_stock_dividend(self, div) -> None:
+        if div.asset_id is None:
+            return
+        self.keys[div.asset_id] = (div.date, STOCK_DIV, div.id)
+        self.owned.add(div.asset_id)
+
+    def on_trade(self, trade) -> None:
+        self.keys[trade.asset_id] = (trade.trade_date, TRADE, trade.id)
+        self.owned.add(trade.asset_id)
+
+
+def _get_state(db: Session, portfolio_id: int, asset_id: int) -> PositionState | None:
+    return (
+        db.execute(
+            select(PositionState)
+            .where(PositionState.portfolio_id == portfolio_id, PositionState.asset_id == asset_id)
+            .with_for_update()
+        )
+        .scalars()
+        .first()
+    )
+
+
+def _write_state(
+    db: Session,
+    state: PositionState | None,
+    portfolio_id: int,
+    asset_id: int,
+    pos: Position,
+    key: EventKey,
+) -> None:
+    if state is None:
+        state = PositionState(portfolio_id=portfolio_id, asset_id=asset_id)
+        db.add(state)
+    state.shares = pos.shares
+    state.cost_basis = pos.cost_basis
+    state.realized_pnl = pos.realized_pnl
+    state.last_event_date, state.last_event_rank, state.last_event_id = key
+
+
+def rebuild_position_states(db: Session, portfolio_id: int) -> None:
+    """Recompute every position state of a portfolio with one full replay."""
+    db.execute(delete(PositionState).where(PositionState.portfolio_id == portfolio_id))
+    holdings = AvgCostHoldings()
+    last_keys = _LastEventKeys()
+    replay(load_events(db, portfolio_id), holdings, last_keys)
+    for asset_id in last_keys.owned:
+        _write_state(db, None, portfolio_id, asset_id, holdings.positions[asset_id], last_keys.keys[asset_id])
+    db.flush()
+
+
+def _ensure_initialized(db: Session, portfolio_id: int) -> bool:
+    """Build state for the whole portfolio on its first write; returns True when it did."""
+    exists = db.execute(
+        select(PositionState.id).where(PositionState.portfolio_id == portfolio_id).limit(1)
+    ).first()
+    if exists is not None:
+        return False
+    rebuild_position_states(db, portfolio_id)
+    return True
+
+
+def refresh_position_state(db: Session, portfolio_id: int, asset_id: int, from_date: date | None) -> None:
+    """
+    Recompute one (portfolio, asset) state from ``from_date`` onwards.
+
+    The replay is seeded from the latest portfolio snapshot strictly before ``from_date``
+    so a backdated edit only replays the events after it. Pass ``None`` to replay from
+    the beginning. Every ledger write lands here or in ``_record_event``, so this is also
+    where snapshots on or after ``from_date`` are marked stale.
+    """
+    mark_snapshots_stale(db, portfolio_id, from_date)
+    if _ensure_initialized(db, portfolio_id):
+        return
+
+    asset = db.get(Asset, asset_id)
+    if asset is None:
+        return
+
+    seed_date = None
+    if from_date is not None:
+        seed_date = _latest_snapshot_date(db, portfolio_id, from_date - timedelta(days=1))
+    pos = Position(asset)
+    key: EventKey | None = None
+    if seed_date is not None:
+        snaps = _snapshot_rows(db, portfolio_id, seed_date, asset_id)
+        if snaps:
+            pos = Position.from_snapshot(snaps[0])
+            key = (seed_date, _END_OF_DAY, 0)
+
+    events = load_events(db, portfolio_id, asset_id=asset_id, after=seed_date)
+    owned = key is not None or any(ev.rank != ACTION for ev in events)
+    state = _get_state(db, portfolio_id, asset_id)
+    if not owned:
+        if state is not None:
+            db.delete(state)
+        return
+
+    replay(events, AvgCostHoldings({asset_id: pos}))
+    if events:
+        key = _event_key(events[-1])
+    _write_state(db, state, portfolio_id, asset_id, pos, key)
+
+
+def _record_event(db: Session, portfolio_id: int, asset_id: int, event: LedgerEvent) -> None:
+    mark_snapshots_stale(db, portfolio_id, event.date)
+    if _ensure_initialized(db, portfolio_id):
+        return
+    state = _get_state(db, portfolio_id, asset_id)
+    key = _event_key(event)
+    if state is None or key <= _state_key(state):
+        # First event for the asset or a backdated one: replay from its date.
+        refresh_position_state(db, portfolio_id, asset_id, event.date)
+        return
+
+    pos = Position(state.asset)
+    pos.shares = state.shares
+    pos.cost_basis = state.cost_basis
+    pos.realized_pnl = state.realized_pnl
+    replay([event], AvgCostHoldings({asset_id: pos}))
+    _write_state(db, state, portfolio_id, asset_id, pos, key)
+
+
+def record_trade(db: Session, trade: Trade) -> None:
+    """Apply a newly inserted (flushed) trade in O(1) when it is the latest event."""
+    _record_event(db, trade.portfolio_id, trade.asset_id, LedgerEvent(trade.trade_date, TRADE, trade))
+
+
+def record_stock_dividend(db: Session, txn: CashTransaction) -> None:
+    """Apply a newly inserted (flushed) DIVIDEND_STOCK transaction."""
+    if txn.type != CashTxnType.DIVIDEND_STOCK or txn.asset_id is None:
+        return
+    _record_event(db, txn.portfolio_id, txn.asset_id, LedgerEvent(txn.date, STOCK_DIV, txn))
+
+
+def refresh_asset_states(db: Session, asset_id: int, from_date: date | None) -> None:
+    """Recompute the state of ``asset_id`` in every portfolio that trades or holds it."""
+    portfolio_ids = portfolios_holding_asset(db, asset_id)
+    for pid in sorted(portfolio_ids):
+        refresh_position_state(db, pid, asset_id, from_date)
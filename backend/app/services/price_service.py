@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.latest_price import LatestPrice
+from app.models.price_history import PriceHistory
+from app.services.adjustment_service import get_adjustment_factors
+
+_CLOSE = Decimal("0.000001")
+
+
+def get_latest_price_points(
+    db: Session, asset_ids: list[int], as_of: date | None = None
+) -> dict[int, tuple[date, Decimal]]:
+    """
+    Latest (date, close) on or before ``as_of`` for each asset; all history when ``as_of`` is None.
+
+    Answers from ``latest_prices`` where its row is already on or before ``as_of`` and
+    resolves the rest with one greatest-n-per-group query over ``ix_price_asset_date``.
+    """
+    if not asset_ids:
+        return {}
+
+    points: dict[int, tuple[date, Decimal]] = {}
+    if settings.use_latest_price_table:
+        for asset_id, price_date, close in db.execute(
+            select(LatestPrice.asset_id, LatestPrice.date, LatestPrice.close).where(
+                LatestPrice.asset_id.in_(asset_ids)
+            )
+        ):
+            if as_of is None or price_date <= as_of:
+                points[asset_id] = (price_date, close)
+
+    missing = [asset_id for asset_id in asset_ids if asset_id not in points]
+    if missing:
+        filters = [PriceHistory.asset_id.in_(missing)]
+        if as_of is not None:
+            filters.append(PriceHistory.date <= as_of)
+        latest = (
+            select(PriceHistory.asset_id, func.max(PriceHistory.date).label("max_date"))
+            .where(*filters)
+            .group_by(PriceHistory.asset_id)
+            .subquery()
+        )
+        stmt = select(PriceHistory.asset_id, PriceHistory.date, PriceHistory.close).join(
+            latest,
+            (PriceHistory.asset_id == latest.c.asset_id) & (PriceHistory.date == latest.c.max_date),
+        )
+        for asset_id, price_date, close in db.execute(stmt):
+            points[asset_id] = (price_date, close)
+    return points
+
+
+def get_latest_prices(db: Session, asset_ids: list[int], as_of: date | None = None) -> dict[int, Decimal]:
+    """Latest close on or before ``as_of`` for each asset that has one."""
+    return {asset_id: close for asset_id, (_, close) in get_latest_price_points(db, asset_ids, as_of).items()}
+
+
+def get_price_history(
+    db: Session, asset_id: int, start: date | None = None, end: date | None = None, adjusted: bool = False
+) -> list[tuple[date, Decimal]]:
+    """
+    Daily closes of an asset in date order, optionally split-adjusted.
+
+    Adjusted closes are restated in the share units of the last returned day by a
+    lookup into the asset's adjustment factors; stored closes are never rewritten.
+    """
+    filters = [PriceHistory.asset_id == asset_id]
+    if start is not None:
+        filters.append(PriceHistory.date >= start)
+    if end is not None:
+        filters.append(PriceHistory.date <= end)
+    points = [
+        (price_date, close)
+        for price_date, close in db.execute(
+            select(PriceHistory.date, PriceHistory.close).where(*filters).order_by(PriceHistory.date)
+        )
+    ]
+    if not adjusted or not points:
+        return points
+    factors = get_adjustment_factors(db, asset_id)
+    basis = points[-1][0]
+    return [
+        (price_date, factors.adjust_price(close, price_date, basis).quantize(_CLOSE, ROUND_HALF_UP))
+        for price_date, close in points
+    ]
+
+
+def refresh_latest_price(db: Session, asset_id: int) -> None:
+    """Re-derive the materialized latest price of an asset from its price history."""
+    row = db.execute(
+        select(PriceHistory.date, PriceHistory.close)
+        .where(PriceHistory.asset_id == asset_id)
+        .order_by(PriceHistory.date.desc())
+        .limit(1)
+    ).first()
+    latest = db.get(LatestPrice, asset_id)
+    if row is None:
+        if latest is not None:
+            db.delete(latest)
+        return
+    if latest is None:
+        latest = LatestPrice(asset_id=asset_id)
+        db.add(latest)
+    latest.date, latest.close = row
@@ -0,0 +1,398 @@
+from __future__ import annotations
+
+import heapq
+from collections import deque
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import ColumnElement, and_, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.asset import Asset
+from app.models.cash_transaction import CashTransaction, CashTxnType
+from app.models.corporate_action import CorporateAction, CorporateActionType
+from app.models.position_snapshot import PositionSnapshot
+from app.models.tax_lot import TaxLot
+from app.models.trade import Trade, TradeSide
+
+# Same-day ordering of the merged timeline: corporate actions -> stock dividends -> trades.
+ACTION = 0
+STOCK_DIV = 1
+TRADE = 2
+
+
+def replayed_actions() -> ColumnElement[bool]:
+    """
+    Filter for the corporate actions a replay applies as ratio events.
+
+    That is every action whose ratio is not already baked into the ledger: processing a
+    DRIP books real trades, and a split processed with ``rewrite_history`` rescaled the
+    rows before it, but a split merely marked processed stays a replayed event. The
+    replay applies these events one ratio at a time; only the share index and adjusted
+    price reads look the same ratios up in ``asset_adjustment_factors``.
+    """
+    return and_(
+        CorporateAction.history_rewritten.is_(False),
+        or_(CorporateAction.processed_at.is_(None), CorporateAction.type != CorporateActionType.DRIP),
+    )
+
+
+class LedgerEvent(NamedTuple):
+    date: date
+    rank: int
+    obj: CorporateAction | CashTransaction | Trade
+
+
+def load_events(
+    db: Session,
+    portfolio_id: int | None,
+    *,
+    asset_id: int | None = None,
+    up_to: date | None = None,
+    after: date | None = None,
+    exclude_trade_id: int | None = None,
+) -> list[LedgerEvent]:
+    """
+    Load trades, replayed corporate actions and stock dividends as one ordered timeline.
+
+    Each source is fetched already sorted by (date, id) and the three streams are merged
+    rather than re-sorted, so events on the same day keep the action -> stock dividend ->
+    trade order. Corporate actions are not portfolio-scoped; pass ``asset_id`` to narrow
+    every stream to a single asset.
+    """
+    trade_filters = []
+    action_filters = [replayed_actions()]
+    div_filters = [CashTransaction.type == CashTxnType.DIVIDEND_STOCK]
+    if portfolio_id is not None:
+        trade_filters.append(Trade.portfolio_id == portfolio_id)
+        div_filters.append(CashTransaction.portfolio_id == portfolio_id)
+    if asset_id is not None:
+        trade_filters.append(Trade.asset_id == asset_id)
+        action_filters.append(CorporateAction.asset_id == asset_id)
+        div_filters.append(CashTransaction.asset_id == asset_id)
+    if up_to is not None:
+        trade_filters.append(Trade.trade_date <= up_to)
+        action_filters.append(CorporateAction.date <= up_to)
+        div_filters.append(CashTransaction.date <= up_to)
+    if after is not None:
+        trade_filters.append(Trade.trade_date > after)
+        action_filters.append(CorporateAction.date > after)
+        div_filters.append(CashTransaction.date > after)
+    if exclude_trade_id is not None:
+        trade_filters.append(Trade.id != exclude_trade_id)
+
+    actions = db.execute(
+        select(CorporateAction)
+        .join(Asset, Asset.id == CorporateAction.asset_id)
+        .where(*action_filters)
+        .order_by(CorporateAction.date, CorporateAction.id)
+    ).scalars().all()
+    stock_divs = db.execute(
+        select(CashTransaction).where(*div_filters).order_by(CashTransaction.date, CashTransaction.id)
+    ).scalars().all()
+    trades = db.execute(
+        select(Trade).where(*trade_filters).order_by(Trade.trade_date, Trade.id)
+    ).scalars().all()
+
+    return list(
+        heapq.merge(
+            (LedgerEvent(act.date, ACTION, act) for act in actions),
+            (LedgerEvent(div.date, STOCK_DIV, div) for div in stock_divs),
+            (LedgerEvent(tr.trade_date, TRADE, tr) for tr in trades),
+            key=lambda ev: (ev.date, ev.rank),
+        )
+    )
+
+
+class Accumulator:
+    """Base class for replay consumers; override the hooks you need."""
+
+    def on_action(self, action: CorporateAction) -> None:
+        pass
+
+    def on_stock_dividend(self, div: CashTransaction) -> None:
+        pass
+
+    def on_trade(self, trade: Trade) -> None:
+        pass
+
+
+def apply_event(event: LedgerEvent, *accumulators: Accumulator) -> None:
+    """Feed one event to each accumulator, in the order the accumulators are given."""
+    if event.rank == ACTION:
+        for acc in accumulators:
+            acc.on_action(event.obj)
+    elif event.rank == STOCK_DIV:
+        for acc in accumulators:
+            acc.on_stock_dividend(event.obj)
+    else:
+        for acc in accumulators:
+            acc.on_trade(event.obj)
+
+
+def replay(events: Iterable[LedgerEvent], *accumulators: Accumulator) -> None:
+    """Feed every event to each accumulator, in the order the accumulators are given."""
+    for event in events:
+        apply_event(event, *accumulators)
+
+
+def _ratio(action: CorporateAction) -> Decimal:
+    return Decimal(action.numerator) / Decimal(action.denominator)
+
+
+class Position:
+    def __init__(self, asset: Asset):
+        self.asset = asset
+        self.shares: Decimal = Decimal("0")
+        self.cost_basis: Decimal = Decimal("0")
+        self.realized_pnl: Decimal = Decimal("0")
+
+    @property
+    def avg_cost(self) -> Decimal:
+        return self.cost_basis / self.shares if self.shares > 0 else Decimal("0")
+
+    @classmethod
+    def from_snapshot(cls, snap: PositionSnapshot) -> "Position":
+        pos = cls(snap.asset)
+        pos.shares = snap.shares
+        pos.cost_basis = snap.cost_basis
+        pos.realized_pnl = snap.realized_pnl
+        return pos
+
+
+class AvgCostHoldings(Accumulator):
+    """Average-cost holdings per asset, optionally seeded (e.g. from a snapshot)."""
+
+    def __init__(self, positions: dict[int, Position] | None = None):
+        self.positions: dict[int, Position] = positions if positions is not None else {}
+        # Realized P&L of the most recent SELL, for observers such as RealizedPnLWindow.
+        self.last_realized: Decimal | None = None
+
+    def _position(self, asset: Asset) -> Position:
+        pos = self.positions.get(asset.id)
+        if pos is None:
+            pos = Position(asset)
+            self.positions[asset.id] = pos
+        return pos
+
+    def on_action(self, action: CorporateAction) -> None:
+        self.last_realized = None
+        pos = self._position(action.asset)
+        # cost_basis unchanged; redistribute over new share count.
+        pos.shares *= _ratio(action)
+        if pos.shares <= 0:
+            pos.cost_basis = Decimal("0")
+
+    def on_stock_dividend(self, div: CashTransaction) -> None:
+        self.last_realized = None
+        if div.shares is None or div.shares <= 0:
+            return
+        asset = div.asset
+        if asset is None:
+            return
+        pos = self._position(asset)
+        # cost_basis unchanged; avg_cost derived from property
+        pos.shares += div.shares
+
+    def on_trade(self, trade: Trade) -> None:
+        self.last_realized = None
+        pos = self._position(trade.asset)
+        if trade.side == TradeSide.BUY:
+            pos.cost_basis += trade.quantity * trade.price + trade.fee + trade.tax
+            pos.shares += trade.quantity
+        elif trade.side == TradeSide.SELL:
+            avg_cost_now = pos.avg_cost
+            proceeds = trade.quantity * trade.price - trade.fee - trade.tax
+            realized = proceeds - (avg_cost_now * trade.quantity)
+            pos.realized_pnl += realized
+            self.last_realized = realized
+            pos.cost_basis -= avg_cost_now * trade.quantity
+            pos.shares -= trade.quantity
+            if pos.shares <= 0:
+                pos.shares = Decimal("0")
+                pos.cost_basis = Decimal("0")
+
+
+class RealizedPnLWindow(Accumulator):
+    """
+    Sum of realized P&L from SELLs dated within [from_date, to_date].
+
+    Reads the realized amount computed by ``holdings``, so it must be passed to
+    ``replay`` after the holdings it observes.
+    """
+
+    def __init__(self, holdings: AvgCostHoldings, from_date: date, to_date: date):
+        self.holdings = holdings
+        self.from_date = from_date
+        self.to_date = to_date
+        self.realized: Decimal = Decimal("0")
+
+    def on_trade(self, trade: Trade) -> None:
+        if self.holdings.last_realized is None:
+            return
+        if self.from_date <= trade.trade_date <= self.to_date:
+            self.realized += self.holdings.last_realized
+
+
+class RealizedPnLCuts(Accumulator):
+    """
+    Realized P&L from SELLs dated on or after each of ``starts``, up to the end of the replay.
+
+    One replay serves several windows sharing an end date: the running total is marked
+    as the timeline passes each start, and a window's amount is the final total less
+    its mark. The total starts from the realized P&L already in ``holdings`` (e.g. from a
+    snapshot), so ``realized(None)`` is the amount since inception.
+    """
+
+    def __init__(self, holdings: AvgCostHoldings, starts: Iterable[date]):
+        self.holdings = holdings
+        self.total: Decimal = sum((pos.realized_pnl for pos in holdings.positions.values()), Decimal("0"))
+        self._starts = sorted(set(starts))
+        self._next = 0
+        self._marks: dict[date, Decimal] = {}
+
+    def _pass(self, day: date) -> None:
+        while self._next < len(self._starts) and self._starts[self._next] <= day:
+            self._marks[self._starts[self._next]] = self.total
+            self._next += 1
+
+    def on_trade(self, trade: Trade) -> None:
+        self._pass(trade.trade_date)
+        if self.holdings.last_realized is not None:
+            self.total += self.holdings.last_realized
+
+    def realized(self, start: date | None) -> Decimal:
+        if start is None:
+            return self.total
+        return self.total - self._marks.get(start, self.total)
+
+
+class FifoLots(Accumulator):
+    """
+    FIFO tax lots for a single (portfolio, asset) event stream.
+
+    Open lots are kept in a queue so a SELL only touches the lots it consumes. Corporate
+    action ratios are recorded and applied to a lot the next time it is read, in the same
+    order a full rescale would have applied them. ``lots`` may be seeded with the open lots
+    of a checkpoint to resume a replay part-way through the stream.
+    """
+
+    def __init__(self, asset_currency: str | None, lots: list[TaxLot] | None = None):
+        self.asset_currency = asset_currency
+        self._lots: list[TaxLot] = list(lots) if lots else []
+        self._open: deque[TaxLot] = deque(lot for lot in self._lots if lot.remaining_shares > 0)
+        self._ratios: list[Decimal] = []
+        # Number of recorded ratios already applied to each lot, keyed by id(lot).
+        self._applied: dict[int, int] = {id(lot): 0 for lot in self._lots}
+
+    def _catch_up(self, lot: TaxLot) -> TaxLot:
+        applied = self._applied[id(lot)]
+        if applied == len(self._ratios):
+            return lot
+        for ratio in self._ratios[applied:]:
+            lot.original_shares *= ratio
+            lot.remaining_shares *= ratio
+        if lot.original_shares > 0:
+            lot.cost_per_share = lot.total_cost / lot.original_shares
+        else:
+            lot.cost_per_share = Decimal("0")
+        self._applied[id(lot)] = len(self._ratios)
+        return lot
+
+    def _append(self, lot: TaxLot) -> None:
+        self._lots.append(lot)
+        self._applied[id(lot)] = len(self._ratios)
+        if lot.remaining_shares > 0:
+            self._open.append(lot)
+
+    @property
+    def lots(self) -> list[TaxLot]:
+        """Every lot in creation order, with all recorded ratios applied."""
+        return [self._catch_up(lot) for lot in self._lots]
+
+    @property
+    def open_lots(self) -> list[TaxLot]:
+        """Lots with shares remaining, in FIFO order."""
+        return [self._catch_up(lot) for lot in self._open]
+
+    def on_action(self, action: CorporateAction) -> None:
+        ratio = _ratio(action)
+        if ratio <= 0:
+            return
+        self._ratios.append(ratio)
+
+    def on_stock_dividend(self, div: CashTransaction) -> None:
+        if div.shares is None or div.shares <= 0:
+            return
+        self._append(
+            TaxLot(
+                portfolio_id=div.portfolio_id,
+                account_id=div.account_id,
+                asset_id=div.asset_id,
+                lot_date=div.date,
+                original_shares=div.shares,
+                remaining_shares=div.shares,
+                cost_per_share=Decimal("0"),
+                total_cost=Decimal("0"),
+                asset_currency=self.asset_currency,
+                settlement_currency=div.account.currency if div.account else None,
+                fx_rate=None,
+                source="STOCK_DIV",
+                source_id=div.id,
+            )
+        )
+
+    def on_trade(self, trade: Trade) -> None:
+        if trade.side == TradeSide.BUY:
+            total_cost = trade.quantity * trade.price + trade.fee + trade.tax
+            cost_per_share = total_cost / trade.quantity if trade.quantity > 0 else Decimal("0")
+            self._append(
+                TaxLot(
+                    portfolio_id=trade.portfolio_id,
+                    account_id=trade.account_id,
+                    asset_id=trade.asset_id,
+                    lot_date=trade.trade_date,
+                    original_shares=trade.quantity,
+                    remaining_shares=trade.quantity,
+                    cost_per_share=cost_per_share,
+                    total_cost=total_cost,
+                    asset_currency=trade.asset_currency or self.asset_currency,
+                    settlement_currency=trade.settlement_currency,
+                    fx_rate=trade.fx_rate,
+                    source="BUY",
+                    source_id=trade.id,
+                )
+            )
+            return
+
+        remaining = trade.quantity
+        while remaining > 0 and self._open:
+            lot = self._catch_up(self._open[0])
+            take = lot.remaining_shares if lot.remaining_shares <= remaining else remaining
+            lot.remaining_shares -= take
+            remaining -= take
+            if lot.remaining_shares <= 0:
+                self._open.popleft()
+        if remaining > 0:
+            raise ValueError("Sell quantity exceeds available lots")
+
+
+class ShareCount(Accumulator):
+    """Raw share balance used for sell validation (no clamping at zero)."""
+
+    def __init__(self) -> None:
+        self.shares: Decimal = Decimal("0")
+
+    def on_action(self, action: CorporateAction) -> None:
+        self.shares *= _ratio(action)
+
+    def on_stock_dividend(self, div: CashTransaction) -> None:
+        if div.shares:
+            self.shares += div.shares
+
+    def on_trade(self, trade: Trade) -> None:
+        if trade.side == TradeSide.BUY:
+            self.shares += trade.quantity
+        else:
+            self.shares -= trade.quantity
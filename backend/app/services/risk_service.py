@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.asset import Asset
+from app.services.adjustment_service import load_adjustment_factors
+from app.services.performance_service import daily_valuation, day_range, report_range, time_weighted_returns
+from app.services.timeseries_service import cut_dates
+
+# Returns are taken over calendar days (closes carried over non-trading days), so a year has 365 of them.
+_PERIODS_PER_YEAR = 365
+
+
+def _factor_matrix(db: Session, asset_ids: list[int], days: np.ndarray) -> np.ndarray:
+    """Cumulative split factor of each asset on each day (day x asset), one searchsorted per asset."""
+    factors = np.ones((len(days), len(asset_ids)))
+    for col, (asset_id, series) in enumerate(load_adjustment_factors(db, asset_ids).items()):
+        if series.dates:
+            idx = np.searchsorted(np.array(series.dates, dtype="datetime64[D]"), days, side="right")
+            steps = np.concatenate(([1.0], np.array(series.values, dtype=float)))
+            factors[:, col] = steps[idx]
+    return factors
+
+
+def _pairwise_covariance(returns: np.ndarray, valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sample covariance and correlation of the columns of ``returns`` over the rows where both are valid.
+
+    Pairwise-complete statistics from four matrix products, so an asset listed late only
+    shortens its own pairs. Entries without two common returns or with no variance are NaN.
+    """
+    r = np.where(valid, returns, 0.0)
+    m = valid.astype(float)
+    n = m.T @ m
+    sums = r.T @ m  # sums[i, j]: sum of asset i's returns on the days asset j also has one
+    squares = (r * r).T @ m
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (r.T @ r - sums * sums.T / n) / (n - 1)
+        var = (squares - sums * sums / n) / (n - 1)
+        corr = cov / np.sqrt(var * var.T)
+    cov[n < 2] = np.nan
+    corr[(n < 2) | ~np.isfinite(corr)] = np.nan
+    return cov, np.clip(corr, -1.0, 1.0)
+
+
+def _rolling_std(values: np.ndarray, active: np.ndarray, window: int) -> np.ndarray:
+    """Sample standard deviation of each trailing window; NaN until a window is full of active days."""
+    out = np.full(len(values), np.nan)
+    if window < 2 or len(values) < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window)
+    full = np.lib.stride_tricks.sliding_window_view(active, window).all(axis=1)
+    out[window - 1 :] = np.where(full, windows.std(axis=1, ddof=1), np.nan)
+    return out
+
+
+def _optional(value: float) -> float | None:
+    return float(value) if np.isfinite(value) else None
+
+
+def _matrix(values: np.ndarray) -> list[list[float | None]]:
+    return [[_optional(value) for value in row] for row in values]
+
+
+def compute_risk(
+    db: Session,
+    portfolio_id: int,
+    from_date: date | None = None,
+    to_date: date | None = None,
+    window: int = 30,
+    risk_free_rate: float = 0.0,
+    step: str = "day",
+) -> dict:
+    """
+    Volatility, drawdown, Sharpe and Sortino of a portfolio, and the covariance of its holdings.
+
+    Portfolio statistics use the flow-neutral daily returns of ``/reports/performance``
+    over the days something was invested. The holdings matrix covers the assets held
+    on ``to_date``: their closes come out of the same one-query price matrix, are
+    split-adjusted through the adjustment factors and turned into daily returns, and
+    every statistic is a vectorized NumPy reduction or matrix product. Figures are
+    annualized over 365 calendar days; ``step`` only thins the returned series.
+    """
+    from_date, to_date = report_range(db, portfolio_id, from_date, to_date)
+    opening_day = from_date - timedelta(days=1)
+    days = day_range(from_date, to_date)
+    asset_ids, shares, prices, values, flows = daily_valuation(db, portfolio_id, days)
+
+    returns = time_weighted_returns(values, flows)
+    active = values[:-1] + flows[1:] > 0
+    invested = returns[active]
+    rate = (1.0 + risk_free_rate) ** (1.0 / _PERIODS_PER_YEAR) - 1.0
+    volatility = sharpe = sortino = None
+    if len(invested) >= 2:
+        excess = invested - rate
+        volatility = float(invested.std(ddof=1) * np.sqrt(_PERIODS_PER_YEAR))
+        downside = float(np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2)) * np.sqrt(_PERIODS_PER_YEAR))
+        annual_excess = float(excess.mean() * _PERIODS_PER_YEAR)
+        sharpe = annual_excess / volatility if volatility > 0 else None
+        sortino = annual_excess / downside if downside > 0 else None
+
+    growth = np.concatenate(([1.0], np.cumprod(1.0 + returns)))
+    drawdowns = growth / np.maximum.accumulate(growth) - 1.0
+    trough = int(np.argmin(drawdowns))
+    peak = int(np.argmax(growth[: trough + 1]))
+    rolling = _rolling_std(returns, active, window) * np.sqrt(_PERIODS_PER_YEAR)
+
+    held = np.flatnonzero(shares[-1] != 0)
+    holding_ids = [asset_ids[col] for col in held]
+    closes = prices[:, held] * _factor_matrix(db, holding_ids, days)
+    valid = (closes[:-1] > 0) & (closes[1:] > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        asset_returns = np.where(valid, closes[1:] / closes[:-1] - 1.0, 0.0)
+    covariance, correlation = _pairwise_covariance(asset_returns, valid)
+    covariance *= _PERIODS_PER_YEAR
+    market_values = shares[-1, held] * prices[-1, held]
+    total = market_values.sum()
+    symbols = dict(db.execute(select(Asset.id, Asset.symbol).where(Asset.id.in_(holding_ids))).all())
+
+    series = []
+    for cut in cut_dates(from_date, to_date, step):
+        idx = (cut - opening_day).days
+        series.append(
+            {
+                "date": cut,
+                "drawdown": float(drawdowns[idx]),
+                "rolling_volatility": _optional(rolling[idx - 1]),
+            }
+        )
+    return {
+        "portfolio_id": portfolio_id,
+        "from_date": from_date,
+        "to_date": to_date,
+        "window": window,
+        "risk_free_rate": risk_free_rate,
+        "volatility": volatility,
+        "max_drawdown": float(drawdowns[trough]),
+        "max_drawdown_peak": days[peak].item() if trough != peak else None,
+        "max_drawdown_trough": days[trough].item() if trough != peak else None,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "holdings": [
+            {
+                "asset_id": asset_id,
+                "symbol": symbols.get(asset_id),
+                "weight": _optional(market_values[col] / total) if total else None,
+                "volatility": _optional(np.sqrt(covariance[col, col])),
+            }
+            for col, asset_id in enumerate(holding_ids)
+        ],
+        "correlation": _matrix(correlation),
+        "covariance": _matrix(covariance),
+        "series": series,
+    }
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.cash_transaction import CashTransaction, CashTxnType
+from app.models.share_balance import ShareBalance
+from app.models.trade import Trade, TradeSide
+from app.services.adjustment_service import get_adjustment_factors, load_adjustment_factors
+
+# (portfolio_id, asset_id, date, signed shares) of a trade or stock dividend.
+ShareMovement = tuple[int, int, date, Decimal]
+
+_STORED = Decimal("0.000001")
+
+
+def trade_movement(trade: Trade) -> ShareMovement:
+    shares = trade.quantity if trade.side == TradeSide.BUY else -trade.quantity
+    return trade.portfolio_id, trade.asset_id, trade.trade_date, shares
+
+
+def stock_dividend_movements(txn: CashTransaction) -> list[ShareMovement]:
+    if txn.type != CashTxnType.DIVIDEND_STOCK or txn.asset_id is None or not txn.shares:
+        return []
+    return [(txn.portfolio_id, txn.asset_id, txn.date, txn.shares)]
+
+
+def reverse_movements(movements: Iterable[ShareMovement]) -> list[ShareMovement]:
+    return [(portfolio_id, asset_id, on, -shares) for portfolio_id, asset_id, on, shares in movements]
+
+
+def _units_at(db: Session, portfolio_id: int, asset_id: int, on: date) -> Decimal:
+    units = (
+        db.execute(
+            select(ShareBalance.units)
+            .where(ShareBalance.portfolio_id == portfolio_id, ShareBalance.asset_id == asset_id, ShareBalance.date <= on)
+            .order_by(ShareBalance.date.desc())
+            .limit(1)
+        )
+        .scalars()
+        .first()
+    )
+    return units if units is not None else Decimal("0")
+
+
+def _min_units(
+    db: Session, portfolio_id: int, asset_id: int, start: date, end: date | None = None
+) -> Decimal | None:
+    filters = [ShareBalance.portfolio_id == portfolio_id, ShareBalance.asset_id == asset_id, ShareBalance.date >= start]
+    if end is not None:
+        filters.append(ShareBalance.date < end)
+    return db.execute(select(func.min(ShareBalance.units)).where(*filters)).scalar()
+
+
+def adjust_share_balances(db: Session, movements: Iterable[ShareMovement]) -> None:
+    """
+    Apply share movements to the cumulative index, netted per (portfolio, asset, day).
+
+    Call it for every trade or stock dividend written, with ``reverse_movements`` of
+    the old version when one is changed or removed.
+    """
+    movements = list(movements)
+    totals: dict[tuple[int, int, date], Decimal] = defaultdict(Decimal)
+    factors = load_adjustment_factors(db, [asset_id for _, asset_id, _, _ in movements])
+    for portfolio_id, asset_id, on, shares in movements:
+        totals[(portfolio_id, asset_id, on)] += factors[asset_id].units(on, shares)
+
+    for (portfolio_id, asset_id, on), delta in sorted(totals.items()):
+        if delta == 0:
+            continue
+        key = (ShareBalance.portfolio_id == portfolio_id, ShareBalance.asset_id == asset_id)
+        exists = db.execute(select(ShareBalance.date).where(*key, ShareBalance.date == on)).first()
+        if exists is None:
+            db.execute(
+                insert(ShareBalance).values(
+                    portfolio_id=portfolio_id,
+                    asset_id=asset_id,
+                    date=on,
+                    units=_units_at(db, portfolio_id, asset_id, on),
+                )
+            )
+        db.execute(update(ShareBalance).where(*key, ShareBalance.date >= on).values(units=ShareBalance.units + delta))
+
+
+def available_shares(
+    db: Session, portfolio_id: int, asset_id: int, on: date, exclude: ShareMovement | None = None
+) -> Decimal:
+    """
+    Largest SELL dated ``on`` that leaves every later day with a non-negative balance.
+
+    That is the minimum of the normalized balance over all days from ``on`` onwards,
+    rescaled to ``on``'s share units: two indexed queries instead of a replay, and a
+    backdated sell cannot uncover sells already booked after it. ``exclude`` is the
+    current movement of a trade being edited, which is left out of the balance.
+    """
+    factors = get_adjustment_factors(db, asset_id)
+    excluded_from: date | None = None
+    excluded = Decimal("0")
+    if exclude is not None:
+        excluded_from = exclude[2]
+        excluded = factors.units(excluded_from, exclude[3])
+
+    def without_excluded(units: Decimal | None, day_from: date) -> Decimal | None:
+        if units is None or excluded_from is None or day_from < excluded_from:
+            return units
+        return units - excluded
+
+    candidates = [without_excluded(_units_at(db, portfolio_id, asset_id, on), on)]
+    if excluded_from is not None and excluded_from > on:
+        candidates.append(_min_units(db, portfolio_id, asset_id, on, excluded_from))
+        candidates.append(without_excluded(_min_units(db, portfolio_id, asset_id, excluded_from), excluded_from))
+    else:
+        candidates.append(without_excluded(_min_units(db, portfolio_id, asset_id, on), on))
+    lowest = min(units for units in candidates if units is not None)
+    return (lowest * factors.on(on)).quantize(_STORED, ROUND_HALF_UP)
+
+
+def rebuild_share_index(db: Session, asset_id: int) -> None:
+    """
+    Recompute every portfolio's share index for an asset, e.g. after its corporate actions changed.
+
+    Reads the asset's adjustment factors, so rebuild those first.
+    """
+    db.execute(delete(ShareBalance).where(ShareBalance.asset_id == asset_id))
+    signed = case((Trade.side == TradeSide.BUY, Trade.quantity), else_=-Trade.quantity)
+    trades = db.execute(
+        select(Trade.portfolio_id, Trade.trade_date, func.sum(signed))
+        .where(Trade.asset_id == asset_id)
+        .group_by(Trade.portfolio_id, Trade.trade_date)
+    ).all()
+    divs = db.execute(
+        select(CashTransaction.portfolio_id, CashTransaction.date, func.sum(CashTransaction.shares))
+        .where(
+            CashTransaction.asset_id == asset_id,
+            CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
+            CashTransaction.shares.is_not(None),
+        )
+        .group_by(CashTransaction.portfolio_id, CashTransaction.date)
+    ).all()
+
+    factors = get_adjustment_factors(db, asset_id)
+    by_portfolio: dict[int, dict[date, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+    for portfolio_id, on, shares in [*trades, *divs]:
+        if shares:
+            by_portfolio[portfolio_id][on] += factors.units(on, Decimal(str(shares)))
+
+    rows = []
+    for portfolio_id, by_date in by_portfolio.items():
+        units = Decimal("0")
+        for on in sorted(by_date):
+            units += by_date[on]
+            rows.append({"portfolio_id": portfolio_id, "asset_id": asset_id, "date": on, "units": units})
+    if rows:
+        db.execute(insert(ShareBalance), rows)
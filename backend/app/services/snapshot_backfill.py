@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from sqlalchemy import select
+
+from app.db.session import SessionLocal, engine
+from app.models.portfolio import Portfolio
+from app.services.snapshot_service import SnapshotState, replay_portfolio_snapshots, write_snapshots
+from app.services.unit_of_work import UnitOfWork
+
+
+def _init_worker() -> None:
+    # Forked workers must not reuse the parent's pooled connections.
+    engine.dispose(close=False)
+    import app.main  # noqa: F401  (registers every mapped class in spawned workers)
+
+
+def _replay_worker(
+    portfolio_id: int, dates: list[date]
+) -> tuple[int, dict[date, SnapshotState], tuple[date, int] | None, int]:
+    db = SessionLocal()
+    try:
+        return portfolio_id, *replay_portfolio_snapshots(db, portfolio_id, dates)
+    finally:
+        db.close()
+
+
+def backfill_all_snapshots(
+    dates: list[date], portfolio_ids: list[int] | None = None, workers: int | None = None
+) -> dict[str, int]:
+    """
+    Backfill snapshots at ``dates`` for several portfolios (all when None) in parallel.
+
+    Each portfolio's single replay runs in a worker process; the parent writes each
+    result in its own transaction as it arrives, so SQLite only ever sees one writer.
+    ``workers=1`` replays in-process. A portfolio whose ledger changed while it was
+    replayed is not written and is counted in ``skipped``; backfill it again.
+    """
+    db = SessionLocal()
+    try:
+        if portfolio_ids is None:
+            portfolio_ids = list(db.execute(select(Portfolio.id).order_by(Portfolio.id)).scalars())
+
+        written = 0
+        skipped = 0
+
+        def write(
+            portfolio_id: int,
+            states: dict[date, SnapshotState],
+            watermark: tuple[date, int] | None,
+            revision: int,
+        ) -> None:
+            nonlocal written, skipped
+            with UnitOfWork(db):
+                rows = write_snapshots(db, portfolio_id, states, watermark, revision)
+            if rows is None:
+                skipped += 1
+            else:
+                written += rows
+
+        if workers == 1 or len(portfolio_ids) <= 1:
+            for portfolio_id in portfolio_ids:
+                write(*_replay_worker(portfolio_id, dates))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = [pool.submit(_replay_worker, portfolio_id, dates) for portfolio_id in portfolio_ids]
+                for future in as_completed(futures):
+                    write(*future.result())
+    finally:
+        db.close()
+    return {"portfolios": len(portfolio_ids), "dates": len(dates), "snapshots": written, "skipped": skipped}
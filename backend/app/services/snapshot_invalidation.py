@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import ScalarSelect, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.portfolio import Portfolio
+from app.models.position_snapshot import PositionSnapshot
+from app.models.snapshot_watermark import SnapshotWatermark
+
+
+def mark_snapshots_stale(db: Session, portfolio_id: int, from_date: date | None) -> None:
+    """
+    Record that ledger events dated ``from_date`` (all when None) changed for a portfolio.
+
+    The portfolio's ledger revision is always bumped, so a snapshot backfill replaying
+    concurrently can tell its result is out of date. The watermark moves down to the
+    earliest snapshot on or after ``from_date``; when there is none, no stored snapshot
+    depends on the change and it is left alone.
+    """
+    db.execute(
+        update(Portfolio)
+        .where(Portfolio.id == portfolio_id)
+        .values(ledger_revision=Portfolio.ledger_revision + 1)
+        .execution_options(synchronize_session=False)
+    )
+    filters = [PositionSnapshot.portfolio_id == portfolio_id]
+    if from_date is not None:
+        filters.append(PositionSnapshot.snapshot_date >= from_date)
+    first_stale = db.execute(select(func.min(PositionSnapshot.snapshot_date)).where(*filters)).scalar()
+    if first_stale is None:
+        return
+    moved = db.execute(
+        update(SnapshotWatermark)
+        .where(SnapshotWatermark.portfolio_id == portfolio_id)
+        .values(
+            dirty_from=case(
+                (SnapshotWatermark.dirty_from > first_stale, first_stale), else_=SnapshotWatermark.dirty_from
+            ),
+            revision=SnapshotWatermark.revision + 1,
+        )
+    )
+    if moved.rowcount == 0:
+        db.execute(insert(SnapshotWatermark).values(portfolio_id=portfolio_id, dirty_from=first_stale, revision=1))
+
+
+def stale_from_subquery(portfolio_id: int) -> ScalarSelect:
+    """The portfolio's watermark as a scalar subquery (NULL when its snapshots are all current)."""
+    return (
+        select(SnapshotWatermark.dirty_from)
+        .where(SnapshotWatermark.portfolio_id == portfolio_id)
+        .scalar_subquery()
+    )
+
+
+def get_snapshot_watermark(db: Session, portfolio_id: int) -> tuple[date, int] | None:
+    """(dirty_from, revision) of a portfolio, or None when its snapshots are all current."""
+    row = db.execute(
+        select(SnapshotWatermark.dirty_from, SnapshotWatermark.revision).where(
+            SnapshotWatermark.portfolio_id == portfolio_id
+        )
+    ).first()
+    return (row[0], row[1]) if row is not None else None
+
+
+def stale_portfolio_ids(db: Session) -> list[int]:
+    return list(db.execute(select(SnapshotWatermark.portfolio_id).order_by(SnapshotWatermark.portfolio_id)).scalars())
+
+
+def clear_snapshot_watermark(db: Session, portfolio_id: int, revision: int) -> bool:
+    """Drop the watermark if it is still at ``revision``; False when a write moved it meanwhile."""
+    cleared = db.execute(
+        delete(SnapshotWatermark).where(
+            SnapshotWatermark.portfolio_id == portfolio_id, SnapshotWatermark.revision == revision
+        )
+    )
+    return cleared.rowcount > 0
+
+
+def get_ledger_revision(db: Session, portfolio_id: int) -> int:
+    """Current ledger revision of a portfolio; read it before replaying anything to be written back."""
+    return db.execute(select(Portfolio.ledger_revision).where(Portfolio.id == portfolio_id)).scalar() or 0
+
+
+def claim_ledger_revision(db: Session, portfolio_id: int, revision: int) -> bool:
+    """
+    Lock the portfolio row if its ledger is still at ``revision``; False when a write moved it.
+
+    The no-op update takes the row lock that ledger writes need to bump the revision,
+    so none can commit between this check and the end of the caller's transaction.
+    """
+    claimed = db.execute(
+        update(Portfolio)
+        .where(Portfolio.id == portfolio_id, Portfolio.ledger_revision == revision)
+        .values(ledger_revision=Portfolio.ledger_revision)
+        .execution_options(synchronize_session=False)
+    )
+    return claimed.rowcount > 0
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.position_snapshot import PositionSnapshot
+from app.services.snapshot_invalidation import stale_portfolio_ids
+from app.services.snapshot_service import compact_snapshots, rematerialize_snapshots
+
+
+def rematerialize_stale_snapshots() -> int:
+    """One pass over every portfolio with a watermark; returns the number of snapshot dates rebuilt."""
+    db = SessionLocal()
+    try:
+        rebuilt = 0
+        for portfolio_id in stale_portfolio_ids(db):
+            try:
+                rebuilt += rematerialize_snapshots(db, portfolio_id)
+            except SQLAlchemyError:
+                # Reads ignore the stale range meanwhile; the next pass retries it.
+                db.rollback()
+        return rebuilt
+    finally:
+        db.close()
+
+
+def compact_old_snapshots(before: date | None = None) -> int:
+    """
+    Thin every portfolio's snapshots older than ``before`` to month-ends; returns the dates removed.
+
+    ``before`` defaults to ``snapshot_retention_days`` ago; with a retention of 0 nothing is compacted.
+    """
+    if before is None:
+        if settings.snapshot_retention_days <= 0:
+            return 0
+        before = datetime.now(timezone.utc).date() - timedelta(days=settings.snapshot_retention_days)
+    db = SessionLocal()
+    try:
+        portfolio_ids = list(
+            db.execute(
+                select(PositionSnapshot.portfolio_id).where(PositionSnapshot.snapshot_date < before).distinct()
+            ).scalars()
+        )
+        removed = 0
+        for portfolio_id in portfolio_ids:
+            try:
+                removed += compact_snapshots(db, portfolio_id, before)
+            except SQLAlchemyError:
+                db.rollback()
+        return removed
+    finally:
+        db.close()
+
+
+class SnapshotRematerializer:
+    """
+    Background thread rebuilding invalidated snapshots every ``snapshot_rematerialize_interval_seconds``.
+
+    Reads stay correct without it, since they skip snapshots at or after a watermark;
+    it only restores the replay savings those snapshots provide. Each pass also applies
+    the ``snapshot_retention_days`` compaction.
+    """
+
+    def __init__(self, interval_seconds: float | None = None) -> None:
+        self.interval = settings.snapshot_rematerialize_interval_seconds if interval_seconds is None else interval_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-rematerializer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                rematerialize_stale_snapshots()
+                compact_old_snapshots()
+            except SQLAlchemyError:
+                continue
@@ -1,13 +1,35 @@
 from __future__ import annotations
 
 from datetime import date, datetime, timezone
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import groupby
 
-from sqlalchemy import delete
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.position_snapshot import PositionSnapshot
-from app.services.position_service import get_positions
+from app.services.position_service import _snapshot_rows
+from app.services.replay_engine import AvgCostHoldings, apply_event, load_events
+from app.services.snapshot_invalidation import (
+    claim_ledger_revision,
+    clear_snapshot_watermark,
+    get_ledger_revision,
+    get_snapshot_watermark,
+)
+from app.services.timeseries_service import cut_dates
+from app.services.unit_of_work import UnitOfWork
+
+# Rows (or dates) per bulk statement, well under SQLite's bound-parameter limit.
+_BATCH_SIZE = 500
+_STORED = Decimal("0.000001")
+
+# (shares, cost_basis, realized_pnl) per asset at one snapshot date, at stored precision.
+SnapshotState = dict[int, tuple[Decimal, Decimal, Decimal]]
+
+
+def _stored_value(*values: Decimal) -> tuple[Decimal, ...]:
+    return tuple(Decimal(value).quantize(_STORED, ROUND_HALF_UP) for value in values)
 
 
 def create_daily_snapshots(
@@ -20,43 +42,308 @@ def create_daily_snapshots(
     Materialize holdings for a portfolio on a given date.
 
     The calculation deliberately bypasses existing snapshots to avoid compounding
-    drift. Use this from a daily job or after large backfills.
+    drift. Use this from a daily job or after large backfills. Returns every position
+    of the snapshot at the date, as ``_snapshot_rows`` decodes it: an asset unchanged
+    since an earlier row of the keyframe chain is returned as that row.
     """
     if snapshot_date is None:
         snapshot_date = datetime.now(timezone.utc).date()
 
-    positions = get_positions(
-        db,
-        portfolio_id=portfolio_id,
-        as_of=snapshot_date,
-        in_base_currency=False,
-        use_snapshots=False,
-        include_realized=True,
+    stored = select(PositionSnapshot).where(
+        PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date == snapshot_date
     )
+    if replace_existing or db.execute(stored.limit(1)).first() is None:
+        backfill_snapshots(db, portfolio_id, [snapshot_date])
+    return _snapshot_rows(db, portfolio_id, snapshot_date)
+
+
+def _replay_snapshot_states(db: Session, portfolio_id: int, dates: list[date]) -> dict[date, SnapshotState]:
+    """
+    Full holdings of a portfolio at each of ``dates`` (ascending) from a single replay.
+
+    The replay starts from the first event rather than an existing snapshot, and every
+    position the replay knows at a date is part of that date's state.
+    """
+    if not dates:
+        return {}
+    events = load_events(db, portfolio_id, up_to=dates[-1])
+    holdings = AvgCostHoldings()
+    states: dict[date, SnapshotState] = {}
+    idx = 0
+    for cut in dates:
+        while idx < len(events) and events[idx].date <= cut:
+            apply_event(events[idx], holdings)
+            idx += 1
+        states[cut] = {
+            asset_id: _stored_value(pos.shares, pos.cost_basis, pos.realized_pnl)
+            for asset_id, pos in holdings.positions.items()
+        }
+    return states
+
 
-    if replace_existing:
+def _next_keyframe(db: Session, portfolio_id: int, after: date) -> date | None:
+    return (
         db.execute(
-            delete(PositionSnapshot).where(
+            select(PositionSnapshot.snapshot_date)
+            .where(
                 PositionSnapshot.portfolio_id == portfolio_id,
-                PositionSnapshot.snapshot_date == snapshot_date,
+                PositionSnapshot.snapshot_date > after,
+                PositionSnapshot.is_keyframe.is_(True),
             )
+            .order_by(PositionSnapshot.snapshot_date)
+            .limit(1)
         )
+        .scalars()
+        .first()
+    )
+
 
-    snapshots: list[PositionSnapshot] = []
-    for pos in positions:
-        snap = PositionSnapshot(
-            portfolio_id=portfolio_id,
-            asset_id=pos["asset_id"],
-            snapshot_date=snapshot_date,
-            shares=pos["shares_held"],
-            cost_basis=pos["cost_basis"],
-            realized_pnl=pos.get("realized_pnl", Decimal("0")),
+def _stored_chain(
+    db: Session, portfolio_id: int, first: date, stop: date | None
+) -> tuple[list[tuple[date, SnapshotState]], SnapshotState, date | None]:
+    """
+    Stored snapshots from ``first`` up to ``stop`` (exclusive), decoded to full states.
+
+    Also returns the state of the last snapshot before ``first`` and the keyframe it
+    belongs to, which are what a re-encoding of the range starts from.
+    """
+    filters = [PositionSnapshot.portfolio_id == portfolio_id]
+    keyframe = (
+        db.execute(
+            select(PositionSnapshot.snapshot_date)
+            .where(*filters, PositionSnapshot.snapshot_date <= first, PositionSnapshot.is_keyframe.is_(True))
+            .order_by(PositionSnapshot.snapshot_date.desc())
+            .limit(1)
         )
-        db.add(snap)
-        snapshots.append(snap)
+        .scalars()
+        .first()
+    )
+    if keyframe is not None:
+        filters.append(PositionSnapshot.snapshot_date >= keyframe)
+    if stop is not None:
+        filters.append(PositionSnapshot.snapshot_date < stop)
+    rows = db.execute(
+        select(
+            PositionSnapshot.snapshot_date,
+            PositionSnapshot.asset_id,
+            PositionSnapshot.shares,
+            PositionSnapshot.cost_basis,
+            PositionSnapshot.realized_pnl,
+            PositionSnapshot.is_keyframe,
+        )
+        .where(*filters)
+        .order_by(PositionSnapshot.snapshot_date)
+    ).all()
+
+    chain: list[tuple[date, SnapshotState]] = []
+    state: SnapshotState = {}
+    base: SnapshotState = {}
+    base_keyframe: date | None = None
+    for snapshot_date, group in groupby(rows, key=lambda row: row.snapshot_date):
+        group = list(group)
+        state = {} if group[0].is_keyframe else dict(state)
+        for row in group:
+            state[row.asset_id] = _stored_value(row.shares, row.cost_basis, row.realized_pnl)
+        if snapshot_date >= first:
+            chain.append((snapshot_date, state))
+            continue
+        base = state
+        if group[0].is_keyframe:
+            base_keyframe = snapshot_date
+    return chain, base, base_keyframe
+
+
+def _encode_snapshots(
+    portfolio_id: int,
+    states: list[tuple[date, SnapshotState]],
+    previous: SnapshotState,
+    last_keyframe: date | None,
+) -> list[dict]:
+    """
+    Snapshot rows for ``states`` (ascending): a keyframe every ``snapshot_keyframe_days``, deltas between.
+
+    A delta date only gets rows for assets whose state differs from the previous date,
+    so a date where nothing changed stores nothing at all.
+    """
+    rows: list[dict] = []
+    for cut, state in states:
+        keyframe = (
+            last_keyframe is None
+            or (cut - last_keyframe).days >= settings.snapshot_keyframe_days
+            # A position only disappears when the previous state is stale; start afresh.
+            or not previous.keys() <= state.keys()
+        )
+        if keyframe:
+            last_keyframe = cut
+        rows.extend(
+            {
+                "portfolio_id": portfolio_id,
+                "asset_id": asset_id,
+                "snapshot_date": cut,
+                "shares": shares,
+                "cost_basis": cost_basis,
+                "realized_pnl": realized_pnl,
+                "is_keyframe": keyframe,
+            }
+            for asset_id, (shares, cost_basis, realized_pnl) in sorted(state.items())
+            if keyframe or previous.get(asset_id) != (shares, cost_basis, realized_pnl)
+        )
+        previous = state
+    return rows
+
+
+def _rewrite_chain(
+    db: Session,
+    portfolio_id: int,
+    first: date,
+    stop: date | None,
+    states: list[tuple[date, SnapshotState]],
+    previous: SnapshotState,
+    last_keyframe: date | None,
+) -> int:
+    """Replace every stored snapshot in [``first``, ``stop``) with ``states``, re-encoded; returns the rows written."""
+    filters = [PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date >= first]
+    if stop is not None:
+        filters.append(PositionSnapshot.snapshot_date < stop)
+    db.execute(delete(PositionSnapshot).where(*filters))
+    rows = _encode_snapshots(portfolio_id, states, previous, last_keyframe)
+    for start in range(0, len(rows), _BATCH_SIZE):
+        db.execute(insert(PositionSnapshot), rows[start : start + _BATCH_SIZE])
+    return len(rows)
 
-    db.commit()
-    for snap in snapshots:
-        db.refresh(snap)
 
-    return snapshots
+def write_snapshots(
+    db: Session,
+    portfolio_id: int,
+    states: dict[date, SnapshotState],
+    watermark: tuple[date, int] | None = None,
+    revision: int | None = None,
+) -> int | None:
+    """
+    Store a portfolio's snapshots at the dates of ``states`` (no commit); returns the rows written.
+
+    Each delta is relative to the snapshot date before it, so the stored dates from the
+    first new one up to the next keyframe after the last are re-encoded with them.
+    ``watermark`` is the (dirty_from, revision) read before ``states`` were replayed; it
+    is cleared when every snapshot it invalidated was rebuilt and no write moved it.
+    ``revision`` is the ledger revision read before the replay: when a ledger write has
+    moved it since, ``states`` may predate that write and nothing is stored (None).
+    """
+    if revision is not None and not claim_ledger_revision(db, portfolio_id, revision):
+        return None
+    written = 0
+    if states:
+        first, last = min(states), max(states)
+        stop = _next_keyframe(db, portfolio_id, last)
+        stored, previous, last_keyframe = _stored_chain(db, portfolio_id, first, stop)
+        merged = dict(stored)
+        merged.update(states)
+        written = _rewrite_chain(db, portfolio_id, first, stop, sorted(merged.items()), previous, last_keyframe)
+    if watermark is None:
+        return written
+    dirty_from, revision = watermark
+    leftover = any(
+        snapshot_date not in states
+        for snapshot_date in db.execute(
+            select(PositionSnapshot.snapshot_date)
+            .where(PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date >= dirty_from)
+            .distinct()
+        ).scalars()
+    )
+    if not leftover:
+        clear_snapshot_watermark(db, portfolio_id, revision)
+    return written
+
+
+def rematerialize_snapshots(db: Session, portfolio_id: int) -> int:
+    """
+    Rebuild the snapshots a portfolio's watermark invalidated; returns how many dates were rebuilt.
+
+    Only snapshot dates on or after the watermark are recomputed, all from one replay,
+    and rewritten in bulk. The watermark is then cleared unless a ledger write moved it
+    in the meantime, in which case the next pass picks up the newer range. A pass that
+    raced a ledger write stores nothing and counts as no dates rebuilt.
+    """
+    with UnitOfWork(db):
+        revision = get_ledger_revision(db, portfolio_id)
+        watermark = get_snapshot_watermark(db, portfolio_id)
+        if watermark is None:
+            return 0
+        dates = list(
+            db.execute(
+                select(PositionSnapshot.snapshot_date)
+                .where(PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date >= watermark[0])
+                .distinct()
+                .order_by(PositionSnapshot.snapshot_date)
+            ).scalars()
+        )
+        states = _replay_snapshot_states(db, portfolio_id, dates)
+        if write_snapshots(db, portfolio_id, states, watermark, revision) is None:
+            return 0
+    return len(dates)
+
+
+def compact_snapshots(db: Session, portfolio_id: int, before: date) -> int:
+    """
+    Thin a portfolio's snapshots before ``before`` to the last one of each month; returns the dates removed.
+
+    The kept dates are re-encoded from the stored rows, without a replay, up to the
+    first keyframe after the last removed date.
+    """
+    with UnitOfWork(db):
+        dates = list(
+            db.execute(
+                select(PositionSnapshot.snapshot_date)
+                .where(PositionSnapshot.portfolio_id == portfolio_id, PositionSnapshot.snapshot_date < before)
+                .distinct()
+                .order_by(PositionSnapshot.snapshot_date)
+            ).scalars()
+        )
+        month_ends = {(day.year, day.month): day for day in dates}
+        removed = [day for day in dates if month_ends[(day.year, day.month)] != day]
+        if not removed:
+            return 0
+        stop = _next_keyframe(db, portfolio_id, removed[-1])
+        stored, previous, last_keyframe = _stored_chain(db, portfolio_id, removed[0], stop)
+        dropped = set(removed)
+        kept = [item for item in stored if item[0] not in dropped]
+        _rewrite_chain(db, portfolio_id, removed[0], stop, kept, previous, last_keyframe)
+    return len(removed)
+
+
+def backfill_dates(from_date: date, to_date: date, step: str = "day", every: int = 1) -> list[date]:
+    """
+    Snapshot dates of a backfill: ``cut_dates`` of the range, keeping every ``every``-th one.
+
+    ``to_date`` is always kept, so ``step="day", every=7`` snapshots weekly up to the end.
+    """
+    if every < 1:
+        raise ValueError("every must be at least 1")
+    cuts = cut_dates(from_date, to_date, step)
+    kept = cuts[::every]
+    if kept[-1] != cuts[-1]:
+        kept.append(cuts[-1])
+    return kept
+
+
+def replay_portfolio_snapshots(
+    db: Session, portfolio_id: int, dates: list[date]
+) -> tuple[dict[date, SnapshotState], tuple[date, int] | None, int]:
+    """Full holdings of a portfolio at ``dates``, with the watermark and ledger revision read before replaying them."""
+    revision = get_ledger_revision(db, portfolio_id)
+    watermark = get_snapshot_watermark(db, portfolio_id)
+    return _replay_snapshot_states(db, portfolio_id, dates), watermark, revision
+
+
+def backfill_snapshots(db: Session, portfolio_id: int, dates: list[date]) -> int | None:
+    """
+    Materialize a portfolio's snapshots at every one of ``dates`` from a single replay.
+
+    Unlike calling ``create_daily_snapshots`` per date, history is replayed once and the
+    rows are written with one transaction of bulk statements. Returns the rows written,
+    which only counts the changed positions on delta dates, or None when a ledger write
+    committed during the replay and the result was discarded.
+    """
+    with UnitOfWork(db):
+        written = write_snapshots(db, portfolio_id, *replay_portfolio_snapshots(db, portfolio_id, dates))
+    return written
@@ -1,141 +1,231 @@
 from __future__ import annotations
 
+import heapq
+import json
+from collections import defaultdict
+from datetime import date
 from decimal import Decimal
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, or_, select
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.asset import Asset
-from app.models.cash_transaction import CashTransaction, CashTxnType
-from app.models.corporate_action import CorporateAction
 from app.models.tax_lot import TaxLot
-from app.models.trade import Trade, TradeSide
+from app.models.tax_lot_checkpoint import TaxLotCheckpoint
+from app.services.replay_engine import ACTION, FifoLots, LedgerEvent, apply_event, load_events
 
+_LOT_KEY_FIELDS = ("portfolio_id", "asset_id", "source", "source_id")
+# Columns copied onto an existing row when its replayed lot differs.
+_LOT_FIELDS = (
+    "account_id",
+    "lot_date",
+    "original_shares",
+    "remaining_shares",
+    "cost_per_share",
+    "total_cost",
+    "asset_currency",
+    "settlement_currency",
+    "fx_rate",
+)
+_STORED = Decimal("0.000001")
 
-def rebuild_tax_lots(db: Session, portfolio_id: int, asset_id: int) -> list[TaxLot]:
-    db.execute(
-        delete(TaxLot).where(TaxLot.portfolio_id == portfolio_id, TaxLot.asset_id == asset_id)
-    )
 
-    asset = db.get(Asset, asset_id)
-    asset_currency = asset.currency if asset else None
+def _same(stored, value) -> bool:
+    # Numeric(18, 6) columns come back rounded; compare at that precision.
+    if isinstance(stored, Decimal) and isinstance(value, Decimal):
+        return stored.quantize(_STORED) == value.quantize(_STORED)
+    return stored == value
 
-    trades = (
-        db.execute(
-            select(Trade)
-            .where(Trade.portfolio_id == portfolio_id, Trade.asset_id == asset_id)
-            .order_by(Trade.trade_date, Trade.id)
-        )
-        .scalars()
-        .all()
-    )
 
-    actions = (
-        db.execute(
-            select(CorporateAction)
-            .where(
-                CorporateAction.asset_id == asset_id,
-                CorporateAction.processed_at.is_(None),
-            )
-            .order_by(CorporateAction.date, CorporateAction.id)
-        )
-        .scalars()
-        .all()
-    )
+def _lot_key(lot: TaxLot) -> tuple[str, int | None]:
+    return lot.source, lot.source_id
+
+
+def invalidate_lot_checkpoints(
+    db: Session, asset_id: int, from_date: date | None = None, portfolio_id: int | None = None
+) -> None:
+    """Drop checkpoints that may include events changed on or after ``from_date`` (all when None)."""
+    filters = [TaxLotCheckpoint.asset_id == asset_id]
+    if portfolio_id is not None:
+        filters.append(TaxLotCheckpoint.portfolio_id == portfolio_id)
+    if from_date is not None:
+        filters.append(TaxLotCheckpoint.checkpoint_date >= from_date)
+    db.execute(delete(TaxLotCheckpoint).where(*filters))
+
 
-    stock_divs = (
+def _load_checkpoint(
+    db: Session, portfolio_id: int, asset_id: int, before: date
+) -> tuple[TaxLotCheckpoint, list[list[str]]] | None:
+    checkpoint = (
         db.execute(
-            select(CashTransaction)
+            select(TaxLotCheckpoint)
             .where(
-                CashTransaction.portfolio_id == portfolio_id,
-                CashTransaction.asset_id == asset_id,
-                CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
+                TaxLotCheckpoint.portfolio_id == portfolio_id,
+                TaxLotCheckpoint.asset_id == asset_id,
+                TaxLotCheckpoint.checkpoint_date < before,
             )
-            .order_by(CashTransaction.date, CashTransaction.id)
+            .order_by(TaxLotCheckpoint.checkpoint_date.desc())
+            .limit(1)
         )
         .scalars()
-        .all()
+        .first()
     )
+    if checkpoint is None:
+        return None
+    return checkpoint, json.loads(checkpoint.open_lots)
 
-    timeline = []
-    for act in actions:
-        timeline.append((act.date, 0, "action", act))
-    for div in stock_divs:
-        timeline.append((div.date, 1, "stock_div", div))
-    for tr in trades:
-        timeline.append((tr.trade_date, 2, "trade", tr))
-    timeline.sort(key=lambda x: (x[0], x[1]))
 
-    lots: list[TaxLot] = []
+def _seed_lots(entries: list[list[str]], rows: dict[tuple[str, int | None], TaxLot]) -> list[TaxLot] | None:
+    """Open lots at a checkpoint, rebuilt from their stored rows; None if a row is missing."""
+    seeds: list[TaxLot] = []
+    for source, source_id, original_shares, remaining_shares in entries:
+        row = rows.get((source, source_id))
+        if row is None:
+            return None
+        lot = TaxLot(
+            **{field: getattr(row, field) for field in _LOT_KEY_FIELDS},
+            **{field: getattr(row, field) for field in _LOT_FIELDS},
+        )
+        lot.original_shares = Decimal(original_shares)
+        lot.remaining_shares = Decimal(remaining_shares)
+        lot.cost_per_share = lot.total_cost / lot.original_shares if lot.original_shares > 0 else Decimal("0")
+        seeds.append(lot)
+    return seeds
+
 
-    for _, _, kind, obj in timeline:
-        if kind == "action":
-            act = obj
-            ratio = Decimal(act.numerator) / Decimal(act.denominator)
-            if ratio <= 0:
-                continue
-            for lot in lots:
-                lot.original_shares *= ratio
-                lot.remaining_shares *= ratio
-                if lot.original_shares > 0:
-                    lot.cost_per_share = lot.total_cost / lot.original_shares
-                else:
-                    lot.cost_per_share = Decimal("0")
-        elif kind == "stock_div":
-            div = obj
-            if div.shares is None or div.shares <= 0:
-                continue
-            lot = TaxLot(
-                portfolio_id=div.portfolio_id,
-                account_id=div.account_id,
-                asset_id=div.asset_id,
-                lot_date=div.date,
-                original_shares=div.shares,
-                remaining_shares=div.shares,
-                cost_per_share=Decimal("0"),
-                total_cost=Decimal("0"),
-                asset_currency=asset_currency,
-                settlement_currency=div.account.currency if div.account else None,
-                fx_rate=None,
-                source="STOCK_DIV",
-                source_id=div.id,
+def _replay_with_checkpoints(
+    db: Session, portfolio_id: int, asset_id: int, fifo: FifoLots, events: list[LedgerEvent]
+) -> None:
+    """Replay events, storing the open lots after every ``tax_lot_checkpoint_interval`` events."""
+    interval = settings.tax_lot_checkpoint_interval
+    since_checkpoint = 0
+    for idx, event in enumerate(events):
+        apply_event(event, fifo)
+        since_checkpoint += 1
+        at_day_end = idx + 1 == len(events) or events[idx + 1].date > event.date
+        if interval and since_checkpoint >= interval and at_day_end:
+            open_lots = [
+                [lot.source, lot.source_id, str(lot.original_shares), str(lot.remaining_shares)]
+                for lot in fifo.open_lots
+            ]
+            db.add(
+                TaxLotCheckpoint(
+                    portfolio_id=portfolio_id,
+                    asset_id=asset_id,
+                    checkpoint_date=event.date,
+                    open_lots=json.dumps(open_lots),
+                )
             )
+            since_checkpoint = 0
+
+
+def rebuild_tax_lots(db: Session, portfolio_id: int, asset_id: int, from_date: date | None = None) -> list[TaxLot]:
+    """
+    Recompute the FIFO lots of a (portfolio, asset) after its events changed on or after ``from_date``.
+
+    Resumes from the latest checkpoint before ``from_date`` when one exists and no corporate
+    action follows it (an action rescales closed lots too, which checkpoints do not hold).
+    Existing rows are diffed against the replay by (source, source_id): only changed lots
+    are updated, new ones inserted and vanished ones deleted. Returns the replayed lots,
+    i.e. every lot on a full rebuild.
+    """
+    asset = db.get(Asset, asset_id)
+    asset_currency = asset.currency if asset else None
+
+    resumed = _load_checkpoint(db, portfolio_id, asset_id, from_date) if from_date is not None else None
+    invalidate_lot_checkpoints(db, asset_id, from_date if resumed else None, portfolio_id)
+
+    fifo: FifoLots | None = None
+    if resumed is not None:
+        checkpoint, entries = resumed
+        events = load_events(db, portfolio_id, asset_id=asset_id, after=checkpoint.checkpoint_date)
+        if all(event.rank != ACTION for event in events):
+            open_ids = {source_id for _, source_id, _, _ in entries}
+            rows = {
+                _lot_key(row): row
+                for row in db.execute(
+                    select(TaxLot).where(
+                        TaxLot.portfolio_id == portfolio_id,
+                        TaxLot.asset_id == asset_id,
+                        or_(TaxLot.lot_date > checkpoint.checkpoint_date, TaxLot.source_id.in_(open_ids)),
+                    )
+                ).scalars()
+            }
+            seeds = _seed_lots(entries, rows)
+            if seeds is not None:
+                # Lots closed by the checkpoint are final; only open and later lots are in scope.
+                open_keys = {(source, source_id) for source, source_id, _, _ in entries}
+                rows = {
+                    key: row
+                    for key, row in rows.items()
+                    if key in open_keys or row.lot_date > checkpoint.checkpoint_date
+                }
+                fifo = FifoLots(asset_currency, seeds)
+        if fifo is None:
+            invalidate_lot_checkpoints(db, asset_id, None, portfolio_id)
+
+    if fifo is None:
+        events = load_events(db, portfolio_id, asset_id=asset_id)
+        rows = {
+            _lot_key(row): row
+            for row in db.execute(
+                select(TaxLot).where(TaxLot.portfolio_id == portfolio_id, TaxLot.asset_id == asset_id)
+            ).scalars()
+        }
+        fifo = FifoLots(asset_currency)
+
+    _replay_with_checkpoints(db, portfolio_id, asset_id, fifo, events)
+    return _write_lots(db, fifo.lots, rows)
+
+
+def _write_lots(db: Session, replayed: list[TaxLot], rows: dict[tuple[str, int | None], TaxLot]) -> list[TaxLot]:
+    """Diff replayed lots against their stored ``rows`` (consumed) and write only the changes."""
+    lots: list[TaxLot] = []
+    for lot in replayed:
+        row = rows.pop(_lot_key(lot), None)
+        if row is None:
+            db.add(lot)
             lots.append(lot)
+            continue
+        for field in _LOT_FIELDS:
+            value = getattr(lot, field)
+            if not _same(getattr(row, field), value):
+                setattr(row, field, value)
+        lots.append(row)
+    for row in rows.values():
+        db.delete(row)
+    return lots
+
+
+def rebuild_asset_tax_lots(db: Session, asset_id: int) -> dict[str, int]:
+    """
+    Fully recompute the FIFO lots of an asset in every portfolio, e.g. after a split.
+
+    Loads the asset's events and stored lots once for all portfolios instead of once per
+    portfolio; unprocessed corporate actions are fed to each portfolio's replay. Returns
+    the number of portfolios replayed and lots written.
+    """
+    asset = db.get(Asset, asset_id)
+    asset_currency = asset.currency if asset else None
+    invalidate_lot_checkpoints(db, asset_id)
+
+    actions: list[LedgerEvent] = []
+    by_portfolio: dict[int, list[LedgerEvent]] = defaultdict(list)
+    for event in load_events(db, None, asset_id=asset_id):
+        if event.rank == ACTION:
+            actions.append(event)
         else:
-            tr = obj
-            if tr.side == TradeSide.BUY:
-                total_cost = tr.quantity * tr.price + tr.fee + tr.tax
-                cost_per_share = total_cost / tr.quantity if tr.quantity > 0 else Decimal("0")
-                lot = TaxLot(
-                    portfolio_id=tr.portfolio_id,
-                    account_id=tr.account_id,
-                    asset_id=tr.asset_id,
-                    lot_date=tr.trade_date,
-                    original_shares=tr.quantity,
-                    remaining_shares=tr.quantity,
-                    cost_per_share=cost_per_share,
-                    total_cost=total_cost,
-                    asset_currency=tr.asset_currency or asset_currency,
-                    settlement_currency=tr.settlement_currency,
-                    fx_rate=tr.fx_rate,
-                    source="BUY",
-                    source_id=tr.id,
-                )
-                lots.append(lot)
-            else:
-                remaining = tr.quantity
-                for lot in lots:
-                    if remaining <= 0:
-                        break
-                    if lot.remaining_shares <= 0:
-                        continue
-                    take = lot.remaining_shares if lot.remaining_shares <= remaining else remaining
-                    lot.remaining_shares -= take
-                    remaining -= take
-                if remaining > 0:
-                    raise ValueError("Sell quantity exceeds available lots")
-
-    for lot in lots:
-        db.add(lot)
+            by_portfolio[event.obj.portfolio_id].append(event)
+    rows_by_portfolio: dict[int, dict[tuple[str, int | None], TaxLot]] = defaultdict(dict)
+    for row in db.execute(select(TaxLot).where(TaxLot.asset_id == asset_id)).scalars():
+        rows_by_portfolio[row.portfolio_id][_lot_key(row)] = row
 
-    return lots
+    portfolio_ids = sorted(by_portfolio.keys() | rows_by_portfolio.keys())
+    lot_count = 0
+    for portfolio_id in portfolio_ids:
+        events = list(heapq.merge(actions, by_portfolio[portfolio_id], key=lambda ev: (ev.date, ev.rank)))
+        fifo = FifoLots(asset_currency)
+        _replay_with_checkpoints(db, portfolio_id, asset_id, fifo, events)
+        lot_count += len(_write_lots(db, fifo.lots, rows_by_portfolio[portfolio_id]))
+    return {"portfolios": len(portfolio_ids), "lots": lot_count}
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.account import Account
+from app.models.portfolio import Portfolio
+from app.models.price_history import PriceHistory
+from app.services.cash_ledger_service import get_cash_balance_series
+from app.services.fx_service import get_fx_index
+from app.services.position_service import _initial_positions_from_snapshot
+from app.services.price_service import get_latest_prices
+from app.services.replay_engine import ACTION, AvgCostHoldings, apply_event, load_events
+
+
+def cut_dates(from_date: date, to_date: date, step: str) -> list[date]:
+    """
+    Dates at which a series is sampled.
+
+    ``day`` yields every calendar day; ``week`` and ``month`` yield the last day of
+    each period (Sunday / month end) inside the range. ``to_date`` is always included.
+    """
+    if step not in {"day", "week", "month"}:
+        raise ValueError(f"Unsupported step: {step}")
+
+    cuts: list[date] = []
+    current = from_date
+    while current <= to_date:
+        if step == "day":
+            cuts.append(current)
+            current += timedelta(days=1)
+        elif step == "week":
+            end = current + timedelta(days=6 - current.weekday())
+            if end <= to_date:
+                cuts.append(end)
+            current = end + timedelta(days=1)
+        else:
+            end = current.replace(day=calendar.monthrange(current.year, current.month)[1])
+            if end <= to_date:
+                cuts.append(end)
+            current = end + timedelta(days=1)
+    if not cuts or cuts[-1] != to_date:
+        cuts.append(to_date)
+    return cuts
+
+
+def _price_series(
+    db: Session, asset_ids: list[int], from_date: date, to_date: date
+) -> tuple[dict[int, Decimal], list[tuple[int, date, Decimal]]]:
+    """Latest close on or before ``from_date`` per asset, plus every close inside the range."""
+    if not asset_ids:
+        return {}, []
+
+    seed = get_latest_prices(db, asset_ids, from_date)
+    rows = db.execute(
+        select(PriceHistory.asset_id, PriceHistory.date, PriceHistory.close)
+        .where(
+            PriceHistory.asset_id.in_(asset_ids),
+            PriceHistory.date > from_date,
+            PriceHistory.date <= to_date,
+        )
+        .order_by(PriceHistory.date)
+    ).all()
+    return seed, [tuple(row) for row in rows]
+
+
+def get_position_timeseries(
+    db: Session,
+    portfolio_id: int,
+    from_date: date,
+    to_date: date,
+    step: str = "day",
+) -> list[dict]:
+    """
+    Holdings, market value and cash sampled over a date range with a single replay.
+
+    Events and prices are both walked forward once; each sample uses the latest close on
+    or before its date (an as-of join against ``price_history``). Point totals are in the
+    portfolio's base currency, converted at each sample date's rate as
+    ``get_positions(in_base_currency=True)`` does; holdings and accounts with no rate are
+    left out of the totals and listed in ``unconverted_asset_ids`` / ``unconverted_account_ids``.
+    """
+    portfolio = db.get(Portfolio, portfolio_id)
+    if not portfolio:
+        return []
+    base = portfolio.base_currency
+    cuts = cut_dates(from_date, to_date, step)
+
+    positions, start_date = _initial_positions_from_snapshot(db, portfolio_id, from_date)
+    events = load_events(db, portfolio_id, up_to=to_date, after=start_date)
+    holdings = AvgCostHoldings(positions)
+
+    # Assets only touched by corporate actions never hold shares; skip their prices.
+    asset_ids = set(positions)
+    currencies = {base, *(pos.asset.currency for pos in positions.values())}
+    for event in events:
+        if event.rank != ACTION and event.obj.asset_id is not None:
+            asset_ids.add(event.obj.asset_id)
+            currencies.add(event.obj.asset.currency)
+    last_close, price_rows = _price_series(db, sorted(asset_ids), from_date, to_date)
+
+    accounts = db.execute(
+        select(Account.id, Account.currency).where(Account.portfolio_id == portfolio_id).order_by(Account.id)
+    ).all()
+    currencies.update(currency for _, currency in accounts)
+    cash_series = [
+        (account_id, currency, get_cash_balance_series(db, account_id, cuts)) for account_id, currency in accounts
+    ]
+    fx = get_fx_index(db, currencies)
+
+    series: list[dict] = []
+    event_idx = 0
+    price_idx = 0
+    for cut_idx, cut in enumerate(cuts):
+        while event_idx < len(events) and events[event_idx].date <= cut:
+            apply_event(events[event_idx], holdings)
+            event_idx += 1
+        while price_idx < len(price_rows) and price_rows[price_idx][1] <= cut:
+            asset_id, _, close = price_rows[price_idx]
+            last_close[asset_id] = close
+            price_idx += 1
+
+        market_value = Decimal("0")
+        cost_basis = Decimal("0")
+        unconverted_assets: list[int] = []
+        items: list[dict] = []
+        for asset_id, pos in holdings.positions.items():
+            if pos.shares <= 0:
+                continue
+            close = last_close.get(asset_id)
+            value = pos.shares * close if close is not None else None
+            rate = fx.rate(pos.asset.currency, base, cut)
+            value_base = None
+            if rate is None:
+                unconverted_assets.append(asset_id)
+            else:
+                if value is not None:
+                    value_base = value * rate
+                    market_value += value_base
+                cost_basis += pos.cost_basis * rate
+            items.append(
+                {
+                    "asset_id": asset_id,
+                    "shares": pos.shares,
+                    "last_price": close,
+                    "market_value": value,
+                    "fx_rate_used": rate,
+                    "market_value_base": value_base,
+                }
+            )
+
+        cash_balance = Decimal("0")
+        unconverted_accounts: list[int] = []
+        for account_id, currency, balances in cash_series:
+            rate = fx.rate(currency, base, cut)
+            if rate is None:
+                unconverted_accounts.append(account_id)
+            else:
+                cash_balance += balances[cut_idx][1] * rate
+        series.append(
+            {
+                "date": cut,
+                "currency": base,
+                "market_value": market_value,
+                "cost_basis": cost_basis,
+                "cash_balance": cash_balance,
+                "unconverted_asset_ids": sorted(unconverted_assets),
+                "unconverted_account_ids": unconverted_accounts,
+                "holdings": items,
+            }
+        )
+    return series
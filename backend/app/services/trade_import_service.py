@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import NamedTuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.cash_balance import CashBalance
+from app.models.cash_transaction import CashTransaction
+from app.models.share_balance import ShareBalance
+from app.models.tag import Tag
+from app.models.tax_lot_checkpoint import TaxLotCheckpoint
+from app.models.trade import Trade, TradeSide, trade_tag_table
+from app.services.adjustment_service import AdjustmentFactors, load_adjustment_factors
+from app.services.cash_ledger_service import adjust_cash_balances, trade_expense_values, trade_total_cost
+from app.services.position_state_service import refresh_position_state
+from app.services.share_index_service import (
+    ShareMovement,
+    adjust_share_balances,
+    reverse_movements,
+    trade_movement,
+)
+from app.services.tax_lot_service import invalidate_lot_checkpoints, rebuild_tax_lots
+
+_STORED = Decimal("0.000001")
+
+
+class ImportRow(NamedTuple):
+    """A validated, currency-normalized trade from an import; ``row`` is its 1-based input position."""
+
+    row: int
+    data: dict
+    tag_names: list[str]
+
+
+class ImportResult(NamedTuple):
+    inserted: int
+    errors: list[dict]
+    portfolio_ids: set[int]
+
+
+class _ShareWalker:
+    """
+    Sellable shares of one (portfolio, asset), from its share index plus the import rows accepted so far.
+
+    Applies the ``available_shares`` rule: a SELL may not exceed the lowest balance on
+    or after its date. Rows are walked in date order, so every accepted row is dated on
+    or before the current one and shifts all of those balances by the same units.
+    """
+
+    def __init__(self, rows: list[tuple[date, Decimal]], factors: AdjustmentFactors):
+        self.dates = [on for on, _ in rows]
+        self.factors = factors
+        # Lowest units from each index row onwards.
+        self.floors = [units for _, units in rows]
+        for idx in range(len(self.floors) - 2, -1, -1):
+            self.floors[idx] = min(self.floors[idx], self.floors[idx + 1])
+        self.balances = [units for _, units in rows]
+        self.accepted = Decimal("0")
+
+    def available_on(self, on: date) -> Decimal:
+        idx = bisect_right(self.dates, on)
+        lowest = self.balances[idx - 1] if idx else Decimal("0")
+        if idx < len(self.floors):
+            lowest = min(lowest, self.floors[idx])
+        return ((lowest + self.accepted) * self.factors.on(on)).quantize(_STORED, ROUND_HALF_UP)
+
+    def accept(self, on: date, shares: Decimal) -> None:
+        self.accepted += self.factors.units(on, shares)
+
+
+class _CashWalker:
+    """Cash balance of one account on a date, less the import rows accepted so far."""
+
+    def __init__(self, balances: list[tuple[date, Decimal]]):
+        self.balances = balances
+        self.pos = 0
+        self.ledger = Decimal("0")
+        self.spent = Decimal("0")
+
+    def balance_on(self, on: date) -> Decimal:
+        while self.pos < len(self.balances) and self.balances[self.pos][0] <= on:
+            self.ledger = self.balances[self.pos][1]
+            self.pos += 1
+        return self.ledger - self.spent
+
+
+def _share_walkers(db: Session, keys: set[tuple[int, int]]) -> dict[tuple[int, int], _ShareWalker]:
+    rows: dict[tuple[int, int], list[tuple[date, Decimal]]] = defaultdict(list)
+    if keys:
+        result = db.execute(
+            select(ShareBalance.portfolio_id, ShareBalance.asset_id, ShareBalance.date, ShareBalance.units)
+            .where(
+                ShareBalance.portfolio_id.in_({portfolio_id for portfolio_id, _ in keys}),
+                ShareBalance.asset_id.in_({asset_id for _, asset_id in keys}),
+            )
+            .order_by(ShareBalance.portfolio_id, ShareBalance.asset_id, ShareBalance.date)
+        ).all()
+        for portfolio_id, asset_id, day, units in result:
+            if (portfolio_id, asset_id) in keys:
+                rows[(portfolio_id, asset_id)].append((day, units))
+    factors = load_adjustment_factors(db, [asset_id for _, asset_id in keys])
+    return {key: _ShareWalker(rows[key], factors[key[1]]) for key in keys}
+
+
+def _cash_walkers(db: Session, account_ids: set[int]) -> dict[int, _CashWalker]:
+    balances: dict[int, list[tuple[date, Decimal]]] = defaultdict(list)
+    if account_ids:
+        rows = db.execute(
+            select(CashBalance.account_id, CashBalance.date, CashBalance.balance)
+            .where(CashBalance.account_id.in_(account_ids))
+            .order_by(CashBalance.account_id, CashBalance.date)
+        ).all()
+        for account_id, day, balance in rows:
+            balances[account_id].append((day, balance))
+    return {account_id: _CashWalker(balances[account_id]) for account_id in account_ids}
+
+
+def validate_import(db: Session, rows: list[ImportRow]) -> tuple[list[ImportRow], list[dict]]:
+    """
+    Check sells against available shares and buys against cash in one ordered pass.
+
+    Rows are walked by (trade_date, input order) alongside the existing ledger, so each
+    row sees the existing ledger plus the import rows accepted before it, which is what
+    ``POST /trades`` would have seen had the rows been posted in that order: a SELL is
+    checked against the lowest share balance on or after its date, a BUY against cash.
+    Returns the accepted rows and an error entry for each rejected one.
+    """
+    ordered = sorted(rows, key=lambda r: (r.data["trade_date"], r.row))
+    shares = _share_walkers(db, {(r.data["portfolio_id"], r.data["asset_id"]) for r in rows})
+    cash = _cash_walkers(db, {r.data["account_id"] for r in rows if r.data["side"] == TradeSide.BUY})
+
+    accepted: list[ImportRow] = []
+    errors: list[dict] = []
+    for item in ordered:
+        data = item.data
+        trade_date = data["trade_date"]
+        walker = shares[(data["portfolio_id"], data["asset_id"])]
+        if data["side"] == TradeSide.SELL:
+            if data["quantity"] > walker.available_on(trade_date):
+                errors.append({"row": item.row, "error": "Sell quantity exceeds available shares"})
+                continue
+            walker.accept(trade_date, -data["quantity"])
+        else:
+            account = cash[data["account_id"]]
+            total_cost = trade_total_cost(Trade(**data))
+            if account.balance_on(trade_date) < total_cost:
+                errors.append({"row": item.row, "error": "Insufficient cash balance"})
+                continue
+            account.spent += total_cost
+            walker.accept(trade_date, data["quantity"])
+        accepted.append(item)
+    return accepted, errors
+
+
+def _resolve_tags(db: Session, rows: list[ImportRow]) -> dict[str, int]:
+    names = {name for item in rows for name in item.tag_names}
+    if not names:
+        return {}
+    tag_ids = dict(db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    missing = sorted(names - tag_ids.keys())
+    if missing:
+        created = db.execute(
+            insert(Tag).returning(Tag.name, Tag.id, sort_by_parameter_order=True),
+            [{"name": name} for name in missing],
+        ).all()
+        tag_ids.update(dict(created))
+    return tag_ids
+
+
+def _insert_group(db: Session, rows: list[ImportRow], tag_ids: dict[str, int]) -> tuple[list[int], list[int]]:
+    """Insert one (portfolio, asset) group's trades, expenses and tag links; returns their ids."""
+    trade_ids = list(
+        db.execute(
+            insert(Trade).returning(Trade.id, sort_by_parameter_order=True),
+            [item.data for item in rows],
+        ).scalars()
+    )
+    expenses = [
+        trade_expense_values(Trade(id=trade_id, **item.data))
+        for trade_id, item in zip(trade_ids, rows)
+        if item.data["side"] == TradeSide.BUY
+    ]
+    expense_ids: list[int] = []
+    if expenses:
+        expense_ids = list(
+            db.execute(
+                insert(CashTransaction).returning(CashTransaction.id, sort_by_parameter_order=True), expenses
+            ).scalars()
+        )
+        adjust_cash_balances(db, [(e["account_id"], e["date"], e["amount"]) for e in expenses])
+    links = [
+        {"trade_id": trade_id, "tag_id": tag_ids[name]}
+        for trade_id, item in zip(trade_ids, rows)
+        for name in dict.fromkeys(item.tag_names)
+    ]
+    if links:
+        db.execute(insert(trade_tag_table), links)
+    adjust_share_balances(db, _movements(rows))
+    return trade_ids, expense_ids
+
+
+def _movements(rows: list[ImportRow]) -> list[ShareMovement]:
+    return [trade_movement(Trade(**item.data)) for item in rows]
+
+
+def _delete_group(db: Session, rows: list[ImportRow], trade_ids: list[int], expense_ids: list[int]) -> None:
+    adjust_share_balances(db, reverse_movements(_movements(rows)))
+    db.execute(delete(trade_tag_table).where(trade_tag_table.c.trade_id.in_(trade_ids)))
+    if expense_ids:
+        removed = db.execute(
+            delete(CashTransaction)
+            .where(CashTransaction.id.in_(expense_ids))
+            .returning(CashTransaction.account_id, CashTransaction.date, CashTransaction.amount)
+        ).all()
+        adjust_cash_balances(db, [(account_id, on, -amount) for account_id, on, amount in removed])
+    db.execute(delete(Trade).where(Trade.id.in_(trade_ids)))
+
+
+def _discard_checkpoints(db: Session, portfolio_id: int, asset_id: int, from_date: date) -> None:
+    for obj in list(db.new):
+        if isinstance(obj, TaxLotCheckpoint) and (obj.portfolio_id, obj.asset_id) == (portfolio_id, asset_id):
+            db.expunge(obj)
+    invalidate_lot_checkpoints(db, asset_id, from_date, portfolio_id)
+
+
+def import_trades(db: Session, rows: list[ImportRow], atomic: bool = False) -> ImportResult:
+    """
+    Insert validated import rows and rebuild derived state once per touched (portfolio, asset).
+
+    Trades, their TRADE_EXPENSE rows and tag links are written with executemany. If the
+    lot rebuild of a group fails, that group's rows are removed again and reported as
+    errors; with ``atomic`` the ValueError propagates instead so the caller rolls back.
+    The caller owns the transaction and the cache invalidation of ``portfolio_ids``.
+    """
+    accepted, errors = validate_import(db, rows)
+    if atomic and errors:
+        return ImportResult(0, errors, set())
+
+    groups: dict[tuple[int, int], list[ImportRow]] = defaultdict(list)
+    for item in sorted(accepted, key=lambda r: r.row):
+        groups[(item.data["portfolio_id"], item.data["asset_id"])].append(item)
+
+    tag_ids = _resolve_tags(db, accepted)
+    inserted = 0
+    portfolio_ids: set[int] = set()
+    for (portfolio_id, asset_id), group in groups.items():
+        trade_ids, expense_ids = _insert_group(db, group, tag_ids)
+        from_date = min(item.data["trade_date"] for item in group)
+        try:
+            rebuild_tax_lots(db, portfolio_id, asset_id, from_date)
+        except ValueError as exc:
+            if atomic:
+                raise
+            # Lot rows are only rewritten once the replay succeeds, so dropping the group's
+            # rows and any checkpoints taken mid-replay restores the state it started from.
+            _discard_checkpoints(db, portfolio_id, asset_id, from_date)
+            _delete_group(db, group, trade_ids, expense_ids)
+            errors.extend({"row": item.row, "error": str(exc)} for item in group)
+            continue
+        refresh_position_state(db, portfolio_id, asset_id, from_date)
+        inserted += len(group)
+        portfolio_ids.add(portfolio_id)
+    errors.sort(key=lambda err: err["row"])
+    return ImportResult(inserted, errors, portfolio_ids)
@@ -4,18 +4,26 @@ from sqlalchemy.orm import Session
 
 
 class UnitOfWork:
-    """Lightweight Unit of Work wrapper around a SQLAlchemy session transaction."""
+    """
+    Lightweight Unit of Work wrapper around a SQLAlchemy session transaction.
+
+    Commits on success and rolls back on error. Works whether or not the session has
+    already autobegun a transaction (e.g. after validation queries in a router).
+    """
 
     def __init__(self, db: Session):
         self.db = db
-        self._tx = None
 
     def __enter__(self) -> "UnitOfWork":
-        self._tx = self.db.begin()
-        self._tx.__enter__()
         return self
 
     def __exit__(self, exc_type, exc, tb) -> bool | None:
-        if self._tx is None:
-            return None
-        return self._tx.__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            try:
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+        else:
+            self.db.rollback()
+        return None
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+# Point the app at a throwaway SQLite file before anything reads the settings.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='investment-tracker-tests-')}/test.db"
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main  # noqa: F401  (registers every mapped class)
+from app.core.config import settings
+from app.db.base import Base
+from app.db.session import SessionLocal, engine
+from app.services import cache
+
+settings.redis_url = None
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    """Every test starts from empty tables and an empty in-process cache."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    cache._local = cache._LocalCache()
+    cache._local_generations.clear()
+    cache._pending_bumps.clear()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    return TestClient(app.main.app)
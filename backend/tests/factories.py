@@ -0,0 +1,171 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy.orm import Session
+
+from app.models.account import Account
+from app.models.asset import Asset, AssetType
+from app.models.cash_transaction import CashTransaction, CashTxnType
+from app.models.corporate_action import CorporateAction, CorporateActionType
+from app.models.fx_rate import FXRate
+from app.models.portfolio import Portfolio
+from app.models.price_history import PriceHistory
+from app.models.trade import Trade, TradeSide
+
+START = date(2020, 1, 1)
+_CURRENCIES = ["USD", "EUR", "TWD"]
+
+
+def random_ledger(
+    db: Session, seed: int, n_portfolios: int = 2, n_assets: int = 5, n_trades: int = 250, days: int = 900
+) -> tuple[list[Portfolio], list[Asset]]:
+    """
+    Insert a randomized multi-currency ledger directly through the ORM and commit it.
+
+    Sells are not checked against holdings, so some replays hit oversells on purpose.
+    Every currency pair has direct quotes, so no conversion needs triangulation.
+    Derived tables (states, indexes, lots) are not maintained: callers exercise the
+    read paths that replay the raw ledger.
+    """
+    rnd = random.Random(seed)
+    portfolios = [Portfolio(name=f"P{i}", base_currency="TWD") for i in range(n_portfolios)]
+    db.add_all(portfolios)
+    db.flush()
+    accounts = [Account(portfolio_id=p.id, name="Broker", currency="USD") for p in portfolios]
+    assets = [
+        Asset(symbol=f"S{i}", name=f"S{i}", asset_type=AssetType.STOCK, currency=_CURRENCIES[i % 3])
+        for i in range(n_assets)
+    ]
+    db.add_all(accounts + assets)
+    db.flush()
+
+    def day() -> date:
+        return START + timedelta(days=rnd.randint(0, days))
+
+    for account in accounts:
+        db.add(
+            CashTransaction(
+                portfolio_id=account.portfolio_id,
+                account_id=account.id,
+                date=START,
+                type=CashTxnType.DEPOSIT,
+                amount=Decimal("10000000"),
+            )
+        )
+    for _ in range(n_trades):
+        account, asset = rnd.choice(accounts), rnd.choice(assets)
+        side = TradeSide.BUY if rnd.random() < 0.65 else TradeSide.SELL
+        db.add(
+            Trade(
+                portfolio_id=account.portfolio_id,
+                account_id=account.id,
+                asset_id=asset.id,
+                trade_date=day(),
+                side=side,
+                quantity=Decimal(rnd.randint(1, 50) if side == TradeSide.BUY else rnd.randint(1, 5)),
+                price=Decimal(rnd.randint(1000, 30000)) / 100,
+                fee=Decimal("1.5"),
+                tax=Decimal("0"),
+                asset_currency=asset.currency,
+                settlement_currency="USD",
+                fx_rate=None if asset.currency == "USD" else Decimal("1.1"),
+            )
+        )
+    for _ in range(4):
+        db.add(
+            CorporateAction(
+                asset_id=rnd.choice(assets).id,
+                date=day(),
+                type=CorporateActionType.SPLIT,
+                numerator=rnd.choice([2, 3]),
+                denominator=rnd.choice([1, 2]),
+            )
+        )
+    for _ in range(20):
+        account, asset = rnd.choice(accounts), rnd.choice(assets)
+        db.add(
+            CashTransaction(
+                portfolio_id=account.portfolio_id,
+                account_id=account.id,
+                asset_id=asset.id,
+                date=day(),
+                type=rnd.choice([CashTxnType.DIVIDEND_STOCK, CashTxnType.DIVIDEND_CASH]),
+                amount=Decimal("12.5"),
+                withholding_tax=Decimal("1"),
+                shares=Decimal(rnd.randint(1, 4)),
+            )
+        )
+    for _ in range(30):
+        account = rnd.choice(accounts)
+        db.add(
+            CashTransaction(
+                portfolio_id=account.portfolio_id,
+                account_id=account.id,
+                date=day(),
+                type=rnd.choice([CashTxnType.DEPOSIT, CashTxnType.WITHDRAW, CashTxnType.INTEREST, CashTxnType.REWARD]),
+                amount=Decimal(rnd.randint(-500, 500)),
+            )
+        )
+    for asset in assets:
+        for offset in range(days + 50):
+            if rnd.random() < 0.7:
+                db.add(
+                    PriceHistory(
+                        asset_id=asset.id,
+                        date=START + timedelta(days=offset),
+                        close=Decimal(rnd.randint(1000, 30000)) / 100,
+                        currency=asset.currency,
+                    )
+                )
+    for offset in range(0, days + 50, 3):
+        on = START + timedelta(days=offset)
+        db.add(FXRate(date=on, from_currency="USD", to_currency="TWD", rate=Decimal("30") + Decimal(offset % 7) / 10))
+        db.add(FXRate(date=on, from_currency="EUR", to_currency="USD", rate=Decimal("1.1") + Decimal(offset % 5) / 100))
+        db.add(FXRate(date=on, from_currency="EUR", to_currency="TWD", rate=Decimal("33") + Decimal(offset % 3) / 10))
+    db.commit()
+    return portfolios, assets
+
+
+API = "/api/v1"
+
+
+def post(client, path: str, **payload) -> dict:
+    response = client.post(API + path, json=payload)
+    assert response.status_code in (200, 201), response.text
+    return response.json()
+
+
+def api_portfolio(client, base_currency: str = "USD", cash: str = "100000") -> tuple[dict, dict]:
+    """A portfolio with one USD account funded on ``START`` through the API."""
+    portfolio = post(client, "/portfolios", name=f"Main {base_currency}", base_currency=base_currency)
+    account = post(client, "/accounts", portfolio_id=portfolio["id"], name="Broker", currency="USD")
+    post(
+        client,
+        "/cash-transactions",
+        portfolio_id=portfolio["id"],
+        account_id=account["id"],
+        date=START.isoformat(),
+        type="DEPOSIT",
+        amount=cash,
+    )
+    return portfolio, account
+
+
+def api_asset(client, symbol: str, currency: str = "USD") -> dict:
+    return post(client, "/assets", symbol=symbol, name=symbol, asset_type="STOCK", currency=currency)
+
+
+def api_trade(client, portfolio: dict, account: dict, asset: dict, on: date, side: str, quantity, price, **extra) -> dict:
+    return post(
+        client,
+        "/trades",
+        portfolio_id=portfolio["id"],
+        account_id=account["id"],
+        asset_id=asset["id"],
+        trade_date=on.isoformat(),
+        side=side,
+        quantity=str(quantity),
+        price=str(price),
+        **extra,
+    )
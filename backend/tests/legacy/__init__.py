@@ -0,0 +1,8 @@
+"""
+The ledger code as it was before the shared replay engine, kept as a test oracle.
+
+``position_service``, ``pnl_service`` and ``tax_lot_service`` are verbatim copies of
+the pre-engine modules; ``sell_checks`` holds the sell-availability walk that used to
+live in the trades router. Do not change them to follow new behaviour: they pin the
+semantics the replay engine was introduced to reproduce.
+"""
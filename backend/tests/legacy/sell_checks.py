@@ -0,0 +1,67 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+
+def available_shares(db: Session, portfolio_id: int, asset_id: int, up_to: date, exclude_trade_id: int | None = None) -> Decimal:
+    from app.models.corporate_action import CorporateAction
+    from app.models.cash_transaction import CashTransaction, CashTxnType
+    from app.models.trade import Trade, TradeSide
+    from app.models.asset import Asset
+
+    # Collect events up to (and including) up_to
+    trades = db.execute(
+        select(Trade)
+        .where(Trade.portfolio_id == portfolio_id, Trade.asset_id == asset_id, Trade.trade_date <= up_to)
+        .order_by(Trade.trade_date, Trade.id)
+    ).scalars().all()
+    actions = db.execute(
+        select(CorporateAction)
+        .where(
+            CorporateAction.asset_id == asset_id,
+            CorporateAction.processed_at.is_(None),
+            CorporateAction.date <= up_to,
+        )
+        .order_by(CorporateAction.date, CorporateAction.id)
+    ).scalars().all()
+    stock_divs = db.execute(
+        select(CashTransaction)
+        .where(
+            CashTransaction.portfolio_id == portfolio_id,
+            CashTransaction.asset_id == asset_id,
+            CashTransaction.type == CashTxnType.DIVIDEND_STOCK,
+            CashTransaction.date <= up_to,
+        )
+        .order_by(CashTransaction.date, CashTransaction.id)
+    ).scalars().all()
+
+    timeline = []
+    for act in actions:
+        timeline.append((act.date, 0, "action", act))
+    for div in stock_divs:
+        timeline.append((div.date, 1, "stock_div", div))
+    for tr in trades:
+        if exclude_trade_id is not None and tr.id == exclude_trade_id:
+            continue
+        timeline.append((tr.trade_date, 2, "trade", tr))
+    timeline.sort(key=lambda x: (x[0], x[1]))
+
+    shares = Decimal("0")
+    for _, _, kind, obj in timeline:
+        if kind == "action":
+            act = obj
+            ratio = Decimal(act.numerator) / Decimal(act.denominator)
+            shares *= ratio
+        elif kind == "stock_div":
+            div = obj
+            if div.shares:
+                shares += div.shares
+        else:
+            tr = obj
+            if tr.side == TradeSide.BUY:
+                shares += tr.quantity
+            else:
+                shares -= tr.quantity
+    return shares
@@ -0,0 +1,211 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.account import Account
+from app.routers import price as price_router
+from app.services import cache, cache_codec
+from app.services.cache import portfolio_cache_key
+from app.services.cache_invalidation import portfolios_exposed_to_currencies, portfolios_holding_asset
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post, random_ledger
+
+
+def test_report_cache_keys_name_the_resolved_day(client):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 10)
+
+    response = client.get(f"{API}/reports/positions", params={"portfolio_id": portfolio["id"]})
+    assert response.status_code == 200
+
+    today = datetime.now(timezone.utc).date()
+    assert cache._get_body(portfolio_cache_key(portfolio["id"], "positions", today, 0)) == response.content
+    assert cache._get_body(portfolio_cache_key(portfolio["id"], "positions", None, 0)) is None
+
+
+def test_currency_exposure_matches_the_per_asset_lookup(db):
+    portfolios, assets = random_ledger(db, seed=3, n_trades=60, days=120)
+    for currencies in (["USD"], ["EUR"], ["TWD"], ["EUR", "JPY"], ["JPY"]):
+        expected = {p.id for p in portfolios if p.base_currency in currencies}
+        expected |= set(db.execute(select(Account.portfolio_id).where(Account.currency.in_(currencies))).scalars())
+        for asset in assets:
+            if asset.currency in currencies:
+                expected |= portfolios_holding_asset(db, asset.id)
+        assert portfolios_exposed_to_currencies(db, currencies) == expected
+    assert portfolios_exposed_to_currencies(db, []) == set()
+
+
+def test_concurrent_misses_compute_once():
+    calls = []
+    gate = threading.Event()
+
+    def compute():
+        calls.append(1)
+        gate.wait(1)
+        return {"value": Decimal("1.50")}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.cache_get_or_compute_body, "cache:test:flight", compute) for _ in range(8)]
+        time.sleep(0.1)
+        gate.set()
+        bodies = {future.result() for future in futures}
+    assert bodies == {b'{"value":"1.50"}'}
+    assert len(calls) == 1
+
+
+def test_local_tier_evicts_least_recently_used_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "local_cache_max_bytes", 30)
+    for key in ("a", "b", "c"):
+        cache._set_body(f"cache:test:{key}", b"0123456789", None)
+    assert cache._get_body("cache:test:a") is not None  # a is now the most recently used
+    cache._set_body("cache:test:d", b"0123456789", None)
+
+    assert cache._get_body("cache:test:b") is None
+    assert all(cache._get_body(f"cache:test:{key}") is not None for key in ("a", "c", "d"))
+    assert cache._local.usage() == (3, 30)
+
+
+def test_a_ledger_write_only_invalidates_its_portfolio(client):
+    portfolio, account = api_portfolio(client)
+    other, _ = api_portfolio(client, "TWD")
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=1), "BUY", 10, 10)
+
+    def shares() -> list[Decimal]:
+        response = client.get(f"{API}/reports/positions", params={"portfolio_id": portfolio["id"]})
+        return [Decimal(p["shares_held"]) for p in response.json()]
+
+    assert shares() == [Decimal("10")]
+    other_generation = cache.portfolio_generation(other["id"])
+    generation = cache.portfolio_generation(portfolio["id"])
+
+    api_trade(client, portfolio, account, asset, START + timedelta(days=2), "BUY", 5, 10)
+    assert cache.portfolio_generation(portfolio["id"]) != generation
+    assert cache.portfolio_generation(other["id"]) == other_generation
+    assert shares() == [Decimal("15")]
+
+
+def test_an_fx_write_refreshes_converted_reports(client, db):
+    portfolio, account = api_portfolio(client, "TWD")
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=1), "BUY", 10, 10)
+    post(client, "/fx-rates", date=START.isoformat(), from_currency="USD", to_currency="TWD", rate="30")
+
+    def rate_used() -> Decimal:
+        params = {"portfolio_id": portfolio["id"], "in_base_currency": True}
+        return Decimal(client.get(f"{API}/reports/positions", params=params).json()[0]["fx_rate_used"])
+
+    assert rate_used() == Decimal("30")
+    later = (START + timedelta(days=3)).isoformat()
+    post(client, "/fx-rates", date=later, from_currency="USD", to_currency="TWD", rate="31")
+    assert rate_used() == Decimal("31")
+
+
+def test_a_price_write_makes_the_cached_latest_close_unreachable(client, monkeypatch):
+    asset = api_asset(client, "AAA")
+    closes = [(START, Decimal("10"))]
+    monkeypatch.setattr(price_router, "fetch_daily_close", lambda symbol, start, end: closes)
+    params = {"asset_id": asset["id"], "start": START.isoformat(), "end": (START + timedelta(days=5)).isoformat()}
+
+    def latest_close() -> Decimal:
+        return Decimal(client.get(f"{API}/prices/latest", params={"asset_id": asset["id"]}).json()["close"])
+
+    assert client.post(f"{API}/prices/update", params=params).status_code == 200
+    assert latest_close() == Decimal("10")
+    old_key = f"cache:price:latest:{asset['id']}:{cache.price_data_version()}"
+    closes.append((START + timedelta(days=1), Decimal("11")))
+    assert client.post(f"{API}/prices/update", params=params).status_code == 200
+    # The write does not delete the entry; other workers' copies are simply never read again.
+    assert cache._get_body(old_key) is not None
+    assert latest_close() == Decimal("11")
+
+
+def test_codec_keeps_decimals_exact_and_compresses_large_bodies(monkeypatch):
+    value = {"amount": Decimal("0.1000000000000000000000001"), "on": START, "rows": [Decimal("-3E-7")]}
+    body = cache_codec.dumps(value)
+    assert cache_codec.loads(body) == {
+        "amount": "0.1000000000000000000000001",
+        "on": "2020-01-01",
+        "rows": ["-0.0000003"],
+    }
+
+    monkeypatch.setattr(settings, "cache_compress_min_bytes", 64)
+    small, large = b'{"a":1}', cache_codec.dumps({"rows": ["same"] * 100})
+    assert cache_codec.pack(small) == cache_codec.FORMAT_JSON + small
+    packed = cache_codec.pack(large)
+    assert packed[:1] == cache_codec.FORMAT_JSON_ZLIB and len(packed) < len(large)
+    assert cache_codec.unpack(packed) == large
+    assert cache_codec.unpack(b"?legacy") is None
+    assert cache_codec.unpack(cache_codec.FORMAT_JSON_ZLIB + b"not zlib") is None
+
+
+class _FlakyRedis:
+    """The few Redis calls the cache makes, failing with a connection error while ``down``."""
+
+    def __init__(self) -> None:
+        self.down = True
+        self.calls = 0
+        self.data: dict[str, bytes] = {}
+
+    def _call(self) -> None:
+        self.calls += 1
+        if self.down:
+            raise RedisConnectionError("down")
+
+    def ping(self) -> bool:
+        self._call()
+        return True
+
+    def get(self, key: str) -> bytes | None:
+        self._call()
+        return self.data.get(key)
+
+    def set(self, key: str, value: bytes, **options) -> bool:
+        self._call()
+        self.data[key] = value
+        return True
+
+    def pipeline(self, transaction: bool = True) -> "_FlakyRedis":
+        self._call()
+        self.queued: list[str] = []
+        return self
+
+    def incr(self, key: str) -> None:
+        self.queued.append(key)
+
+    def execute(self) -> None:
+        for key in self.queued:
+            self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+
+
+def test_breaker_skips_redis_while_down_and_replays_bumps(monkeypatch):
+    redis = _FlakyRedis()
+    monkeypatch.setattr(settings, "redis_url", "redis://unused")
+    monkeypatch.setattr(settings, "cache_breaker_failure_threshold", 2)
+    monkeypatch.setattr(settings, "cache_breaker_cooldown_seconds", 0.05)
+    monkeypatch.setattr(cache, "_client", redis)
+    monkeypatch.setattr(cache, "_breaker", cache._CircuitBreaker())
+
+    assert cache.cache_get("cache:test:key") is None
+    cache.bump_portfolio_generation(1)
+    assert cache._breaker.is_open
+    calls = redis.calls
+    # Open: reads fall back to the local tier and generations without touching Redis.
+    assert cache.portfolio_generation(1) == "l1"
+    assert cache.cache_get_or_compute("cache:test:key", lambda: {"a": 1}) == {"a": 1}
+    assert redis.calls == calls
+
+    redis.down = False
+    deadline = time.monotonic() + 2
+    while cache._breaker.is_open and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not cache._breaker.is_open
+    # The bump made while Redis was down reached it once the probe succeeded.
+    assert redis.data["cache:portfolio:1:gen"] == b"1"
+    assert cache.portfolio_generation(1) == "g1"
@@ -0,0 +1,70 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.cash_transaction import CashTransaction
+from app.services.cash_ledger_service import get_cash_balance, get_cash_balance_series, get_portfolio_cash_balance
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post
+
+
+def _ledger_balance(db, account_id: int, on) -> Decimal:
+    total = db.execute(
+        select(func.sum(CashTransaction.amount)).where(
+            CashTransaction.account_id == account_id, CashTransaction.date <= on
+        )
+    ).scalar()
+    return Decimal(str(total or 0))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_running_balances_follow_every_cash_write(client, db, seed):
+    rnd = random.Random(seed)
+    portfolio, account = api_portfolio(client, cash="1000000")
+    second = post(client, "/accounts", portfolio_id=portfolio["id"], name="Bank", currency="USD")
+    asset = api_asset(client, "AAA")
+
+    def day():
+        return START + timedelta(days=rnd.randint(1, 120))
+
+    txn_ids, trade_ids = [], []
+    for _ in range(40):
+        target = rnd.choice([account, second])
+        kind = rnd.random()
+        if kind < 0.4:
+            txn = post(
+                client,
+                "/cash-transactions",
+                portfolio_id=portfolio["id"],
+                account_id=target["id"],
+                date=day().isoformat(),
+                type=rnd.choice(["DEPOSIT", "WITHDRAW", "INTEREST"]),
+                amount=str(rnd.randint(1, 500)),
+            )
+            txn_ids.append(txn["id"])
+        elif kind < 0.6:
+            trade_ids.append(api_trade(client, portfolio, account, asset, day(), "BUY", rnd.randint(1, 5), 10)["id"])
+        elif kind < 0.7 and txn_ids:
+            changes = {"amount": str(rnd.randint(1, 500))}
+            assert client.put(f"{API}/cash-transactions/{rnd.choice(txn_ids)}", json=changes).status_code == 200
+        elif kind < 0.8 and trade_ids:
+            # Moving a BUY moves its TRADE_EXPENSE between days.
+            changes = {"trade_date": day().isoformat(), "quantity": str(rnd.randint(1, 5))}
+            assert client.put(f"{API}/trades/{rnd.choice(trade_ids)}", json=changes).status_code == 200
+        elif txn_ids:
+            assert client.delete(f"{API}/cash-transactions/{txn_ids.pop()}").status_code == 204
+        elif trade_ids:
+            assert client.delete(f"{API}/trades/{trade_ids.pop()}").status_code == 204
+
+    for offset in range(0, 125, 3):
+        on = START + timedelta(days=offset)
+        expected = [_ledger_balance(db, acc["id"], on) for acc in (account, second)]
+        assert [get_cash_balance(db, acc["id"], on) for acc in (account, second)] == expected
+        assert get_portfolio_cash_balance(db, portfolio["id"], on) == sum(expected)
+
+    cuts = [START + timedelta(days=offset) for offset in range(0, 125, 7)]
+    expected_series = [(cut, _ledger_balance(db, second["id"], cut)) for cut in cuts]
+    assert get_cash_balance_series(db, second["id"], cuts) == expected_series
+
@@ -0,0 +1,158 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.models.price_history import PriceHistory
+from app.models.tax_lot import TaxLot
+from app.services.adjustment_service import get_adjustment_factors
+from app.services.cash_ledger_service import get_cash_balance
+from app.services.tax_lot_service import rebuild_asset_tax_lots
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post
+
+
+def _positions(client, portfolio) -> list[tuple]:
+    on = (START + timedelta(days=60)).isoformat()
+    response = client.get(f"{API}/reports/positions", params={"portfolio_id": portfolio["id"], "as_of": on})
+    return [(p["asset_id"], Decimal(p["shares_held"]), Decimal(p["cost_basis"])) for p in response.json()]
+
+
+def _lots(db, asset) -> list[tuple]:
+    db.expire_all()
+    lots = db.execute(
+        select(TaxLot).where(TaxLot.asset_id == asset["id"]).order_by(TaxLot.lot_date, TaxLot.source_id)
+    ).scalars()
+    return [(lot.lot_date, lot.remaining_shares, lot.total_cost, lot.source) for lot in lots]
+
+
+def test_rewriting_history_keeps_positions_and_lots(client, db):
+    portfolio, account = api_portfolio(client)
+    other, other_account = api_portfolio(client, "TWD")
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 100)
+    api_trade(client, other, other_account, asset, START + timedelta(days=6), "BUY", 3, 90)
+    post(
+        client,
+        "/cash-transactions",
+        portfolio_id=portfolio["id"],
+        account_id=account["id"],
+        asset_id=asset["id"],
+        date=(START + timedelta(days=8)).isoformat(),
+        type="DIVIDEND_STOCK",
+        amount="0",
+        shares="1",
+    )
+    split = post(
+        client,
+        "/corporate-actions",
+        asset_id=asset["id"],
+        date=(START + timedelta(days=10)).isoformat(),
+        type="SPLIT",
+        numerator=2,
+        denominator=1,
+    )
+    api_trade(client, portfolio, account, asset, START + timedelta(days=20), "SELL", 15, 60)
+    api_trade(client, portfolio, account, asset, START + timedelta(days=25), "BUY", 2, 55)
+
+    positions = {p["id"]: _positions(client, p) for p in (portfolio, other)}
+    assert positions[portfolio["id"]][0][1] == Decimal("9")
+    # Creating an action leaves stored lots as they were; bring every portfolio's up to date.
+    rebuild_asset_tax_lots(db, asset["id"])
+    db.commit()
+    lots = _lots(db, asset)
+
+    response = client.post(f"{API}/corporate-actions/{split['id']}/process", params={"rewrite_history": True})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["history_rewritten"] is True
+    assert result["rows_updated"]["trades"] == 2
+    assert result["rows_updated"]["stock_dividends"] == 1
+
+    assert {p["id"]: _positions(client, p) for p in (portfolio, other)} == positions
+    assert _lots(db, asset) == lots
+
+
+def test_processing_a_split_by_default_only_marks_it_processed(client, db):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    trade = api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 100)
+    split = post(
+        client,
+        "/corporate-actions",
+        asset_id=asset["id"],
+        date=(START + timedelta(days=10)).isoformat(),
+        type="SPLIT",
+        numerator=2,
+        denominator=1,
+    )
+    positions = _positions(client, portfolio)
+    assert positions == [(asset["id"], Decimal("20"), Decimal("1000"))]
+
+    response = client.post(f"{API}/corporate-actions/{split['id']}/process")
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["history_rewritten"] is False
+    assert result["rows_updated"] == {} and result["trades_created"] == 0
+
+    # The trade keeps its raw quantity; the replay and the factor series still apply the split.
+    trades = client.get(f"{API}/trades", params={"portfolio_id": portfolio["id"]}).json()
+    assert [(t["id"], Decimal(t["quantity"])) for t in trades] == [(trade["id"], Decimal("10"))]
+    assert get_adjustment_factors(db, asset["id"]).latest == Decimal("2")
+    assert _positions(client, portfolio) == positions
+    assert client.get(f"{API}/corporate-actions/{split['id']}").json()["processed_at"] is not None
+    assert client.post(f"{API}/corporate-actions/{split['id']}/process").status_code == 400
+
+
+def test_drip_batch_books_what_one_by_one_processing_would(client, db):
+    first, first_account = api_portfolio(client, cash="1000")
+    second, second_account = api_portfolio(client, "TWD", cash="1")
+    asset = api_asset(client, "AAA")
+    db.add(PriceHistory(asset_id=asset["id"], date=START, close=Decimal("9"), currency="USD"))
+    db.commit()
+
+    def dividend(portfolio, account, day: int, amount: str, withholding: str = "0") -> None:
+        post(
+            client,
+            "/cash-transactions",
+            portfolio_id=portfolio["id"],
+            account_id=account["id"],
+            asset_id=asset["id"],
+            date=(START + timedelta(days=day)).isoformat(),
+            type="DIVIDEND_CASH",
+            amount=amount,
+            withholding_tax=withholding,
+        )
+
+    def drip(day: int) -> dict:
+        on = (START + timedelta(days=day)).isoformat()
+        return post(client, "/corporate-actions", asset_id=asset["id"], date=on, type="DRIP", numerator=1, denominator=1)
+
+    dividend(first, first_account, 10, "50", "5")
+    dividend(second, second_account, 10, "27")
+    first_drip = drip(10)
+    post(
+        client,
+        "/cash-transactions",
+        portfolio_id=second["id"],
+        account_id=second_account["id"],
+        date=(START + timedelta(days=15)).isoformat(),
+        type="WITHDRAW",
+        amount="20",
+    )
+    # 1 + 27 - 20 + 27 leaves 35 on day 20, but the day-10 reinvestment already spent 27.
+    dividend(second, second_account, 20, "27")
+    second_drip = drip(20)
+
+    response = client.post(f"{API}/corporate-actions/drip/process")
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["processed"] == [first_drip["id"]]
+    assert result["trades_created"] == 2
+    assert result["errors"] == [{"action_id": second_drip["id"], "error": "Insufficient cash balance for DRIP"}]
+
+    shares = {p["id"]: _positions(client, p)[0][1] for p in (first, second)}
+    assert shares == {first["id"]: Decimal("5"), second["id"]: Decimal("3")}
+    on = START + timedelta(days=10)
+    # The dividend is booked gross; only the 45 net of withholding is reinvested.
+    assert get_cash_balance(db, first_account["id"], on) == Decimal("1005")
+    assert get_cash_balance(db, second_account["id"], on) == Decimal("1")
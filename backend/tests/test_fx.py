@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app.db.session import SessionLocal
+from app.models.fx_rate import FXRate
+from app.models.price_history import PriceHistory
+from app.services.fx_service import FxRateIndex, get_fx_index
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post
+
+
+def test_index_resolves_direct_inverse_and_triangulated_rates():
+    index = FxRateIndex(
+        [
+            (date(2024, 1, 1), "USD", "TWD", Decimal("30")),
+            (date(2024, 1, 1), "EUR", "USD", Decimal("1.1")),
+            (date(2024, 2, 1), "USD", "TWD", Decimal("32")),
+        ]
+    )
+    assert index.rate("USD", "TWD", date(2024, 1, 31)) == Decimal("30")
+    assert index.rate("USD", "TWD", date(2024, 2, 1)) == Decimal("32")
+    assert index.rate("TWD", "USD", date(2024, 2, 1)) == Decimal("1") / Decimal("32")
+    assert index.rate("EUR", "TWD", date(2024, 2, 1)) == Decimal("1.1") * Decimal("32")
+    assert index.rate("USD", "TWD", date(2023, 12, 31)) is None
+    assert index.rate("JPY", "JPY", date(2024, 1, 1)) == Decimal("1")
+
+
+def test_index_is_memoized_per_session_only(db):
+    db.add(FXRate(date=date(2024, 1, 1), from_currency="USD", to_currency="TWD", rate=Decimal("30")))
+    db.commit()
+    first = get_fx_index(db, {"USD", "TWD"})
+    assert get_fx_index(db, {"TWD", "USD"}) is first
+
+    # A write made through another session (another worker) is seen by the next session.
+    other = SessionLocal()
+    try:
+        other.add(FXRate(date=date(2024, 2, 1), from_currency="USD", to_currency="TWD", rate=Decimal("31")))
+        other.commit()
+    finally:
+        other.close()
+    fresh = SessionLocal()
+    try:
+        assert get_fx_index(fresh, {"USD", "TWD"}).rate("USD", "TWD", date(2024, 2, 1)) == Decimal("31")
+    finally:
+        fresh.close()
+
+
+def test_dashboard_totals_convert_each_base_currency(client):
+    api_portfolio(client, "USD", cash="1000")
+    api_portfolio(client, "TWD", cash="500")
+    api_portfolio(client, "JPY", cash="7")
+    post(client, "/fx-rates", date=START.isoformat(), from_currency="USD", to_currency="TWD", rate="30")
+
+    as_of = (START + timedelta(days=1)).isoformat()
+    twd = client.get(f"{API}/reports/dashboard", params={"as_of": as_of}).json()
+    assert twd["currency"] == "TWD"
+    usd_portfolio, twd_portfolio, jpy_portfolio = twd["portfolios"]
+    # Every factory account holds USD; the TWD portfolio's 500 USD are 15000 TWD.
+    assert Decimal(twd_portfolio["cash_balance"]) == Decimal("15000")
+    assert Decimal(twd["cash_balance"]) == Decimal("45000")
+    assert twd["unconverted_portfolio_ids"] == [jpy_portfolio["portfolio_id"]]
+    assert len(jpy_portfolio["unconverted_account_ids"]) == 1
+
+    usd = client.get(f"{API}/reports/dashboard", params={"as_of": as_of, "currency": "USD"}).json()
+    assert Decimal(usd["total_net_worth"]) == Decimal("1500")
+
+
+def test_dashboard_converts_foreign_positions_and_accounts_into_the_base_currency(client, db):
+    portfolio, account = api_portfolio(client, "TWD")
+    bank = post(client, "/accounts", portfolio_id=portfolio["id"], name="Bank", currency="TWD")
+    post(
+        client,
+        "/cash-transactions",
+        portfolio_id=portfolio["id"],
+        account_id=bank["id"],
+        date=START.isoformat(),
+        type="DEPOSIT",
+        amount="1000",
+    )
+    usd_asset, eur_asset = api_asset(client, "AAA"), api_asset(client, "EEE", currency="EUR")
+    day1, day2 = START + timedelta(days=1), START + timedelta(days=2)
+    for asset in (usd_asset, eur_asset):
+        for on, close in ((day1, 12), (day2, 13)):
+            db.add(PriceHistory(asset_id=asset["id"], date=on, close=Decimal(close), currency=asset["currency"]))
+    db.commit()
+    post(client, "/fx-rates", date=START.isoformat(), from_currency="USD", to_currency="TWD", rate="30")
+    post(client, "/fx-rates", date=day2.isoformat(), from_currency="USD", to_currency="TWD", rate="31")
+    api_trade(client, portfolio, account, usd_asset, day1, "BUY", 10, 10)
+    # No EUR rate: the EUR position cannot be valued in TWD.
+    api_trade(client, portfolio, account, eur_asset, day1, "BUY", 1, 5, fx_rate="1.1")
+    post(
+        client,
+        "/cash-transactions",
+        portfolio_id=portfolio["id"],
+        account_id=account["id"],
+        asset_id=usd_asset["id"],
+        date=day2.isoformat(),
+        type="DIVIDEND_CASH",
+        amount="10",
+    )
+
+    report = client.get(f"{API}/reports/dashboard", params={"as_of": day2.isoformat()}).json()
+    item = report["portfolios"][0]
+    assert Decimal(item["market_value"]) == 10 * 13 * 31
+    assert Decimal(item["previous_market_value"]) == 10 * 12 * 30
+    assert Decimal(item["cash_balance"]) == (Decimal("100000") - 100 - Decimal("5.5") + 10) * 31 + 1000
+    # Unrealized (130 - 100) USD and the 10 USD dividend, both at 31.
+    assert Decimal(item["total_pnl"]) == (30 + 10) * 31
+    assert item["unconverted_asset_ids"] == [eur_asset["id"]]
+    assert item["unconverted_account_ids"] == []
+    assert Decimal(report["total_net_worth"]) == Decimal(item["market_value"]) + Decimal(item["cash_balance"])
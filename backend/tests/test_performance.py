@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.models.price_history import PriceHistory
+from app.services.performance_service import time_weighted_returns, xirr
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post
+
+
+def test_twr_ignores_flows_and_xirr_solves_known_rates():
+    # 100 grows 10%, then a deposit of 50 lands before a flat day and a 10% drop.
+    values = np.array([100.0, 110.0, 160.0, 144.0])
+    flows = np.array([0.0, 0.0, 50.0, 0.0])
+    returns = time_weighted_returns(values, flows)
+    assert returns == pytest.approx([0.1, 0.0, -0.1])
+
+    assert xirr(np.array([-100.0, 110.0]), np.array([0.0, 1.0])) == pytest.approx(0.1)
+    # -100 (1 + r)^2 - 100 (1 + r) + 230 = 0
+    two_years = xirr(np.array([-100.0, -100.0, 230.0]), np.array([0.0, 1.0, 2.0]))
+    assert two_years == pytest.approx((np.sqrt(102000.0) - 100) / 200 - 1)
+    assert xirr(np.array([100.0, 10.0]), np.array([0.0, 1.0])) is None
+
+
+def test_sale_proceeds_are_converted_into_the_settlement_currency(client):
+    portfolio, account = api_portfolio(client, cash="1000")
+    asset = api_asset(client, "EEE", currency="EUR")
+    fx = {"asset_currency": "EUR", "settlement_currency": "USD", "fx_rate": "1.1"}
+    api_trade(client, portfolio, account, asset, START + timedelta(days=1), "BUY", 10, 10, **fx)
+    api_trade(client, portfolio, account, asset, START + timedelta(days=2), "SELL", 10, 12, **fx)
+
+    report = client.get(
+        f"{API}/reports/performance",
+        params={
+            "portfolio_id": portfolio["id"],
+            "from": START.isoformat(),
+            "to": (START + timedelta(days=3)).isoformat(),
+        },
+    ).json()
+    # 1000 - 10 * 10 * 1.1 + 10 * 12 * 1.1
+    assert report["end_value"] == pytest.approx(1022.0)
+
+
+def test_values_and_flows_are_converted_into_the_base_currency(client, db):
+    portfolio, account = api_portfolio(client, "TWD", cash="1000")
+    asset = api_asset(client, "AAA")
+    for offset, close in ((1, 10), (3, 12)):
+        db.add(PriceHistory(asset_id=asset["id"], date=START + timedelta(days=offset), close=close, currency="USD"))
+    db.commit()
+    for offset, rate in ((0, "30"), (3, "32")):
+        on = (START + timedelta(days=offset)).isoformat()
+        post(client, "/fx-rates", date=on, from_currency="USD", to_currency="TWD", rate=rate)
+    api_trade(client, portfolio, account, asset, START + timedelta(days=1), "BUY", 10, 10)
+
+    params = {"portfolio_id": portfolio["id"], "from": START.isoformat(), "to": (START + timedelta(days=4)).isoformat()}
+    report = client.get(f"{API}/reports/performance", params=params).json()
+    assert report["net_flows"] == pytest.approx(1000 * 30)
+    assert report["end_value"] == pytest.approx((900 + 10 * 12) * 32)
+    # Flat in USD until day 3, when both the close and the rate move.
+    assert report["twr"] == pytest.approx((900 + 10 * 12) * 32 / 30000 - 1)
+
+    other, other_account = api_portfolio(client, "JPY")
+    api_trade(client, other, other_account, asset, START + timedelta(days=1), "BUY", 1, 10)
+    response = client.get(f"{API}/reports/performance", params={**params, "portfolio_id": other["id"]})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("No FX rate from USD to JPY on ")
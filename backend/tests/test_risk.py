@@ -0,0 +1,81 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app.models.price_history import PriceHistory
+from app.services.risk_service import _pairwise_covariance, _rolling_std, compute_risk
+from tests.factories import START, api_asset, api_portfolio, api_trade, post
+
+
+def test_pairwise_covariance_matches_np_cov_over_common_days():
+    rnd = np.random.default_rng(7)
+    returns = rnd.normal(0.0, 0.02, size=(120, 4))
+    valid = rnd.random((120, 4)) > 0.2
+    valid[:100, 3] = False  # listed late: only a few returns
+
+    cov, corr = _pairwise_covariance(returns, valid)
+    for i in range(4):
+        for j in range(4):
+            both = valid[:, i] & valid[:, j]
+            pair = np.cov(returns[both, i], returns[both, j])
+            assert cov[i, j] == pytest.approx(pair[0, 1], rel=1e-10)
+            assert corr[i, j] == pytest.approx(pair[0, 1] / np.sqrt(pair[0, 0] * pair[1, 1]), rel=1e-10)
+
+    valid[:, 2] = False
+    cov, corr = _pairwise_covariance(returns, valid)
+    assert np.isnan(cov[2]).all() and np.isnan(corr[:, 2]).all()
+
+
+def test_rolling_std_needs_a_full_active_window():
+    values = np.random.default_rng(3).normal(size=40)
+    active = np.ones(40, dtype=bool)
+    active[15] = False
+
+    rolling = _rolling_std(values, active, 10)
+    expected = np.array(
+        [np.nan if end < 9 or 15 <= end < 25 else values[end - 9 : end + 1].std(ddof=1) for end in range(40)]
+    )
+    np.testing.assert_allclose(rolling, expected, rtol=1e-10)
+
+
+def test_a_split_is_not_a_price_drop(client, db):
+    split_portfolio, split_account = api_portfolio(client, "USD")
+    plain_portfolio, plain_account = api_portfolio(client, "TWD")
+    split_asset, plain_asset = api_asset(client, "SPL"), api_asset(client, "PLN")
+    closes = [100, 104, 99, 108, 112, 95, 101, 118, 121, 117]
+    for offset, close in enumerate(closes):
+        on = START + timedelta(days=offset)
+        db.add(PriceHistory(asset_id=plain_asset["id"], date=on, close=Decimal(close), currency="USD"))
+        # The split asset trades at half the price from day 5 on.
+        db.add(
+            PriceHistory(
+                asset_id=split_asset["id"], date=on, close=Decimal(close) / (2 if offset >= 5 else 1), currency="USD"
+            )
+        )
+    db.commit()
+    post(
+        client,
+        "/corporate-actions",
+        asset_id=split_asset["id"],
+        date=(START + timedelta(days=5)).isoformat(),
+        type="SPLIT",
+        numerator=2,
+        denominator=1,
+    )
+    # The plain portfolio is based in TWD; a flat rate keeps both valuations comparable.
+    post(client, "/fx-rates", date=START.isoformat(), from_currency="USD", to_currency="TWD", rate="1")
+    api_trade(client, split_portfolio, split_account, split_asset, START, "BUY", 100, 100)
+    api_trade(client, plain_portfolio, plain_account, plain_asset, START, "BUY", 100, 100)
+
+    end = START + timedelta(days=len(closes) - 1)
+    split = compute_risk(db, split_portfolio["id"], START, end, window=3)
+    plain = compute_risk(db, plain_portfolio["id"], START, end, window=3)
+    for key in ("volatility", "max_drawdown", "sharpe", "sortino"):
+        assert split[key] == pytest.approx(plain[key])
+    assert split["holdings"][0]["volatility"] == pytest.approx(plain["holdings"][0]["volatility"])
+
+    # Deepest fall of the closes: 112 on day 4 to 95 on day 5, diluted by the cash left over.
+    assert plain["max_drawdown_peak"] == START + timedelta(days=4)
+    assert plain["max_drawdown_trough"] == START + timedelta(days=5)
@@ -0,0 +1,143 @@
+import random
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.models.share_balance import ShareBalance
+from app.services.share_index_service import available_shares, rebuild_share_index
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post
+from tests.legacy import sell_checks as legacy_sell_checks
+
+HORIZON = 130
+
+
+def _daily_units(db, portfolio_id: int, asset_id: int) -> list[Decimal]:
+    """Indexed units at the end of every day; rows left behind by edits may repeat a balance."""
+    rows = db.execute(
+        select(ShareBalance.date, ShareBalance.units)
+        .where(ShareBalance.portfolio_id == portfolio_id, ShareBalance.asset_id == asset_id)
+        .order_by(ShareBalance.date)
+    ).all()
+    units, idx, series = Decimal("0"), 0, []
+    for offset in range(HORIZON + 1):
+        on = START + timedelta(days=offset)
+        while idx < len(rows) and rows[idx][0] <= on:
+            units = rows[idx][1]
+            idx += 1
+        series.append(units)
+    return series
+
+
+def _expected_available(balances: list[Decimal], offset: int, factor=lambda offset: Decimal("1")) -> Decimal:
+    """Lowest replayed balance from day ``offset`` onwards, each rescaled to that day's share units."""
+    lowest = min(balances[later] / factor(later) for later in range(offset, len(balances)))
+    return (lowest * factor(offset)).quantize(Decimal("0.000001"), ROUND_HALF_UP)
+
+
+def random_share_writes(client, rnd: random.Random, portfolio, account, asset) -> None:
+    """Buys, sells, stock dividends, edits and deletes in random date order; rejected sells are skipped."""
+
+    def day():
+        return START + timedelta(days=rnd.randint(1, HORIZON - 10))
+
+    trade_ids = []
+    for _ in range(60):
+        kind = rnd.random()
+        if kind < 0.35:
+            trade_ids.append(api_trade(client, portfolio, account, asset, day(), "BUY", rnd.randint(1, 20), 10)["id"])
+        elif kind < 0.65:
+            response = client.post(
+                f"{API}/trades",
+                json={
+                    "portfolio_id": portfolio["id"],
+                    "account_id": account["id"],
+                    "asset_id": asset["id"],
+                    "trade_date": day().isoformat(),
+                    "side": "SELL",
+                    "quantity": str(rnd.randint(1, 15)),
+                    "price": "10",
+                },
+            )
+            assert response.status_code in (201, 400), response.text
+            if response.status_code == 201:
+                trade_ids.append(response.json()["id"])
+        elif kind < 0.75:
+            post(
+                client,
+                "/cash-transactions",
+                portfolio_id=portfolio["id"],
+                account_id=account["id"],
+                asset_id=asset["id"],
+                date=day().isoformat(),
+                type="DIVIDEND_STOCK",
+                amount="0",
+                shares=str(rnd.randint(1, 3)),
+            )
+        elif kind < 0.9 and trade_ids:
+            changes = {"trade_date": day().isoformat(), "quantity": str(rnd.randint(1, 10))}
+            response = client.put(f"{API}/trades/{rnd.choice(trade_ids)}", json=changes)
+            assert response.status_code in (200, 400), response.text
+        elif trade_ids:
+            response = client.delete(f"{API}/trades/{trade_ids.pop(rnd.randrange(len(trade_ids)))}")
+            assert response.status_code in (204, 400), response.text
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_share_index_matches_a_rebuild_and_the_replayed_balances(client, db, seed):
+    rnd = random.Random(seed)
+    portfolio, account = api_portfolio(client, cash="100000000")
+    asset = api_asset(client, "AAA")
+    random_share_writes(client, rnd, portfolio, account, asset)
+
+    maintained = _daily_units(db, portfolio["id"], asset["id"])
+    rebuild_share_index(db, asset["id"])
+    assert maintained == _daily_units(db, portfolio["id"], asset["id"])
+    db.rollback()
+
+    balances = [
+        legacy_sell_checks.available_shares(db, portfolio["id"], asset["id"], START + timedelta(days=offset))
+        for offset in range(HORIZON + 1)
+    ]
+    for offset in range(0, HORIZON, 4):
+        on = START + timedelta(days=offset)
+        assert available_shares(db, portfolio["id"], asset["id"], on) == _expected_available(balances, offset)
+
+
+@pytest.mark.parametrize("seed", [3, 4])
+def test_available_shares_rescale_across_unprocessed_splits(client, db, seed):
+    rnd = random.Random(seed)
+    portfolio, account = api_portfolio(client, cash="100000000")
+    asset = api_asset(client, "AAA")
+    # A 2-for-1 split, then a 1-for-2 reverse split.
+    splits = {40: (2, 1), 90: (1, 2)}
+    random_share_writes(client, rnd, portfolio, account, asset)
+    for offset, (numerator, denominator) in splits.items():
+        post(
+            client,
+            "/corporate-actions",
+            asset_id=asset["id"],
+            date=(START + timedelta(days=offset)).isoformat(),
+            type="SPLIT",
+            numerator=numerator,
+            denominator=denominator,
+        )
+    # Writes after the splits go through the factors when they update the index.
+    random_share_writes(client, rnd, portfolio, account, asset)
+
+    def factor(offset: int) -> Decimal:
+        result = Decimal("1")
+        for split_offset, (numerator, denominator) in splits.items():
+            if split_offset <= offset:
+                result = result * numerator / denominator
+        return result
+
+    balances = [
+        legacy_sell_checks.available_shares(db, portfolio["id"], asset["id"], START + timedelta(days=offset))
+        for offset in range(HORIZON + 1)
+    ]
+    for offset in range(0, HORIZON, 4):
+        on = START + timedelta(days=offset)
+        expected = _expected_available(balances, offset, factor)
+        assert available_shares(db, portfolio["id"], asset["id"], on) == expected
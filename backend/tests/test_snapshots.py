@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.models.position_snapshot import PositionSnapshot
+from app.services.position_service import _snapshot_rows
+from app.services.snapshot_invalidation import get_snapshot_watermark
+from app.services.snapshot_rematerializer import compact_old_snapshots, rematerialize_stale_snapshots
+from app.services.snapshot_service import (
+    backfill_dates,
+    backfill_snapshots,
+    create_daily_snapshots,
+    replay_portfolio_snapshots,
+    write_snapshots,
+)
+from tests.factories import API, START, api_asset, api_portfolio, api_trade
+
+
+def _snapshot_count(db, portfolio_id: int) -> int:
+    return db.execute(
+        select(func.count()).select_from(PositionSnapshot).where(PositionSnapshot.portfolio_id == portfolio_id)
+    ).scalar()
+
+
+def test_backfill_discards_a_replay_that_raced_a_ledger_write(client, db):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 10)
+
+    dates = backfill_dates(START, START + timedelta(days=60), "week")
+    states, watermark, revision = replay_portfolio_snapshots(db, portfolio["id"], dates)
+    db.rollback()
+    # No snapshot exists yet, so this backdated write leaves no watermark behind.
+    api_trade(client, portfolio, account, asset, START + timedelta(days=1), "BUY", 5, 10)
+
+    assert write_snapshots(db, portfolio["id"], states, watermark, revision) is None
+    db.commit()
+    assert _snapshot_count(db, portfolio["id"]) == 0
+
+    assert backfill_snapshots(db, portfolio["id"], dates)
+    assert [row.shares for row in _snapshot_rows(db, portfolio["id"], dates[-1])] == [15]
+
+
+def test_backfill_endpoint_queues_a_bounded_job(client, db):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 10)
+
+    too_long = client.post(
+        f"{API}/snapshots/backfill",
+        params={"from": START.isoformat(), "to": (START + timedelta(days=2000)).isoformat()},
+    )
+    assert too_long.status_code == 400
+
+    queued = client.post(
+        f"{API}/snapshots/backfill",
+        params={"from": START.isoformat(), "to": date(2020, 3, 31).isoformat(), "step": "month"},
+    )
+    assert queued.status_code == 202
+    assert queued.json() == {"portfolios": 1, "dates": 3}
+    # The test client runs background tasks before returning.
+    assert _snapshot_count(db, portfolio["id"]) > 0
+
+
+def test_retention_is_off_by_default(client, db, monkeypatch):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 10)
+    dates = backfill_dates(START, date(2020, 3, 31))
+    assert backfill_snapshots(db, portfolio["id"], dates)
+    db.commit()
+    stored = _snapshot_count(db, portfolio["id"])
+
+    assert compact_old_snapshots() == 0
+    assert _snapshot_count(db, portfolio["id"]) == stored
+
+    monkeypatch.setattr(settings, "snapshot_retention_days", 30)
+    assert compact_old_snapshots() > 0
+    db.expire_all()
+    assert _snapshot_count(db, portfolio["id"]) < stored
+    assert [row.shares for row in _snapshot_rows(db, portfolio["id"], date(2020, 2, 29))] == [10]
+
+
+def test_backdated_write_hides_stale_snapshots_until_they_are_rebuilt(client, db):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=5), "BUY", 10, 10)
+    assert backfill_snapshots(db, portfolio["id"], backfill_dates(START, START + timedelta(days=60)))
+    db.commit()
+    assert get_snapshot_watermark(db, portfolio["id"]) is None
+
+    api_trade(client, portfolio, account, asset, START + timedelta(days=2), "BUY", 5, 10)
+    db.expire_all()
+    # The first stored snapshot on or after the write; nothing is stored before the first buy.
+    assert get_snapshot_watermark(db, portfolio["id"])[0] == START + timedelta(days=5)
+    on = (START + timedelta(days=30)).isoformat()
+    positions = client.get(f"{API}/reports/positions", params={"portfolio_id": portfolio["id"], "as_of": on}).json()
+    assert [Decimal(p["shares_held"]) for p in positions] == [Decimal("15")]
+
+    assert rematerialize_stale_snapshots() > 0
+    db.expire_all()
+    assert get_snapshot_watermark(db, portfolio["id"]) is None
+    assert [row.shares for row in _snapshot_rows(db, portfolio["id"], START + timedelta(days=30))] == [15]
+
+
+def test_daily_snapshot_returns_every_position_between_keyframes(client, db):
+    portfolio, account = api_portfolio(client)
+    first, second = api_asset(client, "AAA"), api_asset(client, "BBB")
+    api_trade(client, portfolio, account, first, START + timedelta(days=1), "BUY", 10, 10)
+    api_trade(client, portfolio, account, second, START + timedelta(days=1), "BUY", 3, 20)
+    create_daily_snapshots(db, portfolio["id"], START + timedelta(days=2))
+    api_trade(client, portfolio, account, second, START + timedelta(days=3), "BUY", 2, 20)
+
+    # Day 4 is not a keyframe and only stores the changed asset, yet returns both.
+    rows = create_daily_snapshots(db, portfolio["id"], START + timedelta(days=4))
+    db.commit()
+    assert [(row.asset_id, row.shares) for row in rows] == [(first["id"], 10), (second["id"], 5)]
+    stored = db.execute(
+        select(PositionSnapshot.asset_id).where(PositionSnapshot.snapshot_date == START + timedelta(days=4))
+    ).scalars()
+    assert list(stored) == [second["id"]]
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app.models.price_history import PriceHistory
+from app.services.cash_ledger_service import get_cash_balance
+from tests.factories import API, START, api_asset, api_portfolio, api_trade, post
+
+
+def test_series_points_match_the_base_currency_positions_report(client, db):
+    portfolio, account = api_portfolio(client, "TWD")
+    usd_asset, twd_asset = api_asset(client, "AAA"), api_asset(client, "BBB", currency="TWD")
+    for offset in range(0, 40, 3):
+        on = START + timedelta(days=offset)
+        db.add(PriceHistory(asset_id=usd_asset["id"], date=on, close=Decimal(10 + offset % 7), currency="USD"))
+        db.add(PriceHistory(asset_id=twd_asset["id"], date=on, close=Decimal(300 + offset), currency="TWD"))
+    db.commit()
+    for offset, rate in ((0, "30"), (12, "31"), (25, "29.5")):
+        on = (START + timedelta(days=offset)).isoformat()
+        post(client, "/fx-rates", date=on, from_currency="USD", to_currency="TWD", rate=rate)
+    api_trade(client, portfolio, account, usd_asset, START + timedelta(days=2), "BUY", 10, 10)
+    api_trade(client, portfolio, account, twd_asset, START + timedelta(days=9), "BUY", 4, 300, fx_rate="0.033")
+    api_trade(client, portfolio, account, usd_asset, START + timedelta(days=20), "SELL", 4, 14)
+
+    params = {
+        "portfolio_id": portfolio["id"],
+        "from": START.isoformat(),
+        "to": (START + timedelta(days=35)).isoformat(),
+        "step": "week",
+    }
+    response = client.get(f"{API}/reports/positions/timeseries", params=params)
+    assert response.status_code == 200, response.text
+    points = response.json()
+    assert len(points) == 6
+    for point in points:
+        positions = client.get(
+            f"{API}/reports/positions",
+            params={"portfolio_id": portfolio["id"], "as_of": point["date"], "in_base_currency": True},
+        ).json()
+        held = [p for p in positions if Decimal(p["shares_held"]) > 0]
+        assert point["currency"] == "TWD"
+        assert Decimal(point["market_value"]) == sum(Decimal(p["market_value_base"]) for p in held)
+        assert Decimal(point["cost_basis"]) == sum(
+            Decimal(p["cost_basis"]) * Decimal(p["fx_rate_used"]) for p in held
+        )
+        assert {h["asset_id"]: Decimal(h["shares"]) for h in point["holdings"]} == {
+            p["asset_id"]: Decimal(p["shares_held"]) for p in held
+        }
+        usd_twd = Decimal(next(p for p in held if p["asset_id"] == usd_asset["id"])["fx_rate_used"])
+        cash = get_cash_balance(db, account["id"], date.fromisoformat(point["date"]))
+        assert Decimal(point["cash_balance"]) == cash * usd_twd
+        assert point["unconverted_asset_ids"] == [] and point["unconverted_account_ids"] == []
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from tests.factories import API, START, api_asset, api_portfolio, api_trade
+
+
+def _bulk(client, portfolio, account, asset, *rows: str) -> dict:
+    header = "portfolio_id,account_id,asset_id,trade_date,side,quantity,price"
+    prefix = f"{portfolio['id']},{account['id']},{asset['id']},"
+    response = client.post(
+        f"{API}/trades/bulk",
+        content="\n".join([header, *(prefix + row for row in rows)]) + "\n",
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_imported_sell_cannot_uncover_a_later_sell(client):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=1), "BUY", 10, 10)
+    api_trade(client, portfolio, account, asset, START + timedelta(days=20), "SELL", 8, 10)
+
+    # 10 shares on day 5, but only 2 of them are not already sold on day 20.
+    day = (START + timedelta(days=5)).isoformat()
+    result = _bulk(client, portfolio, account, asset, f"{day},SELL,3,10", f"{day},SELL,2,10")
+    assert result["inserted"] == 1
+    assert result["errors"] == [{"row": 1, "error": "Sell quantity exceeds available shares"}]
+
+
+def test_imported_buys_fund_later_imported_sells(client):
+    portfolio, account = api_portfolio(client)
+    asset = api_asset(client, "AAA")
+    api_trade(client, portfolio, account, asset, START + timedelta(days=20), "BUY", 5, 10)
+
+    buy, sell = (START + timedelta(days=2)).isoformat(), (START + timedelta(days=3)).isoformat()
+    result = _bulk(client, portfolio, account, asset, f"{sell},SELL,4,10", f"{buy},BUY,4,10", f"{sell},SELL,1,10")
+    assert result["inserted"] == 2
+    assert result["errors"] == [{"row": 3, "error": "Sell quantity exceeds available shares"}]
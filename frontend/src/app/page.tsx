@@ -1,4 +1,7 @@
+"use client";
 
+import { useQuery } from "@tanstack/react-query";
+import { format, subYears } from "date-fns";
 import {
   Card,
   CardContent,
@@ -6,14 +9,26 @@ import {
   CardHeader,
   CardTitle,
 } from "@/components/ui/card";
-import { KPIData, NetWorthHistoryData, AllocationData, RecentActivityData } from "@/lib/mock-data";
+import { KPIData, AllocationData, RecentActivityData } from "@/lib/mock-data";
 import { StatCard } from "@/components/dashboard/StatCard";
 import { NetWorthChart } from "@/components/dashboard/NetWorthChart";
 import { AllocationChart } from "@/components/dashboard/AllocationChart";
 import { RecentActivity } from "@/components/dashboard/RecentActivity";
 import { DollarSign, Percent, TrendingUp, Wallet } from "lucide-react";
+import { getNetWorthHistory, getPortfolios } from "@/services/api";
 
 export default function DashboardPage() {
+  const today = new Date();
+  const from = format(subYears(today, 1), "yyyy-MM-dd");
+  const to = format(today, "yyyy-MM-dd");
+  const { data: portfolios } = useQuery({ queryKey: ["portfolios"], queryFn: getPortfolios });
+  const portfolio = portfolios?.[0];
+  const { data: netWorth = [] } = useQuery({
+    queryKey: ["net-worth", portfolio?.id, from, to],
+    queryFn: () => getNetWorthHistory(portfolio!.id, from, to, "month"),
+    enabled: portfolio != null,
+  });
+
   return (
     <div className="flex-1 space-y-4 p-8 pt-6">
       <div className="flex items-center justify-between space-y-2">
@@ -54,11 +69,13 @@ export default function DashboardPage() {
           <CardHeader>
             <CardTitle>Net Worth History</CardTitle>
             <CardDescription>
-              Your asset growth over time.
+              {portfolio
+                ? `${portfolio.name}: market value plus account cash, month-end over the last year.`
+                : "Your asset growth over time."}
             </CardDescription>
           </CardHeader>
           <CardContent className="pl-2">
-            <NetWorthChart data={NetWorthHistoryData} />
+            <NetWorthChart data={netWorth} />
           </CardContent>
         </Card>
         <Card className="col-span-3">
@@ -22,17 +22,6 @@ export const KPIData = {
   },
 };
 
-export const NetWorthHistoryData = [
-  { date: "Jan", value: 1000000 },
-  { date: "Feb", value: 1050000 },
-  { date: "Mar", value: 1020000 },
-  { date: "Apr", value: 1100000 },
-  { date: "May", value: 1150000 },
-  { date: "Jun", value: 1120000 },
-  { date: "Jul", value: 1200000 },
-  { date: "Aug", value: 1250000 },
-];
-
 export const AllocationData = [
   { name: "Stocks", value: 60, color: "#10b981" }, // profit color (emerald-500 approx)
   { name: "ETFs", value: 30, color: "#3b82f6" }, // blue-500
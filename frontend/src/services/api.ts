@@ -1,12 +1,17 @@
 import apiClient from "@/lib/api-client";
 import type {
+  Account,
   Asset,
+  CashBalancePoint,
   CashTransaction,
   CashTransactionCreate,
+  DashboardReport,
   DashboardStats,
-  PnLSummary,
+  NetWorthPoint,
   Portfolio,
   Position,
+  PositionSeriesPoint,
+  SeriesStep,
   Trade,
   TradeCreate,
 } from "@/types/api";
@@ -19,11 +24,6 @@ const toNumber = (value: string | null | undefined): number => {
   return Number.isFinite(parsed) ? parsed : 0;
 };
 
-const sumMarketValue = (positions: Position[]): number =>
-  positions.reduce((sum, position) => sum + toNumber(position.market_value), 0);
-
-const formatDate = (date: Date): string => date.toISOString().slice(0, 10);
-
 export async function getPortfolios(): Promise<Portfolio[]> {
   const { data } = await apiClient.get<Portfolio[]>("/portfolios");
   return data;
@@ -36,6 +36,40 @@ export async function getPortfolioPositions(portfolioId: number): Promise<Positi
   return data;
 }
 
+export async function getPositionTimeseries(
+  portfolioId: number,
+  from: string,
+  to: string,
+  step: SeriesStep = "day"
+): Promise<PositionSeriesPoint[]> {
+  const { data } = await apiClient.get<PositionSeriesPoint[]>("/reports/positions/timeseries", {
+    params: { portfolio_id: portfolioId, from, to, step },
+  });
+  return data;
+}
+
+export async function getAccounts(portfolioId?: number): Promise<Account[]> {
+  const { data } = await apiClient.get<Account[]>("/accounts", {
+    params: portfolioId != null ? { portfolio_id: portfolioId } : undefined,
+  });
+  return data;
+}
+
+// Market value plus account cash, both already in the portfolio's base currency.
+export async function getNetWorthHistory(
+  portfolioId: number,
+  from: string,
+  to: string,
+  step: SeriesStep = "month"
+): Promise<NetWorthPoint[]> {
+  const points = await getPositionTimeseries(portfolioId, from, to, step);
+  return points.map((point) => {
+    const marketValue = toNumber(point.market_value);
+    const cash = toNumber(point.cash_balance);
+    return { date: point.date, market_value: marketValue, cash, value: marketValue + cash };
+  });
+}
+
 export async function createTrade(payload: TradeCreate): Promise<Trade> {
   const { data } = await apiClient.post<Trade>("/trades", payload);
   return data;
@@ -53,6 +87,18 @@ export async function createCashTransaction(
   return data;
 }
 
+export async function getCashBalanceSeries(
+  accountId: number,
+  from: string,
+  to: string,
+  step: SeriesStep = "day"
+): Promise<{ date: string; balance: number }[]> {
+  const { data } = await apiClient.get<CashBalancePoint[]>("/reports/cash/balances", {
+    params: { account_id: accountId, from, to, step },
+  });
+  return data.map((point) => ({ date: point.date, balance: toNumber(point.balance) }));
+}
+
 export async function getAssets(symbol?: string): Promise<Asset[]> {
   const { data } = await apiClient.get<Asset[]>("/assets", {
     params: symbol ? { symbol } : undefined,
@@ -61,58 +107,12 @@ export async function getAssets(symbol?: string): Promise<Asset[]> {
 }
 
 export async function getDashboardStats(): Promise<DashboardStats> {
-  const portfolios = await getPortfolios();
-  if (!portfolios.length) {
-    return {
-      total_net_worth: 0,
-      day_change_amount: 0,
-      day_change_percent: 0,
-      total_pnl: 0,
-      cash_balance: 0,
-    };
-  }
-
-  const portfolioId = portfolios[0].id;
-  const today = new Date();
-  const yesterday = new Date(today);
-  yesterday.setDate(today.getDate() - 1);
-
-  const [positionsToday, positionsYesterday, cashTransactions, pnlSummaryResp] =
-    await Promise.all([
-      apiClient.get<Position[]>("/reports/positions", {
-        params: { portfolio_id: portfolioId, as_of: formatDate(today) },
-      }),
-      apiClient.get<Position[]>("/reports/positions", {
-        params: { portfolio_id: portfolioId, as_of: formatDate(yesterday) },
-      }),
-      apiClient.get<CashTransaction[]>("/cash-transactions", {
-        params: { portfolio_id: portfolioId },
-      }),
-      apiClient.get<PnLSummary>("/reports/pnl/summary", {
-        params: {
-          portfolio_id: portfolioId,
-          from: "1970-01-01",
-          to: formatDate(today),
-          as_of: formatDate(today),
-        },
-      }),
-    ]);
-
-  const marketValueToday = sumMarketValue(positionsToday.data);
-  const marketValueYesterday = sumMarketValue(positionsYesterday.data);
-  const cashBalance = cashTransactions.data.reduce(
-    (sum, txn) => sum + toNumber(txn.amount),
-    0
-  );
-  const dayChangeAmount = marketValueToday - marketValueYesterday;
-  const dayChangePercent =
-    marketValueYesterday === 0 ? 0 : (dayChangeAmount / marketValueYesterday) * 100;
-
+  const { data } = await apiClient.get<DashboardReport>("/reports/dashboard");
   return {
-    total_net_worth: marketValueToday + cashBalance,
-    day_change_amount: dayChangeAmount,
-    day_change_percent: dayChangePercent,
-    total_pnl: toNumber(pnlSummaryResp.data.total_return),
-    cash_balance: cashBalance,
+    total_net_worth: toNumber(data.total_net_worth),
+    day_change_amount: toNumber(data.day_change_amount),
+    day_change_percent: toNumber(data.day_change_percent),
+    total_pnl: toNumber(data.total_pnl),
+    cash_balance: toNumber(data.cash_balance),
   };
 }
@@ -31,6 +31,23 @@ export type Portfolio = {
   updated_at: string;
 };
 
+export type Account = {
+  id: number;
+  portfolio_id: number;
+  name: string;
+  currency: string;
+  note: string | null;
+  created_at: string;
+  updated_at: string;
+};
+
+export type NetWorthPoint = {
+  date: string;
+  market_value: number;
+  cash: number;
+  value: number;
+};
+
 export type PortfolioCreate = {
   name: string;
   base_currency?: string;
@@ -146,6 +163,33 @@ export type CashTransactionCreate = {
   note?: string | null;
 };
 
+export type SeriesStep = "day" | "week" | "month";
+
+export type PositionSeriesHolding = {
+  asset_id: number;
+  shares: DecimalString;
+  last_price: DecimalString | null;
+  market_value: DecimalString | null;
+  fx_rate_used: DecimalString | null;
+  market_value_base: DecimalString | null;
+};
+
+export type PositionSeriesPoint = {
+  date: string;
+  currency: string;
+  market_value: DecimalString;
+  cost_basis: DecimalString;
+  cash_balance: DecimalString;
+  unconverted_asset_ids: number[];
+  unconverted_account_ids: number[];
+  holdings: PositionSeriesHolding[];
+};
+
+export type CashBalancePoint = {
+  date: string;
+  balance: DecimalString;
+};
+
 export type PnLSummary = {
   realized_pnl: DecimalString;
   income_total: DecimalString;
@@ -157,6 +201,32 @@ export type PnLSummary = {
   invested_cashflow: DecimalString;
 };
 
+export type DashboardPortfolio = {
+  portfolio_id: number;
+  name: string;
+  base_currency: string;
+  market_value: DecimalString;
+  previous_market_value: DecimalString;
+  day_change_amount: DecimalString;
+  cash_balance: DecimalString;
+  total_pnl: DecimalString;
+  unconverted_asset_ids: number[];
+  unconverted_account_ids: number[];
+};
+
+export type DashboardReport = {
+  as_of: string;
+  currency: string;
+  total_net_worth: DecimalString;
+  market_value: DecimalString;
+  day_change_amount: DecimalString;
+  day_change_percent: DecimalString;
+  total_pnl: DecimalString;
+  cash_balance: DecimalString;
+  unconverted_portfolio_ids: number[];
+  portfolios: DashboardPortfolio[];
+};
+
 export type DashboardStats = {
   total_net_worth: number;
   day_change_amount: number;